@@ -1,21 +1,39 @@
 from flask import Flask
 from app.config import Config
 from app.utils.db import db
+from app.utils.migrate import init_cli
+from app.utils.db_profiles import configure_engine, engine_options, init_read_replica
+from app.services.entity_cache import init_entity_cache
 from app.routes.conversations import bp as conversations_bp
 from app.routes.users import bp as users_bp
 from app.routes.documents import bp as documents_bp
+from app.routes.metrics import bp as metrics_bp
+from app.utils.tracing import init_tracing, instrument_engine
 
-def create_app():
+def create_app(test_config=None):
     app = Flask(__name__)
     app.config.from_object(Config)
+    # overrides must be applied before db.init_app since the engine is built there
+    if test_config:
+        app.config.update(test_config)
+    # pool and connection settings follow the database backend unless set explicitly
+    app.config.setdefault('SQLALCHEMY_ENGINE_OPTIONS', engine_options(app.config['SQLALCHEMY_DATABASE_URI']))
     db.init_app(app)
+    init_read_replica(app)
+    init_entity_cache(app)
     
-    # regestering blueprints here since connexion swagger/schema.yml not working
+    # routes are plain blueprints, swagger/schema.yml documents them
     app.register_blueprint(conversations_bp, url_prefix='/api')
     app.register_blueprint(users_bp, url_prefix='/api')
     app.register_blueprint(documents_bp, url_prefix='/api')
+    app.register_blueprint(metrics_bp)
+    init_tracing(app)
+    init_cli(app)
 
+    # nothing here connects to the database or starts threads, so the app can be built
+    # before workers fork; the schema is managed by "flask migrate"
     with app.app_context():
-        db.create_all()
- 
+        configure_engine(db.engine)
+        instrument_engine(db.engine)
+
     return app
@@ -0,0 +1,128 @@
+"""
+ASGI entry point.
+
+The two LLM-bound endpoints (create conversation, add message) are served by coroutines
+so a worker is not held for the upstream round trip; every other route, and streaming
+requests, fall through to the Flask app mounted as WSGI.
+
+    uvicorn --factory app.asgi:create_asgi_app --workers 2
+"""
+import re
+
+from a2wsgi import WSGIMiddleware
+from starlette.requests import Request
+from starlette.responses import JSONResponse
+
+from app import create_app
+from app.services.provider_transport import close_async_transports
+from app.services.rate_limiter import RateLimitExceeded
+from app.utils.http import wants_event_stream
+from app.services.async_conversation_service import AsyncConversationService
+
+MESSAGES_PATH = re.compile(r'^/api/conversations/(?P<conversation_id>[^/]+)/messages/?$')
+
+
+class AsyncChatApp:
+    """Dispatches chat turns to async handlers and everything else to the WSGI app"""
+
+    def __init__(self, flask_app):
+        self.flask_app = flask_app
+        self.wsgi = WSGIMiddleware(flask_app)
+        self.service = AsyncConversationService(flask_app)
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            await self._lifespan(receive, send)
+            return
+
+        if scope['type'] == 'http' and scope['method'] == 'POST':
+            request = Request(scope, receive)
+            if not _wants_stream(request):
+                path = scope['path'].rstrip('/')
+                if path == '/api/conversations':
+                    response = await self.create_conversation(request)
+                    await response(scope, receive, send)
+                    return
+                match = MESSAGES_PATH.match(path)
+                if match:
+                    response = await self.add_message(request, match.group('conversation_id'))
+                    await response(scope, receive, send)
+                    return
+
+        await self.wsgi(scope, receive, send)
+
+    async def _lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                self.service.shutdown()
+                await close_async_transports()
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+    async def create_conversation(self, request: Request) -> JSONResponse:
+        """Create a new conversation with the first message"""
+        data = await _json_body(request)
+
+        if not data or 'user_id' not in data or 'message' not in data:
+            return JSONResponse({'error': 'Missing required fields: user_id and message'}, status_code=400)
+
+        user_id = data['user_id']
+        if not await self.service.user_exists(user_id):
+            return JSONResponse({'error': f'User with ID {user_id} not found'}, status_code=404)
+
+        try:
+            conversation = await self.service.create_conversation(
+                user_id=user_id,
+                first_message=data['message'],
+                mode=data.get('mode', 'open_chat'),
+                document_ids=data.get('document_ids', [])
+            )
+            return JSONResponse(conversation, status_code=201)
+        except RateLimitExceeded as e:
+            return _too_many_requests(e)
+        except Exception as e:
+            return JSONResponse({'error': str(e)}, status_code=500)
+
+    async def add_message(self, request: Request, conversation_id: str) -> JSONResponse:
+        """Add a new message to an existing conversation"""
+        data = await _json_body(request)
+
+        if not data or 'message' not in data:
+            return JSONResponse({'error': 'Missing required field: message'}, status_code=400)
+
+        try:
+            conversation = await self.service.add_message_to_conversation(
+                conversation_id=conversation_id,
+                user_message=data['message'],
+                view='delta' if request.query_params.get('view', '').lower() == 'delta' else 'full'
+            )
+            return JSONResponse(conversation, status_code=200)
+        except RateLimitExceeded as e:
+            return _too_many_requests(e)
+        except ValueError as e:
+            return JSONResponse({'error': str(e)}, status_code=404)
+        except Exception as e:
+            return JSONResponse({'error': str(e)}, status_code=500)
+
+
+def _too_many_requests(e: RateLimitExceeded) -> JSONResponse:
+    return JSONResponse({'error': str(e), 'scope': e.scope}, status_code=429,
+                        headers={'Retry-After': str(e.retry_after_seconds)})
+
+
+def _wants_stream(request: Request) -> bool:
+    return wants_event_stream(request.query_params.get('stream'), request.headers.get('accept'))
+
+
+async def _json_body(request: Request):
+    try:
+        return await request.json()
+    except ValueError:
+        return None
+
+
+def create_asgi_app(test_config=None):
+    return AsyncChatApp(create_app(test_config))
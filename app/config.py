@@ -8,6 +8,20 @@ class Config:
 
     SQLALCHEMY_DATABASE_URI = os.environ.get('DATABASE_URL') or 'sqlite:///botgpt.db'
     SQLALCHEMY_TRACK_MODIFICATIONS = False
+    DATABASE_REPLICA_URL = os.environ.get('DATABASE_REPLICA_URL')  # optional read replica for conversation reads
+
+    # sqlite profile (applied to every new connection)
+    SQLITE_PRAGMAS = os.environ.get('SQLITE_PRAGMAS', 'true').lower() in ('1', 'true', 'yes')
+    SQLITE_BUSY_TIMEOUT_MS = int(os.environ.get('SQLITE_BUSY_TIMEOUT_MS', 5000))
+    SQLITE_SYNCHRONOUS = os.environ.get('SQLITE_SYNCHRONOUS', 'NORMAL').upper()  # NORMAL is durable in WAL except on power loss
+    SQLITE_MMAP_SIZE = int(os.environ.get('SQLITE_MMAP_SIZE', 256 * 1024 * 1024))
+
+    # postgresql profile
+    DB_POOL_SIZE = int(os.environ.get('DB_POOL_SIZE', 10))
+    DB_MAX_OVERFLOW = int(os.environ.get('DB_MAX_OVERFLOW', 20))
+    DB_POOL_TIMEOUT = float(os.environ.get('DB_POOL_TIMEOUT', 30))  # seconds to wait for a free connection
+    DB_POOL_RECYCLE = int(os.environ.get('DB_POOL_RECYCLE', 1800))  # seconds, below typical server/proxy idle limits
+    DB_STATEMENT_TIMEOUT_MS = int(os.environ.get('DB_STATEMENT_TIMEOUT_MS', 30000))
 
     # LLM Configuration NEED CHANGES BELOW
     # LLM_PROVIDER = os.environ.get('LLM_PROVIDER', 'groq').lower()
@@ -15,14 +29,149 @@ class Config:
 
     GROQ_API_KEY = os.environ.get('GROQ_API_KEY')
     GROQ_MODEL = os.environ.get('GROQ_MODEL', 'llama-3.1-8b-instant')
+    GROQ_POOL_SIZE = int(os.environ.get('GROQ_POOL_SIZE', 20))
 
     # HuggingFace settings
     HUGGINGFACE_API_KEY = os.environ.get('HUGGINGFACE_API_KEY')
     HUGGINGFACE_MODEL = os.environ.get('HUGGINGFACE_MODEL', 'meta-llama/Meta-Llama-3-8B-Instruct')
+    HUGGINGFACE_POOL_SIZE = int(os.environ.get('HUGGINGFACE_POOL_SIZE', 10))
+    HUGGINGFACE_API_URL = os.environ.get('HUGGINGFACE_API_URL')  # self-hosted endpoint, defaults to the inference api
 
     # gemini settings
     GEMINI_API_KEY = os.environ.get('GEMINI_API_KEY')
     GEMINI_MODEL = os.environ.get('GEMINI_MODEL', 'gemini-1.5-flash')
+    GEMINI_POOL_SIZE = int(os.environ.get('GEMINI_POOL_SIZE', 10))
+
+    # provider http transport (timeouts in seconds)
+    LLM_CONNECT_TIMEOUT = float(os.environ.get('LLM_CONNECT_TIMEOUT', 5))
+    LLM_READ_TIMEOUT = float(os.environ.get('LLM_READ_TIMEOUT', 60))
+    LLM_MAX_RETRIES = int(os.environ.get('LLM_MAX_RETRIES', 3))
+    LLM_BACKOFF_BASE = float(os.environ.get('LLM_BACKOFF_BASE', 0.5))
+    LLM_BACKOFF_MAX = float(os.environ.get('LLM_BACKOFF_MAX', 8))
+    LLM_RETRY_AFTER_MAX = float(os.environ.get('LLM_RETRY_AFTER_MAX', 30))  # longer Retry-After is not waited for
+    LLM_CIRCUIT_FAILURE_THRESHOLD = int(os.environ.get('LLM_CIRCUIT_FAILURE_THRESHOLD', 5))
+    LLM_CIRCUIT_RESET_SECONDS = float(os.environ.get('LLM_CIRCUIT_RESET_SECONDS', 30))
+
+    # prompt context window (token estimates)
+    CONTEXT_TOKEN_BUDGET = int(os.environ.get('CONTEXT_TOKEN_BUDGET', 3000))
+    CONTEXT_PAGE_SIZE = int(os.environ.get('CONTEXT_PAGE_SIZE', 20))  # messages fetched per query, newest first
+    SUMMARY_TOKEN_BUDGET = int(os.environ.get('SUMMARY_TOKEN_BUDGET', 400))
+    SUMMARY_LINE_CHARS = int(os.environ.get('SUMMARY_LINE_CHARS', 160))
+
+    # retrieval (RAG)
+    VECTOR_STORE_DIR = os.environ.get('VECTOR_STORE_DIR', os.path.join(os.getcwd(), 'instance', 'vectors'))
+    EMBEDDER = os.environ.get('EMBEDDER', 'hashing').lower()
+    EMBEDDING_DIM = int(os.environ.get('EMBEDDING_DIM', 256))
+    CHUNK_WORDS = int(os.environ.get('CHUNK_WORDS', 120))
+    CHUNK_OVERLAP = int(os.environ.get('CHUNK_OVERLAP', 20))
+    RETRIEVAL_TOP_K = int(os.environ.get('RETRIEVAL_TOP_K', 4))
+    # per-conversation prompt state: a follow-up this similar (cosine) to the question that
+    # retrieved the current context reuses it, keeping the prompt prefix stable across turns
+    PROMPT_STATE_ENABLED = os.environ.get('PROMPT_STATE_ENABLED', 'true').lower() in ('1', 'true', 'yes')
+    PROMPT_STATE_REUSE_SIMILARITY = float(os.environ.get('PROMPT_STATE_REUSE_SIMILARITY', 0.5))
+    PROMPT_STATE_MAX_ENTRIES = int(os.environ.get('PROMPT_STATE_MAX_ENTRIES', 2048))
+    PROMPT_STATE_TTL = float(os.environ.get('PROMPT_STATE_TTL', 1800))  # seconds
+
+    # document ingestion
+    INGEST_MAX_DOCUMENTS = int(os.environ.get('INGEST_MAX_DOCUMENTS', 4))  # documents ingested concurrently
+    # embedding worker processes per web process (gunicorn runs several of those), 0 embeds in-thread
+    INGEST_PROCESSES = int(os.environ.get('INGEST_PROCESSES', min(2, os.cpu_count() or 1)))
+    INGEST_READ_BYTES = int(os.environ.get('INGEST_READ_BYTES', 64 * 1024))
+    INGEST_BATCH_CHUNKS = int(os.environ.get('INGEST_BATCH_CHUNKS', 64))
+    INGEST_MAX_INFLIGHT_BATCHES = int(os.environ.get('INGEST_MAX_INFLIGHT_BATCHES', 4))  # per document, bounds memory
+
+    # deletion: soft delete on request, rows purged in the background this many per
+    # transaction with a pause in between so live writers are not starved
+    PURGE_BATCH_SIZE = int(os.environ.get('PURGE_BATCH_SIZE', 500))
+    PURGE_PAUSE_MS = float(os.environ.get('PURGE_PAUSE_MS', 20))
+
+    # message storage: bodies from this size up are compressed ("auto" picks zstd when the
+    # zstandard package is installed, zlib otherwise; "none" stores them as they are)
+    MESSAGE_COMPRESSION = os.environ.get('MESSAGE_COMPRESSION', 'auto').lower()
+    MESSAGE_COMPRESSION_MIN_BYTES = int(os.environ.get('MESSAGE_COMPRESSION_MIN_BYTES', 512))
+    # archive tier: "flask archive" moves the messages of conversations idle this many days
+    # into one compressed file per conversation, reads serve them from there
+    ARCHIVE_DIR = os.environ.get('ARCHIVE_DIR', os.path.join(os.getcwd(), 'instance', 'archive'))
+    ARCHIVE_AFTER_DAYS = float(os.environ.get('ARCHIVE_AFTER_DAYS', 90))
+    ARCHIVE_BATCH_SIZE = int(os.environ.get('ARCHIVE_BATCH_SIZE', 100))
+
+    # async (ASGI) request path
+    LLM_ASYNC_POOL_SIZE = int(os.environ.get('LLM_ASYNC_POOL_SIZE', 200))  # upstream connections per event loop
+    DB_THREAD_POOL_SIZE = int(os.environ.get('DB_THREAD_POOL_SIZE', 8))  # threads running blocking DB work
+
+    # state shared between worker processes (redis url), unset uses an in-process stand-in
+    SHARED_STORE_URL = os.environ.get('SHARED_STORE_URL')
+
+    # completion cache, off by default since replies are served verbatim
+    RESPONSE_CACHE_ENABLED = os.environ.get('RESPONSE_CACHE_ENABLED', 'false').lower() in ('1', 'true', 'yes')
+    RESPONSE_CACHE_BACKEND = os.environ.get('RESPONSE_CACHE_BACKEND', 'memory').lower()  # "memory" or "shared"
+    RESPONSE_CACHE_MAX_ENTRIES = int(os.environ.get('RESPONSE_CACHE_MAX_ENTRIES', 1024))
+    RESPONSE_CACHE_TTL = float(os.environ.get('RESPONSE_CACHE_TTL', 3600))  # seconds
+    RESPONSE_CACHE_SEMANTIC = os.environ.get('RESPONSE_CACHE_SEMANTIC', 'false').lower() in ('1', 'true', 'yes')
+    RESPONSE_CACHE_SEMANTIC_THRESHOLD = float(os.environ.get('RESPONSE_CACHE_SEMANTIC_THRESHOLD', 0.95))
+
+    # concurrent identical prompts share one provider call: "local" (threads in a process),
+    # "shared" (also across processes through the shared store) or "off"
+    LLM_SINGLE_FLIGHT = os.environ.get('LLM_SINGLE_FLIGHT', 'local').lower()
+
+    # admission control in front of the LLM, a rate of 0 disables that limit
+    RATE_LIMIT_ENABLED = os.environ.get('RATE_LIMIT_ENABLED', 'true').lower() in ('1', 'true', 'yes')
+    RATE_LIMIT_BACKEND = os.environ.get('RATE_LIMIT_BACKEND', 'memory').lower()  # "memory" or "shared"
+    USER_REQUESTS_PER_MINUTE = float(os.environ.get('USER_REQUESTS_PER_MINUTE', 60))
+    USER_REQUEST_BURST = float(os.environ.get('USER_REQUEST_BURST', 20))
+    USER_TOKENS_PER_MINUTE = float(os.environ.get('USER_TOKENS_PER_MINUTE', 40000))  # also the burst
+    GLOBAL_REQUESTS_PER_SECOND = float(os.environ.get('GLOBAL_REQUESTS_PER_SECOND', 0))
+    GLOBAL_REQUEST_BURST = float(os.environ.get('GLOBAL_REQUEST_BURST', 100))
+    GLOBAL_TOKENS_PER_MINUTE = float(os.environ.get('GLOBAL_TOKENS_PER_MINUTE', 0))  # also the burst
+    USER_MAX_CONCURRENT = int(os.environ.get('USER_MAX_CONCURRENT', 4))
+
+    # micro-batching of completions for providers with a batch api (huggingface)
+    LLM_BATCH_ENABLED = os.environ.get('LLM_BATCH_ENABLED', 'false').lower() in ('1', 'true', 'yes')
+    LLM_BATCH_WINDOW_MS = float(os.environ.get('LLM_BATCH_WINDOW_MS', 10))  # how long a batch waits for company
+    LLM_BATCH_MAX_SIZE = int(os.environ.get('LLM_BATCH_MAX_SIZE', 16))
+    LLM_BATCH_ITEM_TIMEOUT = float(os.environ.get('LLM_BATCH_ITEM_TIMEOUT', 90))  # seconds a caller waits for its result
+    LLM_BATCH_CONCURRENCY = int(os.environ.get('LLM_BATCH_CONCURRENCY', 4))  # batches in flight per provider
+
+    # multi-provider routing: comma separated providers (groq, gemini, huggingface, stub, stub:<name>),
+    # unset uses LLM_PROVIDER alone
+    LLM_ROUTER_PROVIDERS = os.environ.get('LLM_ROUTER_PROVIDERS', '')
+    LLM_ROUTER_HEDGE = os.environ.get('LLM_ROUTER_HEDGE', 'true').lower() in ('1', 'true', 'yes')
+    LLM_ROUTER_MAX_ERROR_RATE = float(os.environ.get('LLM_ROUTER_MAX_ERROR_RATE', 0.5))
+    LLM_ROUTER_MIN_SAMPLES = int(os.environ.get('LLM_ROUTER_MIN_SAMPLES', 5))  # calls before a provider is ranked by latency
+    # the "stub" provider: simulated upstream latency and reply length, for load tests
+    STUB_LATENCY_MS = float(os.environ.get('STUB_LATENCY_MS', 0))
+    STUB_TOKENS = int(os.environ.get('STUB_TOKENS', 0))  # reply words (and reported tokens), 0 keeps "stub response"
+    # offline providers for the router, json: {"fast": {"latency_ms": 50}, "flaky": {"latency_ms": 300, "error_rate": 0.2}}
+    STUB_PROVIDERS = os.environ.get('STUB_PROVIDERS', '')
+
+    # chat turn persistence: "immediate" commits each turn, "group" hands turns to a writer
+    # thread that commits many concurrent turns together (callers still wait for their commit)
+    DB_DURABILITY = os.environ.get('DB_DURABILITY', 'immediate').lower()
+    DB_GROUP_COMMIT_MAX_TURNS = int(os.environ.get('DB_GROUP_COMMIT_MAX_TURNS', 64))
+    DB_GROUP_COMMIT_DELAY_MS = float(os.environ.get('DB_GROUP_COMMIT_DELAY_MS', 2))  # wait for company before committing
+
+    # read-through cache of user, document and conversation payloads, invalidated on commit;
+    # with more than one worker process SHARED_STORE_URL is required so invalidations reach all of them
+    ENTITY_CACHE_ENABLED = os.environ.get('ENTITY_CACHE_ENABLED', 'false').lower() in ('1', 'true', 'yes')
+    ENTITY_CACHE_SHARED = os.environ.get('ENTITY_CACHE_SHARED', 'false').lower() in ('1', 'true', 'yes')  # also keep entries in the shared store
+    ENTITY_CACHE_MAX_ENTRIES = int(os.environ.get('ENTITY_CACHE_MAX_ENTRIES', 4096))  # per process
+    ENTITY_CACHE_TTL = float(os.environ.get('ENTITY_CACHE_TTL', 300))  # seconds
+
+    # bulk endpoints: items per transaction and per request
+    BULK_CHUNK_SIZE = int(os.environ.get('BULK_CHUNK_SIZE', 500))
+    BULK_MAX_ITEMS = int(os.environ.get('BULK_MAX_ITEMS', 50000))
+
+    # rows fetched per round trip by GET /users/<id>/export
+    EXPORT_YIELD_PER = int(os.environ.get('EXPORT_YIELD_PER', 500))
+
+    # observability: one json timing line per request on the "app.timing" logger, and
+    # sampling profiles of single requests (X-Profile: 1 or PUT /metrics/profiler).
+    # Metrics, the sample rate and stored profiles are per worker process.
+    REQUEST_TIMING_LOG = os.environ.get('REQUEST_TIMING_LOG', 'false').lower() in ('1', 'true', 'yes')
+    PROFILER_ALLOWED = os.environ.get('PROFILER_ALLOWED', 'false').lower() in ('1', 'true', 'yes')
+    PROFILER_INTERVAL_MS = float(os.environ.get('PROFILER_INTERVAL_MS', 5))
+    # PUT /metrics/profiler needs "X-Profiler-Token: <token>", unset refuses every change
+    PROFILER_TOKEN = os.environ.get('PROFILER_TOKEN', '')
 
     @staticmethod
     def validate_config():
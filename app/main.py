@@ -1,22 +1,13 @@
-import connexion
-from app.config import Config
-from app.utils.db import db
+"""
+WSGI entry point for production servers.
 
-def create_app():
-    cnx_app = connexion.App(__name__, specification_dir="./swagger")
-    cnx_app.add_api(
-        "schema.yml",
-        strict_validation=True,
-        validate_responses=False,
-        swagger_ui=True,
-        base_path="/api"
-    )
-    app = cnx_app.app
-    app.config.from_object(Config)
-    db.init_app(app)
-    with app.app_context():
-        db.create_all()
-    return app
+    flask --app app migrate                                # once per deploy
+    gunicorn -c gunicorn.conf.py app.main:app
+
+The API is served by the blueprints registered in create_app, app/swagger/schema.yml
+only documents it.
+"""
+from app import create_app
 
 app = create_app()
 
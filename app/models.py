@@ -1,4 +1,5 @@
 from app import db
+from app.utils.compression import CompressedText, JSONDocument
 from datetime import datetime
 import json
 
@@ -7,6 +8,7 @@ class User(db.Model):
     username = db.Column(db.String(80), unique=True, nullable=False)
     email = db.Column(db.String(120), unique=True, nullable=True)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    deleted_at = db.Column(db.DateTime, nullable=True)  # soft deleted, rows are purged by a DeletionJob
     
     conversations = db.relationship('Conversation', backref='user', lazy=True)
     
@@ -26,31 +28,46 @@ class Conversation(db.Model):
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     document_ids = db.Column(db.Text, nullable=True)  # JSON array of document IDs if in RAG mode
+    summary = db.Column(db.Text, nullable=True)  # rolling summary of messages that left the context window
+    summary_upto_id = db.Column(db.Integer, default=0)  # newest message id folded into the summary
+    deleted_at = db.Column(db.DateTime, nullable=True)  # soft deleted, messages are purged by a DeletionJob
+    archived_at = db.Column(db.DateTime, nullable=True)  # messages moved to the archive tier, see ArchiveService
     
-    messages = db.relationship('Message', backref='conversation', lazy=True, order_by="Message.created_at")
+    messages = db.relationship('Message', backref='conversation', lazy=True, order_by="[Message.created_at, Message.id]")
     
-    def to_dict(self, include_messages=False):
-        data = {
-            'id': self.id,
-            'user_id': self.user_id,
-            'title': self.title,
-            'mode': self.mode,
-            'created_at': self.created_at.isoformat(),
-            'updated_at': self.updated_at.isoformat(),
-            'document_ids': json.loads(self.document_ids) if self.document_ids else []
-        }
+    FIELDS = {
+        'id': lambda c: c.id,
+        'user_id': lambda c: c.user_id,
+        'title': lambda c: c.title,
+        'mode': lambda c: c.mode,
+        'created_at': lambda c: c.created_at.isoformat(),
+        'updated_at': lambda c: c.updated_at.isoformat(),
+        'document_ids': lambda c: json.loads(c.document_ids) if c.document_ids else []
+    }
+
+    def to_dict(self, include_messages=False, fields=None):
+        """fields limits the output to those keys (sparse list views), None means all of them"""
+        data = {name: get(self) for name, get in self.FIELDS.items() if fields is None or name in fields}
         if include_messages:
             data['messages'] = [message.to_dict() for message in self.messages]
         return data
 
+# list views page a user's conversations by recency
+db.Index('ix_conversation_user_updated', Conversation.user_id, Conversation.updated_at.desc())
+
 class Message(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     conversation_id = db.Column(db.String(36), db.ForeignKey('conversation.id'), nullable=False)
-    content = db.Column(db.Text, nullable=False)
+    content = db.Column(CompressedText, nullable=False)  # compressed from MESSAGE_COMPRESSION_MIN_BYTES up
     role = db.Column(db.String(20), nullable=False)  # "user" or "assistant" can be changed
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     tokens_used = db.Column(db.Integer, default=0)
-    meta = db.Column(db.Text, nullable=True)  # json for additional metadata
+    meta = db.Column(JSONDocument, nullable=True)  # additional metadata, a dict
+
+    __table_args__ = (
+        # history reads and message pagination are always per conversation in time order
+        db.Index('ix_message_conversation_created', 'conversation_id', 'created_at'),
+    )
     
     def to_dict(self):
         data = {
@@ -62,7 +79,7 @@ class Message(db.Model):
             'tokens_used': self.tokens_used
         }
         if self.meta:
-            data['metadata'] = json.loads(self.meta)
+            data['metadata'] = self.meta
         return data
 
 class Document(db.Model):
@@ -72,11 +89,74 @@ class Document(db.Model):
     uri = db.Column(db.String(512), nullable=True)      # place where the file/chunks live/stored
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
 
+    # ingestion state: "pending", "indexing", "ready" or "failed"
+    status = db.Column(db.String(20), default='pending', nullable=False)
+    progress = db.Column(db.Float, default=0.0)          # fraction of the file processed
+    chunk_count = db.Column(db.Integer, default=0)
+    content_hash = db.Column(db.String(64), nullable=True)  # sha256 of the last indexed content
+    error = db.Column(db.Text, nullable=True)
+    indexed_at = db.Column(db.DateTime, nullable=True)
+    deleted_at = db.Column(db.DateTime, nullable=True)  # soft deleted with its user
+
+    FIELDS = {
+        "id": lambda d: d.id,
+        "user_id": lambda d: d.user_id,
+        "title": lambda d: d.title,
+        "uri": lambda d: d.uri,
+        "created_at": lambda d: d.created_at.isoformat(),
+        "status": lambda d: d.status,
+        "progress": lambda d: d.progress,
+        "chunk_count": lambda d: d.chunk_count,
+        "error": lambda d: d.error,
+        "indexed_at": lambda d: d.indexed_at.isoformat() if d.indexed_at else None
+    }
+
+    def to_dict(self, fields=None):
+        """fields limits the output to those keys (sparse list views), None means all of them"""
+        return {name: get(self) for name, get in self.FIELDS.items() if fields is None or name in fields}
+
+db.Index('ix_document_user_created', Document.user_id, Document.created_at.desc())
+
+class DeletionJob(db.Model):
+    """Background purge of soft-deleted rows, see DeletionService"""
+    id = db.Column(db.String(36), primary_key=True)
+    kind = db.Column(db.String(20), nullable=False)  # "user" or "conversations"
+    target_ids = db.Column(db.Text, nullable=False)  # JSON array: the user id, or the conversation ids
+    status = db.Column(db.String(20), default='pending', nullable=False)  # pending, running, done or failed
+    conversations_total = db.Column(db.Integer, default=0)
+    conversations_deleted = db.Column(db.Integer, default=0)
+    messages_total = db.Column(db.Integer, default=0)
+    messages_deleted = db.Column(db.Integer, default=0)
+    documents_total = db.Column(db.Integer, default=0)
+    documents_deleted = db.Column(db.Integer, default=0)
+    error = db.Column(db.Text, nullable=True)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    finished_at = db.Column(db.DateTime, nullable=True)
+
+    @property
+    def progress(self) -> float:
+        """Fraction of the rows counted when the job was created that are gone"""
+        if self.status == 'done':
+            return 1.0
+        total = (self.conversations_total or 0) + (self.messages_total or 0) + (self.documents_total or 0)
+        deleted = (self.conversations_deleted or 0) + (self.messages_deleted or 0) + (self.documents_deleted or 0)
+        return round(min(deleted / total, 1.0), 4) if total else 0.0
+
     def to_dict(self):
         return {
-            "id": self.id,
-            "user_id": self.user_id,
-            "title": self.title,
-            "uri": self.uri,
-            "created_at": self.created_at.isoformat()
+            'id': self.id,
+            'kind': self.kind,
+            'target_ids': json.loads(self.target_ids),
+            'status': self.status,
+            'progress': self.progress,
+            'conversations': {'total': self.conversations_total, 'deleted': self.conversations_deleted},
+            'messages': {'total': self.messages_total, 'deleted': self.messages_deleted},
+            'documents': {'total': self.documents_total, 'deleted': self.documents_deleted},
+            'error': self.error,
+            'created_at': self.created_at.isoformat(),
+            'finished_at': self.finished_at.isoformat() if self.finished_at else None
         }
+
+# the purge worker picks up unfinished jobs oldest first
+db.Index('ix_deletion_job_status_created', DeletionJob.status, DeletionJob.created_at)
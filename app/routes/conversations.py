@@ -1,9 +1,16 @@
-from flask import Blueprint, request, jsonify
-from app.models import User
-from app.services.conversation_service import ConversationService
+from flask import Blueprint, Response, current_app, request, jsonify, stream_with_context
+from app import db
+from app.models import Conversation
+from app.utils.http import bulk_items, ndjson_response, wants_event_stream
+from app.utils.pagination import parse_fields, parse_limit
+import json
+from app.services.conversation_service import get_conversation_service
+from app.services.bulk_service import InvalidItem, get_bulk_service
+from app.services.deletion_service import get_deletion_service
+from app.services.entity_cache import cached, user_payload
+from app.services.rate_limiter import RateLimitExceeded
 
 bp = Blueprint('conversations', __name__)
-conversation_service = ConversationService()
 
 @bp.route('/conversations', methods=['POST'])
 def create_conversation():
@@ -19,21 +26,47 @@ def create_conversation():
     document_ids = data.get('document_ids', [])
 
     # verifying user exist or not (most cases can query on top and do getone)
-    user = User.query.get(user_id)
+    user = cached('user', user_id, lambda: user_payload(user_id))
     if not user:
         return jsonify({'error': f'User with ID {user_id} not found'}), 404
 
     try:
-        conversation = conversation_service.create_conversation(
+        conversation = get_conversation_service().create_conversation(
             user_id=user_id,
             first_message=message,
             mode=mode,
             document_ids=document_ids
         )
         return jsonify(conversation), 201
+    except RateLimitExceeded as e:
+        return _too_many_requests(e)
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+@bp.route('/conversations/import', methods=['POST'])
+def import_conversations():
+    """
+    Import conversations with their history, no LLM calls are made:
+    {"conversations": [{"user_id": 1, "title": ..., "messages": [{"role": "user", "content": ...}]}]} or NDJSON
+    """
+    items = bulk_items('conversations', InvalidItem)
+    if items is None:
+        return jsonify({'error': 'Expected {"conversations": [...]} or an application/x-ndjson body'}), 400
+    return ndjson_response(get_bulk_service().import_conversations(items))
+
+@bp.route('/conversations/bulk-delete', methods=['POST'])
+def delete_conversations_bulk():
+    """
+    Delete many conversations: {"ids": [...]} or one json string id per NDJSON line
+    They are soft deleted chunk by chunk, each chunk's job purges the messages in the background
+    """
+    items = bulk_items('ids', InvalidItem)
+    if items is None:
+        return jsonify({'error': 'Expected {"ids": [...]} or an application/x-ndjson body'}), 400
+    app = current_app._get_current_object()
+    purge = lambda job_id: get_deletion_service().submit(app, job_id)
+    return ndjson_response(get_bulk_service().delete_conversations(items, purge))
+
 @bp.route('/conversations/<conversation_id>/messages', methods=['POST'])
 def add_message(conversation_id):
     """Add a new message to an existing conversation"""
@@ -43,24 +76,104 @@ def add_message(conversation_id):
         return jsonify({'error': 'Missing required field: message'}), 400
     
     message = data['message']
-    
+
+    if _wants_stream():
+        return _stream_message(conversation_id, message)
+
     try:
-        conversation = conversation_service.add_message_to_conversation(
+        conversation = get_conversation_service().add_message_to_conversation(
             conversation_id=conversation_id,
-            user_message=message
+            user_message=message,
+            view=_response_view()
         )
         return jsonify(conversation), 200
+    except RateLimitExceeded as e:
+        return _too_many_requests(e)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 404
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+def _too_many_requests(e: RateLimitExceeded):
+    return jsonify({'error': str(e), 'scope': e.scope}), 429, {'Retry-After': str(e.retry_after_seconds)}
+
+def _response_view():
+    """?view=delta returns only the new user/assistant pair instead of the whole conversation"""
+    return 'delta' if request.args.get('view', '').lower() == 'delta' else 'full'
+
+@bp.route('/conversations/<conversation_id>/messages', methods=['GET'])
+def list_messages(conversation_id):
+    """Page through a conversation's messages with ?after=<message_id>&limit=N"""
+    try:
+        limit = parse_limit()
+        after = request.args.get('after', type=int)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    try:
+        page = get_conversation_service().list_messages(conversation_id, after=after, limit=limit)
+        return jsonify(page), 200
     except ValueError as e:
         return jsonify({'error': str(e)}), 404
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+def _wants_stream():
+    """Streaming is requested with ?stream=1 or an Accept: text/event-stream header"""
+    return wants_event_stream(request.args.get('stream'), request.headers.get('Accept'))
+
+def _sse(event, data):
+    """Format a single server-sent event frame"""
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+def _stream_message(conversation_id, message):
+    """Add a message and relay the assistant reply as server-sent events"""
+    try:
+        events = get_conversation_service().stream_message_to_conversation(
+            conversation_id=conversation_id,
+            user_message=message
+        )
+    except RateLimitExceeded as e:
+        return _too_many_requests(e)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 404
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+    def generate():
+        try:
+            for event in events:
+                yield _sse(event['event'], event['data'])
+        except Exception as e:
+            # headers are already sent so the failure is reported in-band
+            db.session.rollback()
+            yield _sse('error', {'error': str(e)})
+
+    headers = {'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    return Response(stream_with_context(generate()), mimetype='text/event-stream', headers=headers)
+
 @bp.route('/users/<user_id>/conversations', methods=['GET'])
 def get_user_conversations(user_id):
-    """Get all conversations for a user"""
+    """
+    Get conversations for a user, most recently updated first
+    With ?limit and/or ?cursor the response is a page {"items": [...], "next_cursor": ...}
+    """
     try:
-        conversations = conversation_service.get_user_conversations(int(user_id))
+        fields = parse_fields(Conversation.FIELDS)
+        paged = 'limit' in request.args or 'cursor' in request.args
+        limit = parse_limit()
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    try:
+        if paged:
+            page = get_conversation_service().page_user_conversations(
+                int(user_id), cursor=request.args.get('cursor'), limit=limit, fields=fields)
+            return jsonify(page), 200
+        conversations = get_conversation_service().get_user_conversations(int(user_id), fields=fields)
         return jsonify(conversations), 200
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
@@ -68,7 +181,7 @@ def get_user_conversations(user_id):
 def get_conversation(conversation_id):
     """Get a specific conversation with all messages"""
     try:
-        conversation = conversation_service.get_conversation_by_id(conversation_id)
+        conversation = get_conversation_service().get_conversation_by_id(conversation_id)
         return jsonify(conversation), 200
     except ValueError as e:
         return jsonify({'error': str(e)}), 404
@@ -77,12 +190,12 @@ def get_conversation(conversation_id):
 
 @bp.route('/conversations/<conversation_id>', methods=['DELETE'])
 def delete_conversation(conversation_id):
-    """Delete a conversation and all its messages"""
+    """Delete a conversation and all its messages, the messages are purged in the background (see job)"""
     try:
-        success = conversation_service.delete_conversation(conversation_id)
-        if success:
-            return jsonify({'message': 'Conversation deleted successfully'}), 200
-        else:
+        job = get_conversation_service().delete_conversation(conversation_id)
+        if job is None:
             return jsonify({'error': 'Conversation not found'}), 404
+        get_deletion_service().submit(current_app._get_current_object(), job['id'])
+        return jsonify({'message': 'Conversation deleted successfully', 'job': job}), 200
     except Exception as e:
         return jsonify({'error': str(e)}), 500
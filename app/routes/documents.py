@@ -1,6 +1,11 @@
-from flask import Blueprint, request, jsonify
+from flask import Blueprint, current_app, request, jsonify
 from app import db
-from app.models import Document, User
+from app.models import Document
+from app.services.bulk_service import InvalidItem, get_bulk_service
+from app.services.entity_cache import cached, document_payload, user_payload
+from app.services.ingestion_service import get_ingestion_service
+from app.utils.http import bulk_items, ndjson_response
+from app.utils.pagination import keyset_page, parse_fields, parse_limit
 import uuid
 
 bp = Blueprint('documents', __name__)
@@ -13,14 +18,52 @@ def create_document():
     uri = data.get('uri')
     if not user_id or not title:
         return jsonify({"error": "user_id and title are required"}), 400
-    if not User.query.get(user_id):
+    if not cached('user', user_id, lambda: user_payload(user_id)):
         return jsonify({"error": "User not found"}), 404
     doc = Document(id=str(uuid.uuid4()), user_id=user_id, title=title, uri=uri)
     db.session.add(doc)
     db.session.commit()
+
+    # reading and indexing happen in the background, poll GET /documents/<id> for status
+    get_ingestion_service().submit(current_app._get_current_object(), doc.id)
     return jsonify(doc.to_dict()), 201
 
+@bp.route('/documents/bulk', methods=['POST'])
+def create_documents_bulk():
+    """Create many documents ({"documents": [...]} or NDJSON), each is queued for ingestion once committed"""
+    items = bulk_items('documents', InvalidItem)
+    if items is None:
+        return jsonify({"error": 'Expected {"documents": [...]} or an application/x-ndjson body'}), 400
+    app = current_app._get_current_object()
+    return ndjson_response(get_bulk_service().create_documents(items, lambda doc_id: get_ingestion_service().submit(app, doc_id)))
+
+@bp.route('/documents/<document_id>', methods=['GET'])
+def get_document(document_id):
+    doc = cached('document', document_id, lambda: document_payload(document_id))
+    if not doc:
+        return jsonify({"error": "Document not found"}), 404
+    return jsonify(doc), 200
+
+@bp.route('/documents/<document_id>/ingest', methods=['POST'])
+def ingest_document(document_id):
+    """Re-run ingestion, a file whose content hash is unchanged is not re-embedded"""
+    doc = db.session.get(Document, document_id)
+    if not doc or doc.deleted_at is not None:
+        return jsonify({"error": "Document not found"}), 404
+    get_ingestion_service().submit(current_app._get_current_object(), doc.id)
+    return jsonify(doc.to_dict()), 202
+
 @bp.route('/users/<user_id>/documents', methods=['GET'])
 def list_documents(user_id):
-    docs = Document.query.filter_by(user_id=user_id).order_by(Document.created_at.desc()).all()
-    return jsonify([d.to_dict() for d in docs]), 200
+    """Newest first, ?limit and/or ?cursor return a page {"items": [...], "next_cursor": ...}"""
+    try:
+        fields = parse_fields(Document.FIELDS)
+        limit = parse_limit()
+        query = Document.query.filter_by(user_id=user_id, deleted_at=None)
+        if 'limit' in request.args or 'cursor' in request.args:
+            docs, next_cursor = keyset_page(query, Document.created_at, Document.id, request.args.get('cursor'), limit)
+            return jsonify({"items": [d.to_dict(fields) for d in docs], "next_cursor": next_cursor}), 200
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    docs = query.order_by(Document.created_at.desc()).all()
+    return jsonify([d.to_dict(fields) for d in docs]), 200
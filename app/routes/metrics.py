@@ -0,0 +1,60 @@
+import hmac
+
+from flask import Blueprint, Response, current_app, jsonify, request
+from app.services.entity_cache import get_entity_cache
+from app.utils.metrics import registry
+
+bp = Blueprint('metrics', __name__)
+
+cache_hit_ratio = registry.gauge('entity_cache_hit_ratio', 'Entity cache hit ratio since start', ['kind'])
+
+@bp.route('/metrics', methods=['GET'])
+def metrics():
+    """
+    Metrics of the process serving the request in the Prometheus text exposition format.
+    Every worker keeps its own registry: scrape each worker (or sum the series across
+    scrapes), one scrape through a load balancer only sees whichever worker answered.
+    """
+    cache = get_entity_cache()
+    if cache is not None:
+        for kind, stats in cache.stats().items():
+            cache_hit_ratio.set(stats['hit_ratio'], kind=kind)
+    return Response(registry.render(), mimetype='text/plain; version=0.0.4')
+
+@bp.route('/metrics/profiler', methods=['GET', 'PUT'])
+def profiler_settings():
+    """
+    Switch request profiling at runtime: {"sample_rate": 0.05}, requests can also opt in with X-Profile: 1
+    Changes need the PROFILER_TOKEN in X-Profiler-Token. The sample rate and the listed
+    profiles belong to the worker process that serves the call, not to the whole server.
+    """
+    profiler = current_app.extensions['profiler']
+    if not profiler.allowed:
+        return jsonify({'error': 'Profiling is disabled (PROFILER_ALLOWED)'}), 403
+    if request.method == 'PUT':
+        token = current_app.config['PROFILER_TOKEN']
+        if not token or not hmac.compare_digest(request.headers.get('X-Profiler-Token', ''), token):
+            return jsonify({'error': 'Changing the sample rate needs X-Profiler-Token (PROFILER_TOKEN)'}), 403
+        data = request.get_json() or {}
+        try:
+            sample_rate = float(data.get('sample_rate', profiler.sample_rate))
+        except (TypeError, ValueError):
+            return jsonify({'error': 'sample_rate must be a number'}), 400
+        if not 0 <= sample_rate <= 1:
+            return jsonify({'error': 'sample_rate must be between 0 and 1'}), 400
+        profiler.sample_rate = sample_rate
+    return jsonify({'sample_rate': profiler.sample_rate, 'profiles': profiler.ids()}), 200
+
+@bp.route('/metrics/profiles/<request_id>', methods=['GET'])
+def get_profile(request_id):
+    """
+    Collapsed stacks of a profiled request, feed them to a flame graph tool
+    Profiles stay in the worker that ran the request: 404 from another worker
+    """
+    profiler = current_app.extensions['profiler']
+    if not profiler.allowed:
+        return jsonify({'error': 'Profiling is disabled (PROFILER_ALLOWED)'}), 403
+    stacks = profiler.get(request_id)
+    if stacks is None:
+        return jsonify({'error': 'Profile not found'}), 404
+    return Response(stacks + "\n", mimetype='text/plain')
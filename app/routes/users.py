@@ -1,6 +1,11 @@
-from flask import Blueprint, request, jsonify
+from flask import Blueprint, Response, current_app, request, jsonify, stream_with_context
 from app.models import User
 from app import db
+from app.services.bulk_service import InvalidItem, get_bulk_service
+from app.services.deletion_service import get_deletion_service
+from app.services.entity_cache import cached, user_payload
+from app.services.export_service import get_export_service, ndjson_bytes
+from app.utils.http import bulk_items, ndjson_response
 
 bp = Blueprint('users', __name__)
 
@@ -26,11 +31,60 @@ def create_user():
 
     return jsonify(user.to_dict()), 201
 
+@bp.route('/users/bulk', methods=['POST'])
+def create_users_bulk():
+    """Create many users: {"users": [{"username": ..., "email": ...}]} or one user per line of an NDJSON body, results stream back as NDJSON"""
+    items = bulk_items('users', InvalidItem)
+    if items is None:
+        return jsonify({'error': 'Expected {"users": [...]} or an application/x-ndjson body'}), 400
+    return ndjson_response(get_bulk_service().create_users(items))
+
 @bp.route('/users/<user_id>', methods=['GET'])
 def get_user(user_id):
     """Get user details"""
-    user = User.query.get(user_id)
+    user = cached('user', user_id, lambda: user_payload(user_id))
     if not user:
         return jsonify({'error': 'User not found'}), 404
 
-    return jsonify(user.to_dict()), 200
+    return jsonify(user), 200
+
+@bp.route('/users/<int:user_id>', methods=['DELETE'])
+def delete_user(user_id):
+    """
+    Delete a user with their conversations, messages, documents and document indexes
+    Everything is soft deleted at once and purged in the background, poll GET /deletions/<job id>
+    """
+    job = get_deletion_service().delete_user(user_id)
+    if job is None:
+        return jsonify({'error': 'User not found'}), 404
+    get_deletion_service().submit(current_app._get_current_object(), job['id'])
+    return jsonify({'job': job}), 202
+
+@bp.route('/deletions/<job_id>', methods=['GET'])
+def get_deletion(job_id):
+    """Status and progress of a deletion job"""
+    job = get_deletion_service().get_job(job_id)
+    if job is None:
+        return jsonify({'error': 'Deletion job not found'}), 404
+    return jsonify(job), 200
+
+@bp.route('/users/<user_id>/export', methods=['GET'])
+def export_user(user_id):
+    """
+    Stream every conversation and message of a user as NDJSON, gzip encoded when the client
+    accepts it. Each line has a cursor, ?cursor=<last one received> resumes after it.
+    """
+    user = db.session.get(User, user_id)
+    if not user or user.deleted_at is not None:
+        return jsonify({'error': 'User not found'}), 404
+    try:
+        lines = get_export_service().export_user(user, request.args.get('cursor'))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    gzip = 'gzip' in request.accept_encodings
+    headers = {'Content-Disposition': f'attachment; filename="user-{user.id}-export.ndjson"', 'X-Accel-Buffering': 'no'}
+    if gzip:
+        headers['Content-Encoding'] = 'gzip'
+        headers['Vary'] = 'Accept-Encoding'
+    return Response(stream_with_context(ndjson_bytes(lines, gzip)), mimetype='application/x-ndjson', headers=headers)
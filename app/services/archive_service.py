@@ -0,0 +1,172 @@
+import json
+import os
+from datetime import datetime, timedelta
+from typing import List
+
+from sqlalchemy import delete, insert, select, update
+
+from app import db
+from app.config import Config
+from app.models import Conversation, Message
+from app.utils.compression import compress, decompress
+from app.utils.lazy import process_singleton
+from app.utils.metrics import registry
+from .prompt_state import forget_prompt_state
+
+archive_conversations_total = registry.counter('archive_conversations_total', 'Conversations moved in or out of the archive',
+                                               ['action'])
+archive_bytes_total = registry.counter('archive_bytes_total', 'Message bytes archived, before and after compression',
+                                       ['size'])
+
+
+class ArchiveService:
+    """
+    Archive tier for idle conversations.
+    Conversations not updated for ARCHIVE_AFTER_DAYS have their messages moved out of the
+    message table into one compressed file per conversation under root, and are marked
+    archived_at; the conversation row itself stays. The hot table then only holds recent
+    conversations and its indexes stay small. Reads of an archived conversation are served
+    from its file; a new turn restores the messages into the table first.
+    """
+
+    def __init__(self, root: str = None, after_days: float = None, batch_size: int = None):
+        self.root = root or Config.ARCHIVE_DIR
+        self.after_days = Config.ARCHIVE_AFTER_DAYS if after_days is None else after_days
+        self.batch_size = batch_size or Config.ARCHIVE_BATCH_SIZE
+
+    def path(self, conversation_id: str) -> str:
+        return os.path.join(self.root, conversation_id[:2], f"{conversation_id}.json.z")
+
+    # files
+
+    def read(self, conversation_id: str) -> List[dict]:
+        """Archived message rows of a conversation, oldest first ([] when there is no file)"""
+        try:
+            with open(self.path(conversation_id), 'rb') as f:
+                return json.loads(decompress(f.read()))['messages']
+        except FileNotFoundError:
+            return []
+
+    def _write(self, conversation_id: str, rows: List[dict]):
+        """Whole file or nothing: written aside, synced, then renamed into place"""
+        path = self.path(conversation_id)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        raw = json.dumps({'conversation_id': conversation_id, 'messages': rows}, separators=(',', ':')).encode()
+        packed = compress(raw)
+        tmp = f"{path}.tmp"
+        with open(tmp, 'wb') as f:
+            f.write(packed)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, path)
+        archive_bytes_total.labels(size='raw').inc(len(raw))
+        archive_bytes_total.labels(size='stored').inc(len(packed))
+
+    def remove(self, conversation_id: str):
+        try:
+            os.remove(self.path(conversation_id))
+        except FileNotFoundError:
+            pass
+
+    # reads
+
+    def messages(self, conversation_id: str, live: List[Message] = ()) -> List[Message]:
+        """
+        Messages of an archived conversation as detached Message objects, merged with rows
+        still in the table (live): a turn racing the archiver can leave one behind
+        """
+        archived = [Message(id=row['id'], conversation_id=conversation_id, content=row['content'], role=row['role'],
+                            created_at=datetime.fromisoformat(row['created_at']), tokens_used=row['tokens_used'],
+                            meta=row['meta'])
+                    for row in self.read(conversation_id)]
+        return sorted([*archived, *live], key=lambda m: (m.created_at, m.id))
+
+    # moving conversations in and out
+
+    def archive_idle(self, after_days: float = None) -> int:
+        """Archive every live conversation idle longer than after_days, returns how many were archived"""
+        cutoff = datetime.utcnow() - timedelta(days=self.after_days if after_days is None else after_days)
+        archived, after = 0, ''
+        while True:
+            candidates = db.session.execute(
+                select(Conversation.id).where(Conversation.updated_at < cutoff, Conversation.archived_at.is_(None),
+                                              Conversation.deleted_at.is_(None), Conversation.id > after)
+                .order_by(Conversation.id).limit(self.batch_size)).scalars().all()
+            db.session.rollback()
+            archived += sum(self.archive(conversation_id, cutoff) for conversation_id in candidates)
+            if len(candidates) < self.batch_size:
+                return archived
+            after = candidates[-1]
+
+    def archive(self, conversation_id: str, cutoff: datetime = None) -> bool:
+        """
+        Move one conversation's messages to its archive file, in one transaction that only
+        commits once the file is in place; False when it is gone, archived or (with cutoff)
+        updated since
+        """
+        criteria = [Conversation.id == conversation_id, Conversation.archived_at.is_(None),
+                    Conversation.deleted_at.is_(None)]
+        if cutoff is not None:
+            criteria.append(Conversation.updated_at < cutoff)
+        try:
+            # updated_at is kept: archiving is not activity
+            marked = db.session.execute(update(Conversation).where(*criteria).values(
+                archived_at=datetime.utcnow(), updated_at=Conversation.updated_at)).rowcount
+            if not marked:
+                db.session.rollback()
+                return False
+            rows = db.session.execute(
+                select(Message.id, Message.role, Message.content, Message.created_at, Message.tokens_used, Message.meta)
+                .where(Message.conversation_id == conversation_id).order_by(Message.created_at, Message.id)).all()
+            self._write(conversation_id, [
+                {'id': row.id, 'role': row.role, 'content': row.content, 'created_at': row.created_at.isoformat(),
+                 'tokens_used': row.tokens_used, 'meta': row.meta}
+                for row in rows
+            ])
+            db.session.execute(delete(Message).where(Message.conversation_id == conversation_id))
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            raise
+        forget_prompt_state(conversation_id)
+        archive_conversations_total.labels(action='archived').inc()
+        return True
+
+    def restore(self, conversation_id: str) -> bool:
+        """
+        Move an archived conversation's messages back into the table (before a new turn).
+        Original ids are kept unless the table reused one meanwhile, then the messages get
+        new ids and the rolling summary, which refers to ids, is rebuilt on the next turn.
+        """
+        rows = self.read(conversation_id)
+        try:
+            values = dict(archived_at=None, updated_at=datetime.utcnow())
+            ids = [row['id'] for row in rows]
+            taken = bool(ids) and db.session.scalar(select(Message.id).where(Message.id.in_(ids)).limit(1)) is not None
+            if taken:
+                values.update(summary=None, summary_upto_id=0)
+            restored = db.session.execute(update(Conversation).where(
+                Conversation.id == conversation_id, Conversation.archived_at.isnot(None)).values(**values)).rowcount
+            if not restored:
+                db.session.rollback()
+                return False
+            if rows:
+                db.session.execute(insert(Message), [
+                    {**({} if taken else {'id': row['id']}), 'conversation_id': conversation_id,
+                     'content': row['content'], 'role': row['role'],
+                     'created_at': datetime.fromisoformat(row['created_at']), 'tokens_used': row['tokens_used'],
+                     'meta': row['meta']}
+                    for row in rows
+                ])
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            raise
+        self.remove(conversation_id)
+        archive_conversations_total.labels(action='restored').inc()
+        return True
+
+
+@process_singleton
+def get_archive_service() -> ArchiveService:
+    return ArchiveService()
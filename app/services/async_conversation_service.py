@@ -0,0 +1,70 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+
+from app.config import Config
+from .async_llm_service import AsyncLLMService
+from .conversation_service import get_conversation_service
+from .entity_cache import cached, user_payload
+from .rate_limiter import Permit
+
+
+class AsyncConversationService:
+    """
+    Coroutine front for ConversationService used by the ASGI entry point.
+    The read and write phases of a turn run on a bounded DB thread pool inside an app
+    context, while the LLM call in between is awaited on the event loop. Admission
+    control runs on the same pool: the shared rate backend makes store round trips that
+    must not block the loop.
+    """
+
+    def __init__(self, app, db_workers: int = None):
+        self.app = app
+        self.conversation_service = get_conversation_service()
+        self.llm_service = AsyncLLMService()
+        self.executor = ThreadPoolExecutor(
+            max_workers=db_workers or Config.DB_THREAD_POOL_SIZE,
+            thread_name_prefix='db'
+        )
+
+    async def run_db(self, fn, *args, **kwargs):
+        """Run blocking DB work on the DB pool with an app context (and its own scoped session)"""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.executor, partial(self._in_app_context, fn, *args, **kwargs))
+
+    def _in_app_context(self, fn, *args, **kwargs):
+        with self.app.app_context():
+            return fn(*args, **kwargs)
+
+    async def admit(self, user_id) -> Permit:
+        return await self.run_db(self.conversation_service.rate_limiter.admit, user_id)
+
+    async def user_exists(self, user_id: int) -> bool:
+        return await self.run_db(lambda: cached('user', user_id, lambda: user_payload(user_id)) is not None)
+
+    async def create_conversation(self, user_id: int, first_message: str, mode: str = 'open_chat', document_ids: list = None) -> dict:
+        """Create a new conversation with the first message, raises RateLimitExceeded when the user is over quota"""
+        permit = await self.admit(user_id)
+        try:
+            turn = await self.run_db(self.conversation_service.prepare_new_conversation, user_id, first_message, mode, document_ids)
+            assistant_reply, tokens_used = await self.llm_service.get_response_async(turn.conversation_history, turn.mode, turn.context)
+            await self.run_db(permit.charge, tokens_used)
+        finally:
+            await self.run_db(permit.release)
+        result = await self.run_db(self.conversation_service.complete_turn, turn, assistant_reply, tokens_used)
+        return result['conversation']
+
+    async def add_message_to_conversation(self, conversation_id: str, user_message: str, view: str = 'full') -> dict:
+        """Add a new message to an existing conversation"""
+        permit = await self.admit(await self.run_db(self.conversation_service.conversation_owner, conversation_id))
+        try:
+            turn = await self.run_db(self.conversation_service.prepare_turn, conversation_id, user_message)
+            assistant_reply, tokens_used = await self.llm_service.get_response_async(turn.conversation_history, turn.mode, turn.context)
+            await self.run_db(permit.charge, tokens_used)
+        finally:
+            await self.run_db(permit.release)
+        result = await self.run_db(self.conversation_service.complete_turn, turn, assistant_reply, tokens_used, view)
+        return result['conversation']
+
+    def shutdown(self):
+        self.executor.shutdown(wait=False)
@@ -0,0 +1,115 @@
+import asyncio
+import time
+from typing import Dict, List, Tuple
+
+import httpx
+
+from app.utils.tracing import record_completion, span
+from .llm_service import LLMService
+from .provider_transport import get_async_transport
+from .response_cache import cache_key
+from .single_flight import AsyncSingleFlight
+from .batch_dispatcher import batch_timeouts_total, get_batch_dispatcher
+
+
+class AsyncLLMService(LLMService):
+    """
+    LLMService with coroutine provider calls.
+    Upstream requests are awaited on the event loop so a process can keep thousands of
+    completions in flight; providers without an async client run in the default executor.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        # coroutines on the event loop coalesce among themselves, not through the thread-level flight
+        self.async_flight = AsyncSingleFlight() if self.single_flight is not None else None
+
+    async def get_response_async(self, conversation_history: List[Dict[str, str]], mode: str = 'open_chat', context: str = None) -> Tuple[str, int]:
+        """
+        Get response from LLM based on conversation history without blocking the event loop
+        Returns: (response_text, token_count)
+        """
+        if self.response_cache is None and self.async_flight is None:
+            return await self._provider_response_async(conversation_history, mode, context)
+        messages = self._build_messages(conversation_history, mode, context)
+        if self.response_cache is not None:
+            hit = self.response_cache.get(mode, self.provider, self.model, messages, self.TEMPERATURE)
+            if hit is not None:
+                return hit.reply, hit.tokens_used
+
+        async def call():
+            reply, tokens_used = await self._provider_response_async(conversation_history, mode, context)
+            if self.response_cache is not None:
+                self.response_cache.put(self.provider, self.model, messages, self.TEMPERATURE, reply, tokens_used)
+            return reply, tokens_used
+
+        if self.async_flight is None:
+            return await call()
+        fingerprint = cache_key(self.provider, self.model, messages, self.TEMPERATURE)
+        (reply, tokens_used), shared = await self.async_flight.do(fingerprint, call, mode)
+        return reply, 0 if shared else tokens_used
+
+    async def _provider_response_async(self, conversation_history: List[Dict[str, str]], mode: str, context: str) -> Tuple[str, int]:
+        with span('llm'):
+            started = time.perf_counter()
+            reply, tokens_used = await self._call_provider_async(conversation_history, mode, context)
+            record_completion(self.provider, self.model, mode, time.perf_counter() - started, tokens_used)
+        return reply, tokens_used
+
+    async def _call_provider_async(self, conversation_history: List[Dict[str, str]], mode: str, context: str) -> Tuple[str, int]:
+        if self.provider == 'groq':
+            return await self._get_groq_response_async(conversation_history, mode, context)
+        elif self.provider == 'stub':
+            # simulated latency must not block the event loop
+            if self.config.STUB_LATENCY_MS:
+                await asyncio.sleep(self.config.STUB_LATENCY_MS / 1000.0)
+            return self._stub_reply()
+        elif self.provider == 'huggingface' and get_batch_dispatcher('huggingface', self._get_huggingface_batch):
+            return await self._get_huggingface_batched_async(conversation_history, mode, context)
+        else:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(None, self._call_provider, conversation_history, mode, context)
+
+    async def _get_huggingface_batched_async(self, conversation_history: List[Dict[str, str]], mode: str, context: str) -> Tuple[str, int]:
+        """Join the next HuggingFace batch without holding a thread while it is in flight"""
+        batcher = get_batch_dispatcher('huggingface', self._get_huggingface_batch)
+        future = batcher.submit((conversation_history, mode, context))
+        try:
+            return await asyncio.wait_for(asyncio.wrap_future(future), self.config.LLM_BATCH_ITEM_TIMEOUT)
+        except asyncio.TimeoutError:
+            future.cancel()
+            batch_timeouts_total.labels(provider='huggingface').inc()
+            raise
+
+    async def _get_groq_response_async(self, conversation_history: List[Dict[str, str]], mode: str, context: str) -> Tuple[str, int]:
+        """Get response from Groq API on the shared async client"""
+        if not self.config.GROQ_API_KEY:
+            raise ValueError("GROQ_API_KEY environment variable not set")
+
+        url = "https://api.groq.com/openai/v1/chat/completions"
+        headers = {
+            "Authorization": f"Bearer {self.config.GROQ_API_KEY}",
+            "Content-Type": "application/json"
+        }
+        payload = {
+            "model": self.config.GROQ_MODEL,
+            "messages": self._build_messages(conversation_history, mode, context),
+            "temperature": self.TEMPERATURE,
+            "max_tokens": 1024
+        }
+        try:
+            response = await get_async_transport('groq').post(url, headers=headers, json=payload)
+            response.raise_for_status()
+            data = response.json()
+
+            if not data or "choices" not in data or not data["choices"]:
+                raise Exception(f"Unexpected response format from Groq API: {data}")
+
+            assistant_reply = data["choices"][0]["message"].get("content", "") or ""
+            token_usage = data.get("usage", {}).get("total_tokens", 0)
+            return assistant_reply.strip(), token_usage
+
+        except httpx.HTTPStatusError as http_err:
+            raise Exception(f"Groq API error {http_err.response.status_code}: {http_err.response.text}")
+        except Exception as e:
+            raise Exception(f"Error calling Groq API: {str(e)}")
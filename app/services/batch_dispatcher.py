@@ -0,0 +1,141 @@
+import queue
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Callable, List, Optional
+
+from app.config import Config
+from app.utils.metrics import registry
+
+batch_size = registry.histogram('llm_batch_size', 'Completions sent per provider batch', ['provider'],
+                                buckets=(1, 2, 4, 8, 16, 32, 64, 128))
+batch_fallbacks_total = registry.counter('llm_batch_fallbacks_total', 'Rejected batches retried item by item', ['provider'])
+batch_failures_total = registry.counter('llm_batch_failures_total', 'Batches failed as a whole (upstream down, timeout, circuit open)',
+                                        ['provider'])
+batch_timeouts_total = registry.counter('llm_batch_item_timeouts_total', 'Batched completions abandoned by their caller', ['provider'])
+
+# send_batch gets the items of one batch and returns one result per item, in order;
+# a result that is an exception instance fails only its own caller
+SendBatch = Callable[[List[Any]], List[Any]]
+
+
+class BatchRejected(Exception):
+    """
+    Raised by send_batch when upstream rejected the batch because of its content (a
+    validation error, an unexpected per-item response), some item alone may go through
+    """
+
+
+class BatchDispatcher:
+    """
+    Collects completion requests for up to window seconds (or max_batch items) and sends
+    them upstream as one batch, fanning results back through per-item futures.
+    A batch rejected for its content (BatchRejected) is retried item by item, so one bad
+    prompt only fails its own caller. Any other failure (transport errors, timeouts, 5xx,
+    an open circuit) fails every item at once: splitting would turn one failing upstream
+    call into N+1 while upstream is struggling. Callers that time out are dropped if
+    their batch hasn't left yet.
+    """
+
+    def __init__(self, provider: str, send_batch: SendBatch, window: float = 0.01, max_batch: int = 16,
+                 concurrency: int = 4):
+        self.provider = provider
+        self.send_batch = send_batch
+        self.window = window
+        self.max_batch = max_batch
+        self._queue = queue.Queue()
+        # batches are sent on a pool so a slow upstream doesn't stall collection of the next one
+        self._senders = ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix=f'batch-{provider}')
+        self._collector = None
+        self._lock = threading.Lock()
+
+    def submit(self, item: Any) -> Future:
+        """Queue an item, the future resolves to its result"""
+        if self._collector is None:
+            with self._lock:
+                if self._collector is None:
+                    self._collector = threading.Thread(target=self._collect, name=f'batch-{self.provider}', daemon=True)
+                    self._collector.start()
+        future = Future()
+        self._queue.put((item, future))
+        return future
+
+    def call(self, item: Any, timeout: float = None) -> Any:
+        """Submit and wait, raises TimeoutError after timeout seconds"""
+        future = self.submit(item)
+        try:
+            return future.result(timeout)
+        except TimeoutError:
+            future.cancel()
+            batch_timeouts_total.labels(provider=self.provider).inc()
+            raise
+
+    def _collect(self):
+        while True:
+            batch = [self._queue.get()]
+            deadline = time.monotonic() + self.window
+            while len(batch) < self.max_batch:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self._queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+            # skip callers that already gave up
+            batch = [(item, future) for item, future in batch if future.set_running_or_notify_cancel()]
+            if batch:
+                self._senders.submit(self._send, batch)
+
+    def _send(self, batch):
+        batch_size.labels(provider=self.provider).observe(len(batch))
+        items = [item for item, _ in batch]
+        try:
+            results = self.send_batch(items)
+            if len(results) != len(items):
+                raise BatchRejected(f"{self.provider} returned {len(results)} results for a batch of {len(items)}")
+        except BatchRejected as e:
+            if len(items) == 1:
+                results = [e]
+            else:
+                batch_fallbacks_total.labels(provider=self.provider).inc()
+                results = [self._single(item) for item in items]
+        except Exception as e:
+            batch_failures_total.labels(provider=self.provider).inc()
+            results = [e] * len(items)
+        for (_, future), result in zip(batch, results):
+            if isinstance(result, BaseException):
+                future.set_exception(result)
+            else:
+                future.set_result(result)
+
+    def _single(self, item):
+        try:
+            return self.send_batch([item])[0]
+        except Exception as e:
+            return e
+
+    def shutdown(self):
+        self._senders.shutdown(wait=False)
+
+
+_dispatchers = {}
+_dispatchers_lock = threading.Lock()
+
+
+def get_batch_dispatcher(provider: str, send_batch: SendBatch) -> Optional[BatchDispatcher]:
+    """Shared per-process dispatcher for a provider, None unless LLM_BATCH_ENABLED"""
+    if not Config.LLM_BATCH_ENABLED:
+        return None
+    dispatcher = _dispatchers.get(provider)
+    if dispatcher is None:
+        with _dispatchers_lock:
+            dispatcher = _dispatchers.get(provider)
+            if dispatcher is None:
+                dispatcher = _dispatchers[provider] = BatchDispatcher(
+                    provider, send_batch,
+                    window=Config.LLM_BATCH_WINDOW_MS / 1000.0,
+                    max_batch=Config.LLM_BATCH_MAX_SIZE,
+                    concurrency=Config.LLM_BATCH_CONCURRENCY
+                )
+    return dispatcher
@@ -0,0 +1,300 @@
+import uuid
+from datetime import datetime, timezone
+from itertools import islice
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from sqlalchemy import insert, select
+
+from app import db
+from app.config import Config
+from app.models import Conversation, Document, Message, User
+from app.utils.lazy import process_singleton
+from app.utils.metrics import registry
+from app.utils.tracing import span
+from .deletion_service import get_deletion_service
+from .turn_writer import new_conversation_fields
+
+items_total = registry.counter('bulk_items_total', 'Items processed by bulk endpoints', ['operation', 'result'])
+chunk_fallbacks_total = registry.counter('bulk_chunk_fallbacks_total', 'Bulk chunks retried item by item', ['operation'])
+
+ROLES = ('user', 'assistant')
+
+
+class InvalidItem:
+    """Placeholder for an input line that could not be parsed, reported as that item's error"""
+
+    def __init__(self, error: str):
+        self.error = error
+
+
+# (index, row ready to insert)
+Prepared = Tuple[int, Dict[str, Any]]
+
+
+class BulkService:
+    """
+    Bulk create, import and delete.
+    Items are taken chunk_size at a time: a chunk is validated with one query per lookup,
+    written with executemany inserts in one transaction and its per-item results are
+    yielded once committed, so callers can stream them. A chunk that fails as a whole is
+    retried item by item in separate transactions, one bad row only fails itself.
+    """
+
+    def __init__(self, chunk_size: int = None, max_items: int = None):
+        self.chunk_size = chunk_size or Config.BULK_CHUNK_SIZE
+        self.max_items = max_items or Config.BULK_MAX_ITEMS
+
+    def create_users(self, items: Iterable[Any]) -> Iterator[dict]:
+        return self._run('create_users', items, self._prepare_users, self._insert_users)
+
+    def create_documents(self, items: Iterable[Any], on_created: Callable[[str], None] = None) -> Iterator[dict]:
+        """on_created(document_id) runs for every committed document, e.g. to queue its ingestion"""
+        for result in self._run('create_documents', items, self._prepare_documents, self._insert_documents):
+            if on_created is not None and result['status'] == 'created':
+                on_created(result['id'])
+            yield result
+
+    def import_conversations(self, items: Iterable[Any]) -> Iterator[dict]:
+        """Conversations with their message history as given, no LLM call is made"""
+        return self._run('import_conversations', items, self._prepare_conversations, self._insert_conversations)
+
+    def delete_conversations(self, items: Iterable[Any], on_job: Callable[[str], None] = None) -> Iterator[dict]:
+        """
+        Soft delete conversations by id, their messages are purged by one DeletionJob per chunk
+        on_job(job_id) runs once per committed job, e.g. to queue its purge
+        """
+        jobs = set()
+        for result in self._run('delete_conversations', items, self._prepare_deletes, self._delete_conversations):
+            if on_job is not None and result['status'] == 'deleted' and result['job_id'] not in jobs:
+                jobs.add(result['job_id'])
+                on_job(result['job_id'])
+            yield result
+
+    # driver
+
+    def _run(self, operation: str, items: Iterable[Any],
+             prepare: Callable[[List[Tuple[int, Any]]], Tuple[List[Prepared], List[dict]]],
+             write: Callable[[List[Prepared]], List[dict]]) -> Iterator[dict]:
+        numbered = enumerate(items)
+        while True:
+            chunk = list(islice(numbered, self.chunk_size))
+            if not chunk:
+                return
+            over = [(index, item) for index, item in chunk if index >= self.max_items]
+            chunk = [(index, item) for index, item in chunk if index < self.max_items]
+            results = []
+            if chunk:
+                results = self._chunk(operation, chunk, prepare, write)
+            if over:
+                results.append(self._error(over[0][0], f"Batch limit of {self.max_items} items reached"))
+            for result in sorted(results, key=lambda r: r['index']):
+                items_total.labels(operation=operation, result=result['status']).inc()
+                yield result
+            if over:
+                return
+
+    def _chunk(self, operation, chunk, prepare, write) -> List[dict]:
+        unparsable = [self._error(index, item.error) for index, item in chunk if isinstance(item, InvalidItem)]
+        chunk = [(index, item) for index, item in chunk if not isinstance(item, InvalidItem)]
+        if not chunk:
+            return unparsable
+        try:
+            rows, rejected = prepare(chunk)
+        finally:
+            # validation only reads, don't hold the transaction open
+            db.session.rollback()
+        results = unparsable + rejected
+        if not rows:
+            return results
+        with span('bulk_write'):
+            try:
+                results.extend(self._commit(write, rows))
+            except Exception:
+                if len(rows) > 1:
+                    chunk_fallbacks_total.labels(operation=operation).inc()
+                for row in rows:
+                    try:
+                        results.extend(self._commit(write, [row]))
+                    except Exception as e:
+                        results.append(self._error(row[0], str(e.orig) if hasattr(e, 'orig') else str(e)))
+        return results
+
+    @staticmethod
+    def _commit(write, rows: List[Prepared]) -> List[dict]:
+        try:
+            results = write(rows)
+            db.session.commit()
+            return results
+        except Exception:
+            db.session.rollback()
+            raise
+
+    @staticmethod
+    def _error(index: int, error: str) -> dict:
+        return {'index': index, 'status': 'error', 'error': error}
+
+    @staticmethod
+    def _existing(column, values, *criteria) -> set:
+        values = {value for value in values if value is not None}
+        if not values:
+            return set()
+        return set(db.session.execute(select(column).where(column.in_(values), *criteria)).scalars())
+
+    # users
+
+    def _prepare_users(self, chunk):
+        rows, rejected = [], []
+        taken_names = self._existing(User.username, [item.get('username') for _, item in chunk if isinstance(item, dict)])
+        taken_emails = self._existing(User.email, [item.get('email') for _, item in chunk if isinstance(item, dict)])
+        for index, item in chunk:
+            if not isinstance(item, dict) or not isinstance(item.get('username'), str) or not item['username']:
+                rejected.append(self._error(index, 'Missing required field: username'))
+                continue
+            username, email = item['username'], item.get('email')
+            if username in taken_names:
+                rejected.append(self._error(index, 'Username already exists'))
+                continue
+            if email is not None and email in taken_emails:
+                rejected.append(self._error(index, 'Email already exists'))
+                continue
+            taken_names.add(username)
+            if email is not None:
+                taken_emails.add(email)
+            rows.append((index, {'username': username, 'email': email}))
+        return rows, rejected
+
+    def _insert_users(self, rows: List[Prepared]) -> List[dict]:
+        ids = db.session.execute(
+            insert(User).returning(User.id, sort_by_parameter_order=True), [row for _, row in rows]
+        ).scalars().all()
+        return [{'index': index, 'status': 'created', 'id': user_id, 'username': row['username']}
+                for (index, row), user_id in zip(rows, ids)]
+
+    # documents
+
+    def _prepare_documents(self, chunk):
+        rows, rejected = [], []
+        users = self._existing(User.id, [self._int(item.get('user_id')) for _, item in chunk if isinstance(item, dict)],
+                               User.deleted_at.is_(None))
+        for index, item in chunk:
+            if not isinstance(item, dict) or not item.get('user_id') or not item.get('title'):
+                rejected.append(self._error(index, 'user_id and title are required'))
+                continue
+            if self._int(item['user_id']) not in users:
+                rejected.append(self._error(index, 'User not found'))
+                continue
+            rows.append((index, {'id': str(uuid.uuid4()), 'user_id': self._int(item['user_id']),
+                                 'title': item['title'], 'uri': item.get('uri')}))
+        return rows, rejected
+
+    def _insert_documents(self, rows: List[Prepared]) -> List[dict]:
+        db.session.execute(insert(Document), [row for _, row in rows])
+        return [{'index': index, 'status': 'created', 'id': row['id']} for index, row in rows]
+
+    # conversation import
+
+    def _prepare_conversations(self, chunk):
+        rows, rejected = [], []
+        dicts = [item for _, item in chunk if isinstance(item, dict)]
+        users = self._existing(User.id, [self._int(item.get('user_id')) for item in dicts], User.deleted_at.is_(None))
+        taken = self._existing(Conversation.id, [item.get('id') for item in dicts])
+        for index, item in chunk:
+            try:
+                row = self._conversation_row(item, users, taken)
+            except ValueError as e:
+                rejected.append(self._error(index, str(e)))
+                continue
+            taken.add(row['conversation']['id'])
+            rows.append((index, row))
+        return rows, rejected
+
+    def _conversation_row(self, item, users: set, taken: set) -> dict:
+        if not isinstance(item, dict) or not item.get('user_id'):
+            raise ValueError('Missing required field: user_id')
+        user_id = self._int(item['user_id'])
+        if user_id not in users:
+            raise ValueError(f'User with ID {item["user_id"]} not found')
+        conversation_id = item.get('id') or str(uuid.uuid4())
+        if conversation_id in taken:
+            raise ValueError(f'Conversation with ID {conversation_id} already exists')
+        mode = item.get('mode', 'open_chat')
+        if mode not in ('open_chat', 'rag'):
+            raise ValueError(f'Unsupported mode: {mode}')
+        messages = item.get('messages') or []
+        if not isinstance(messages, list):
+            raise ValueError('messages must be a list')
+
+        now = datetime.utcnow()
+        message_rows = []
+        for position, message in enumerate(messages):
+            if not isinstance(message, dict) or message.get('role') not in ROLES or not message.get('content'):
+                raise ValueError(f'Message {position} needs a role ({" or ".join(ROLES)}) and content')
+            message_rows.append({
+                'conversation_id': conversation_id,
+                'role': message['role'],
+                'content': message['content'],
+                'created_at': self._timestamp(message.get('created_at'), now, f'Message {position}'),
+                'tokens_used': int(message.get('tokens_used') or 0),
+            })
+        first_user = next((m['content'] for m in message_rows if m['role'] == 'user'), '')
+        conversation = new_conversation_fields(user_id, mode, item.get('document_ids'), first_user)
+        conversation.update({
+            'id': conversation_id,
+            'title': item.get('title') or conversation['title'] or None,
+            'created_at': message_rows[0]['created_at'] if message_rows else now,
+            'updated_at': max(m['created_at'] for m in message_rows) if message_rows else now,
+        })
+        return {'conversation': conversation, 'messages': message_rows}
+
+    def _insert_conversations(self, rows: List[Prepared]) -> List[dict]:
+        db.session.execute(insert(Conversation), [row['conversation'] for _, row in rows])
+        messages = [message for _, row in rows for message in row['messages']]
+        if messages:
+            db.session.execute(insert(Message), messages)
+        return [{'index': index, 'status': 'imported', 'id': row['conversation']['id'], 'messages': len(row['messages'])}
+                for index, row in rows]
+
+    # deletes
+
+    def _prepare_deletes(self, chunk):
+        rows, rejected = [], []
+        found = self._existing(Conversation.id, [item for _, item in chunk if isinstance(item, str)],
+                               Conversation.deleted_at.is_(None))
+        for index, item in chunk:
+            if not isinstance(item, str) or item not in found:
+                rejected.append({'index': index, 'status': 'not_found', 'id': item})
+                continue
+            found.discard(item)  # an id listed twice is deleted once
+            rows.append((index, {'id': item}))
+        return rows, rejected
+
+    def _delete_conversations(self, rows: List[Prepared]) -> List[dict]:
+        job = get_deletion_service().stage_conversations([row['id'] for _, row in rows])
+        if job is None:
+            raise ValueError('Conversation not found')
+        return [{'index': index, 'status': 'deleted', 'id': row['id'], 'job_id': job.id} for index, row in rows]
+
+    # parsing
+
+    @staticmethod
+    def _int(value) -> Optional[int]:
+        try:
+            return int(value)
+        except (TypeError, ValueError):
+            return None
+
+    @staticmethod
+    def _timestamp(value, default: datetime, what: str) -> datetime:
+        if value is None:
+            return default
+        try:
+            parsed = datetime.fromisoformat(str(value).replace('Z', '+00:00'))
+        except ValueError:
+            raise ValueError(f'{what}: invalid created_at {value!r}')
+        # stored naive in utc like every other timestamp
+        return parsed.astimezone(timezone.utc).replace(tzinfo=None) if parsed.tzinfo else parsed
+
+
+@process_singleton
+def get_bulk_service() -> BulkService:
+    return BulkService()
@@ -0,0 +1,111 @@
+import re
+from dataclasses import dataclass
+from typing import Dict, List, Optional
+
+from app.config import Config
+from app.models import Conversation, Message
+
+MESSAGE_OVERHEAD_TOKENS = 4  # role and separators added by chat templates
+SENTENCE_END = re.compile(r'(?<=[.!?])\s')
+
+
+def estimate_tokens(text: Optional[str]) -> int:
+    """Cheap token estimate (~4 characters per token for English BPE vocabularies)"""
+    if not text:
+        return 0
+    return (len(text) + 3) // 4
+
+
+@dataclass
+class ContextWindow:
+    history: List[Dict[str, str]]
+    summary: Optional[str]
+    summary_upto_id: int
+    summary_changed: bool = False
+
+
+class ContextWindowBuilder:
+    """
+    Builds the prompt history for a turn under a token budget.
+    Only the newest messages are fetched, newest first and a page at a time, until the
+    budget is spent. Messages that fall out of the window are folded once into a rolling
+    summary cached on the conversation (summary, summary_upto_id), so the per-turn cost
+    stays roughly constant however long the chat gets.
+    """
+
+    def __init__(self, token_budget: int = None, summary_budget: int = None, page_size: int = None):
+        self.token_budget = token_budget or Config.CONTEXT_TOKEN_BUDGET
+        self.summary_budget = summary_budget or Config.SUMMARY_TOKEN_BUDGET
+        self.page_size = page_size or Config.CONTEXT_PAGE_SIZE
+
+    def build(self, conversation: Conversation, user_message: str) -> ContextWindow:
+        summary = conversation.summary
+        summary_upto_id = conversation.summary_upto_id or 0
+        # the summary has a fixed reservation so the window doesn't shrink as the summary grows
+        remaining = (self.token_budget - self.summary_budget
+                     - estimate_tokens(user_message) - MESSAGE_OVERHEAD_TOKENS)
+
+        window = []  # newest first
+        cutoff_id = None  # newest message that did not fit
+        before_id = None
+        while cutoff_id is None:
+            query = Message.query.with_entities(Message.id, Message.role, Message.content).filter(
+                Message.conversation_id == conversation.id,
+                Message.id > summary_upto_id
+            )
+            if before_id is not None:
+                query = query.filter(Message.id < before_id)
+            page = query.order_by(Message.id.desc()).limit(self.page_size).all()
+            for row in page:
+                cost = estimate_tokens(row.content) + MESSAGE_OVERHEAD_TOKENS
+                if cost > remaining:
+                    cutoff_id = row.id
+                    break
+                remaining -= cost
+                window.append(row)
+            if len(page) < self.page_size:
+                break
+            before_id = page[-1].id
+
+        changed = False
+        if cutoff_id is not None:
+            summary = self._fold(conversation.id, summary, summary_upto_id, cutoff_id)
+            summary_upto_id = cutoff_id
+            changed = True
+
+        history = []
+        if summary:
+            history.append({"role": "system", "content": f"Summary of the earlier conversation:\n{summary}"})
+        history.extend({"role": row.role, "content": row.content} for row in reversed(window))
+        history.append({"role": "user", "content": user_message})
+        return ContextWindow(history, summary, summary_upto_id, changed)
+
+    def _fold(self, conversation_id: str, summary: Optional[str], after_id: int, upto_id: int) -> str:
+        """Append a line per message in (after_id, upto_id] to the summary and keep it within budget"""
+        lines = summary.split("\n") if summary else []
+        last_id = after_id
+        while True:
+            page = Message.query.with_entities(Message.id, Message.role, Message.content).filter(
+                Message.conversation_id == conversation_id,
+                Message.id > last_id,
+                Message.id <= upto_id
+            ).order_by(Message.id).limit(self.page_size).all()
+            for row in page:
+                lines.append(f"{row.role}: {self._gist(row.content)}")
+            if len(page) < self.page_size:
+                break
+            last_id = page[-1].id
+
+        # oldest lines go first when the summary outgrows its budget
+        total = sum(estimate_tokens(line) + 1 for line in lines)
+        while lines and total > self.summary_budget:
+            total -= estimate_tokens(lines.pop(0)) + 1
+        return "\n".join(lines)
+
+    @staticmethod
+    def _gist(content: str) -> str:
+        """First sentence of a message, truncated"""
+        text = " ".join(content.split())
+        first = SENTENCE_END.split(text, 1)[0]
+        limit = Config.SUMMARY_LINE_CHARS
+        return first if len(first) <= limit else first[:limit - 3].rstrip() + "..."
@@ -2,123 +2,328 @@ import uuid
 from datetime import datetime
 from app.models import Conversation, Message, Document
 from app import db
+from app.config import Config
+from flask import current_app
+from sqlalchemy import and_, or_, select
+from sqlalchemy.orm import selectinload
 from .llm_service import LLMService
+from .retrieval_service import RetrievalService
+from .context_window import ContextWindowBuilder
+from .rate_limiter import Permit, get_rate_limiter
+from .entity_cache import cached, get_entity_cache
+from .prompt_state import get_prompt_states
+from .deletion_service import get_deletion_service
+from .archive_service import get_archive_service
+from .turn_writer import TurnWrite, commit_turns, get_group_writer, new_conversation_fields
+from app.utils.pagination import keyset_page
+from app.utils.db_profiles import read_session
+from app.utils.tracing import span
+from app.utils.lazy import process_singleton
 import json
+from dataclasses import dataclass, field
+from typing import Any, Dict, Iterator, List, Optional
+
+@dataclass
+class Turn:
+    """Everything one chat turn needs between reading history and persisting the reply"""
+    conversation_id: str
+    user_message: str
+    mode: str
+    conversation_history: List[Dict[str, str]]
+    context: Optional[str] = None
+    user_id: Optional[int] = None
+    document_ids: Optional[list] = None
+    is_new: bool = False
+    summary: Optional[str] = None
+    summary_upto_id: Optional[int] = None  # set when the rolling summary changed this turn
+    user_created_at: datetime = field(default_factory=datetime.utcnow)
+
 
 class ConversationService:
     def __init__(self):
         self.llm_service = LLMService()
+        self.retrieval_service = RetrievalService()
+        self.context_builder = ContextWindowBuilder()
+        self.rate_limiter = get_rate_limiter()
+        self.prompt_states = get_prompt_states()
+        self.archive_service = get_archive_service()
     
     def create_conversation(self, user_id: int, first_message: str, mode: str = 'open_chat', document_ids: list = None) -> dict:
-        """Create a new conversation with the first message"""
+        """Create a new conversation with the first message, raises RateLimitExceeded when the user is over quota"""
+        with self.rate_limiter.admit(user_id) as permit:
+            turn = self.prepare_new_conversation(user_id, first_message, mode, document_ids)
+            assistant_reply, tokens_used = self.llm_service.get_response(turn.conversation_history, turn.mode, turn.context)
+            permit.charge(tokens_used)
+        return self.complete_turn(turn, assistant_reply, tokens_used)['conversation']
+    
+    def add_message_to_conversation(self, conversation_id: str, user_message: str, view: str = 'full') -> dict:
+        """
+        Add a new message to an existing conversation
+        view='full' returns the conversation with every message, view='delta' only the new user/assistant pair
+        """
+        with self.rate_limiter.admit(self.conversation_owner(conversation_id)) as permit:
+            turn = self.prepare_turn(conversation_id, user_message)
+            assistant_reply, tokens_used = self.llm_service.get_response(turn.conversation_history, turn.mode, turn.context)
+            permit.charge(tokens_used)
+        return self.complete_turn(turn, assistant_reply, tokens_used, view)['conversation']
+
+    def prepare_new_conversation(self, user_id: int, first_message: str, mode: str = 'open_chat', document_ids: list = None) -> Turn:
+        """Read phase of a new conversation: validate documents and retrieve RAG context, nothing is written"""
         conversation_id = str(uuid.uuid4())
-        document_ids_json = json.dumps(document_ids) if document_ids else None
-        
-        # conversation creation
-        conversation = Conversation(
-            id=conversation_id,
-            user_id=user_id,
-            mode=mode,
-            document_ids=document_ids_json,
-            title=first_message[:50] + "..." if len(first_message) > 50 else first_message
-        )
-        db.session.add(conversation)
-        
-        # user message addition check
-        user_message = Message(
-            conversation_id=conversation_id,
-            content=first_message,
-            role='user'
-        )
-        db.session.add(user_message)
-        
-        # assistant response
+        # assistant response context
         context = None
         if mode == 'rag' and document_ids:
-            docs = Document.query.filter(Document.id.in_(document_ids)).all()
+            docs = Document.query.filter(Document.id.in_(document_ids), Document.deleted_at.is_(None)).all()
             if len(docs) != len(document_ids):
                 missing = set(document_ids) - {d.id for d in docs}
                 raise ValueError(f"Documents not found: {', '.join(missing)}")
-            context = self.llm_service.simulate_rag_retrieval(first_message, document_ids)
-        
-        conversation_history = [{"role": "user", "content": first_message}]
-        assistant_reply, tokens_used = self.llm_service.get_response(conversation_history, mode, context)
-        
-        # assistant message addition
-        assistant_message = Message(
+            context = self._rag_context(conversation_id, first_message, document_ids)
+            db.session.rollback()
+
+        return Turn(
             conversation_id=conversation_id,
-            content=assistant_reply,
-            role='assistant',
-            tokens_used=tokens_used
+            user_message=first_message,
+            mode=mode,
+            conversation_history=[{"role": "user", "content": first_message}],
+            context=context,
+            user_id=user_id,
+            document_ids=document_ids,
+            is_new=True
         )
-        db.session.add(assistant_message)
-        
-        db.session.commit()
-        
-        return conversation.to_dict(include_messages=True)
-    
-    def add_message_to_conversation(self, conversation_id: str, user_message: str) -> dict:
-        """Add a new message to an existing conversation"""
-        conversation = Conversation.query.get(conversation_id)
-        if not conversation:
+
+    def conversation_owner(self, conversation_id: str) -> int:
+        """Id of the user a live conversation belongs to, admission is decided on it before the read phase"""
+        user_id = db.session.scalar(select(Conversation.user_id).where(
+            Conversation.id == conversation_id, Conversation.deleted_at.is_(None)))
+        if user_id is None:
             raise ValueError(f"Conversation with ID {conversation_id} not found")
-        
-        # user message addition
-        user_msg = Message(
-            conversation_id=conversation_id,
-            content=user_message,
-            role='user'
-        )
-        db.session.add(user_msg)
-        
-        # conversation history fetch
-        messages = Message.query.filter_by(conversation_id=conversation_id).order_by(Message.created_at).all()
-        conversation_history = [{"role": msg.role, "content": msg.content} for msg in messages]
-        
+        return user_id
+
+    def prepare_turn(self, conversation_id: str, user_message: str) -> Turn:
+        """Read phase of a turn: load history and RAG context, the user message is only persisted with the reply"""
+        with span('load_history'):
+            conversation = Conversation.query.filter_by(id=conversation_id, deleted_at=None).first()
+            if not conversation:
+                raise ValueError(f"Conversation with ID {conversation_id} not found")
+            if conversation.archived_at is not None:
+                # the conversation is active again: its messages go back into the table
+                self.archive_service.restore(conversation_id)
+                db.session.refresh(conversation)
+
+            # newest history that fits the token budget, older turns come from the rolling summary
+            window = self.context_builder.build(conversation, user_message)
+
         # context if RAG mode fetch
         context = None
         if conversation.mode == 'rag' and conversation.document_ids:
             document_ids = json.loads(conversation.document_ids)
-            context = self.llm_service.simulate_rag_retrieval(user_message, document_ids)
-        
-        # assistant response fetch
-        assistant_reply, tokens_used = self.llm_service.get_response(conversation_history, conversation.mode, context)
-        
-        # assistant message addition
-        assistant_msg = Message(
+            context = self._rag_context(conversation_id, user_message, document_ids)
+
+        # read phase is over, release the connection before the (slow) LLM call
+        db.session.rollback()
+
+        return Turn(
             conversation_id=conversation_id,
-            content=assistant_reply,
-            role='assistant',
-            tokens_used=tokens_used
+            user_message=user_message,
+            mode=conversation.mode,
+            conversation_history=window.history,
+            context=context,
+            user_id=conversation.user_id,
+            summary=window.summary,
+            summary_upto_id=window.summary_upto_id if window.summary_changed else None
         )
-        db.session.add(assistant_msg)
-    
-        conversation.updated_at = datetime.utcnow()
-        db.session.commit()
-        
-        return conversation.to_dict(include_messages=True)
-    
-    def get_user_conversations(self, user_id: int) -> list:
-        """Get all conversations for a user"""
-        conversations = Conversation.query.filter_by(user_id=user_id).order_by(Conversation.updated_at.desc()).all()
-        return [conv.to_dict() for conv in conversations]
+
+    def _rag_context(self, conversation_id: str, query: str, document_ids: list) -> str:
+        """
+        Retrieve the most relevant chunks of the conversation's documents, never indexes on the read path
+        A follow-up close to the question the current context was retrieved for reuses it (prompt state)
+        """
+        with span('retrieval'):
+            if self.prompt_states is None:
+                return self._retrieve_context(query, document_ids)
+            query_vector = self.retrieval_service.embed_query(query)
+            key = (tuple(document_ids), self.retrieval_service.generations(document_ids))
+            context = self.prompt_states.reuse(conversation_id, key, query_vector)
+            if context is None:
+                context = self._retrieve_context(query, document_ids, query_vector)
+                self.prompt_states.remember(conversation_id, key, query_vector, context)
+            return context
+
+    def _retrieve_context(self, query: str, document_ids: list, query_vector=None) -> str:
+        context = self.retrieval_service.build_context(query, document_ids, query_vector=query_vector)
+        if context is None:
+            # documents not (yet) ingested, e.g. remote uris, keep the simulated context
+            context = self.llm_service.simulate_rag_retrieval(query, document_ids)
+        return context
+
+    def complete_turn(self, turn: Turn, assistant_reply: str, tokens_used: int, view: str = 'full') -> dict:
+        """
+        Write phase of a turn: persist user and assistant messages in a single transaction
+        With DB_DURABILITY='group' the turn is handed to the group-commit writer and this
+        returns once the shared commit holding it is done.
+        Returns {'conversation': payload for view, 'user_message': dict, 'assistant_message': dict}
+        """
+        write = TurnWrite(
+            conversation_id=turn.conversation_id,
+            user_message=turn.user_message,
+            user_created_at=turn.user_created_at,
+            assistant_reply=assistant_reply,
+            tokens_used=tokens_used,
+            new_conversation=new_conversation_fields(turn.user_id, turn.mode, turn.document_ids, turn.user_message)
+            if turn.is_new else None,
+            summary=turn.summary,
+            summary_upto_id=turn.summary_upto_id
+        )
+        with span('persist'):
+            if Config.DB_DURABILITY == 'group':
+                written = get_group_writer(current_app._get_current_object()).write(write)
+            else:
+                written = commit_turns(db.session, [write])[0]
+
+        with span('load_conversation'):
+            if view == 'delta':
+                payload = db.session.get(Conversation, turn.conversation_id).to_dict()
+                payload['messages'] = [written['user_message'], written['assistant_message']]
+            else:
+                payload = self._load_with_messages(turn.conversation_id).to_dict(include_messages=True)
+        written['conversation'] = payload
+        return written
+
+    def stream_message_to_conversation(self, conversation_id: str, user_message: str) -> Iterator[Dict[str, Any]]:
+        """
+        Add a new message to an existing conversation and stream the assistant reply
+        Yields {'event': name, 'data': payload} with 'delta' events followed by a final 'done' event
+        """
+        permit = self.rate_limiter.admit(self.conversation_owner(conversation_id))
+        try:
+            turn = self.prepare_turn(conversation_id, user_message)
+            chunks = self.llm_service.stream_response(turn.conversation_history, turn.mode, turn.context)
+        except Exception:
+            permit.release()
+            raise
+        return self._stream_assistant_reply(turn, chunks, permit)
+
+    def _stream_assistant_reply(self, turn: Turn, chunks: Iterator[Dict[str, Any]], permit: Permit) -> Iterator[Dict[str, Any]]:
+        """Relay provider chunks and persist the turn once the stream ends, the permit is held until then"""
+        parts = []
+        tokens_used = 0
+        with permit:
+            for chunk in chunks:
+                if 'delta' in chunk:
+                    parts.append(chunk['delta'])
+                    yield {'event': 'delta', 'data': {'content': chunk['delta']}}
+                elif 'tokens_used' in chunk:
+                    tokens_used = chunk['tokens_used'] or 0
+            permit.charge(tokens_used)
+
+        result = self.complete_turn(turn, "".join(parts).strip(), tokens_used)
+
+        yield {'event': 'done', 'data': {
+            'conversation_id': turn.conversation_id,
+            'user_message_id': result['user_message']['id'],
+            'message': result['assistant_message']
+        }}
+
+    def get_user_conversations(self, user_id: int, fields: list = None) -> list:
+        """Get all conversations for a user (served by the read replica when configured)"""
+        conversations = read_session().query(Conversation).filter_by(user_id=user_id, deleted_at=None).order_by(
+            Conversation.updated_at.desc()).all()
+        return [conv.to_dict(fields=fields) for conv in conversations]
+
+    def page_user_conversations(self, user_id: int, cursor: str = None, limit: int = 50, fields: list = None) -> dict:
+        """Most recently updated conversations first, keyset paginated on (updated_at, id)"""
+        query = read_session().query(Conversation).filter_by(user_id=user_id, deleted_at=None)
+        conversations, next_cursor = keyset_page(query, Conversation.updated_at, Conversation.id, cursor, limit)
+        return {
+            'items': [conv.to_dict(fields=fields) for conv in conversations],
+            'next_cursor': next_cursor
+        }
 
     def get_conversation_by_id(self, conversation_id: str) -> dict:
-        """Get a specific conversation with all messages"""
-        conversation = Conversation.query.get(conversation_id)
-        if not conversation:
+        """
+        Get a specific conversation with all messages, through the entity cache when enabled
+        (its fills read the primary, a lagging replica could cache a stale payload) and
+        otherwise from the read replica when configured
+        """
+        if get_entity_cache() is not None:
+            payload = cached('conversation', conversation_id, lambda: self._conversation_payload(conversation_id))
+        else:
+            payload = self._conversation_payload(conversation_id, read_session())
+        if payload is None:
+            raise ValueError(f"Conversation with ID {conversation_id} not found")
+        return payload
+
+    def _conversation_payload(self, conversation_id: str, session=None) -> Optional[dict]:
+        with span('load_conversation'):
+            conversation = self._load_with_messages(conversation_id, session)
+            if conversation is None:
+                return None
+            if conversation.archived_at is None:
+                return conversation.to_dict(include_messages=True)
+            # rehydrated from the archive file, the table keeps only hot conversations
+            payload = conversation.to_dict()
+            payload['messages'] = [m.to_dict() for m in self.archive_service.messages(conversation_id, conversation.messages)]
+            return payload
+
+    def _load_with_messages(self, conversation_id: str, session=None) -> Optional[Conversation]:
+        """Conversation with its messages eagerly loaded in one extra query"""
+        session = session or db.session
+        return session.query(Conversation).options(selectinload(Conversation.messages)).filter_by(
+            id=conversation_id, deleted_at=None).first()
+
+    def list_messages(self, conversation_id: str, after: Optional[int] = None, limit: int = 50) -> dict:
+        """
+        Page of messages in chronological order, keyset paginated on (created_at, id)
+        Returns {'messages': [...], 'next_cursor': id to pass as after, or None on the last page}
+        """
+        conversation = Conversation.query.with_entities(Conversation.archived_at).filter_by(
+            id=conversation_id, deleted_at=None).first()
+        if conversation is None:
             raise ValueError(f"Conversation with ID {conversation_id} not found")
-        return conversation.to_dict(include_messages=True)
+        if conversation.archived_at is not None:
+            return self._list_archived_messages(conversation_id, after, limit)
+
+        query = Message.query.filter(Message.conversation_id == conversation_id)
+        if after is not None:
+            anchor = Message.query.with_entities(Message.created_at).filter_by(
+                id=after, conversation_id=conversation_id).first()
+            if anchor is None:
+                raise ValueError(f"Message with ID {after} not found in conversation {conversation_id}")
+            query = query.filter(or_(
+                Message.created_at > anchor.created_at,
+                and_(Message.created_at == anchor.created_at, Message.id > after)
+            ))
+        # one extra row tells whether another page exists
+        rows = query.order_by(Message.created_at, Message.id).limit(limit + 1).all()
+        page = rows[:limit]
+        return {
+            'messages': [message.to_dict() for message in page],
+            'next_cursor': page[-1].id if len(rows) > limit else None
+        }
+
+    def _list_archived_messages(self, conversation_id: str, after: Optional[int], limit: int) -> dict:
+        """list_messages for an archived conversation, paged over its archive file in memory"""
+        live = Message.query.filter(Message.conversation_id == conversation_id).all()
+        messages = self.archive_service.messages(conversation_id, live)
+        start = 0
+        if after is not None:
+            start = next((i + 1 for i, m in enumerate(messages) if m.id == after), None)
+            if start is None:
+                raise ValueError(f"Message with ID {after} not found in conversation {conversation_id}")
+        page = messages[start:start + limit]
+        return {
+            'messages': [message.to_dict() for message in page],
+            'next_cursor': page[-1].id if len(messages) > start + limit else None
+        }
 
-    def delete_conversation(self, conversation_id: str) -> bool:
-        """Delete a conversation and all its messages"""
-        conversation = Conversation.query.get(conversation_id)
-        if not conversation:
-            return False
+    def delete_conversation(self, conversation_id: str) -> Optional[dict]:
+        """
+        Delete a conversation and all its messages: it is soft deleted right away and its
+        messages are purged in batches by the returned DeletionJob (None when not found)
+        """
+        return get_deletion_service().delete_conversation(conversation_id)
 
-        # try delete all messages first and then delete conversation
-        Message.query.filter_by(conversation_id=conversation_id).delete()
 
-        db.session.delete(conversation)
-        db.session.commit()
-        return True
+@process_singleton
+def get_conversation_service() -> ConversationService:
+    return ConversationService()
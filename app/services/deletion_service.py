@@ -0,0 +1,251 @@
+import json
+import threading
+import time
+import uuid
+from concurrent.futures import Future, ThreadPoolExecutor
+from datetime import datetime
+from typing import List, Optional
+
+from sqlalchemy import delete, func, select, update
+
+from app import db
+from app.config import Config
+from app.models import Conversation, DeletionJob, Document, Message, User
+from app.utils.lazy import process_singleton
+from app.utils.metrics import registry
+from .archive_service import ArchiveService, get_archive_service
+from .prompt_state import forget_prompt_state
+from .retrieval_service import RetrievalService
+
+purged_rows_total = registry.counter('purge_rows_total', 'Rows removed by deletion jobs', ['table'])
+purge_batch_seconds = registry.histogram('purge_batch_seconds', 'Time per purge batch transaction', ['table'])
+
+
+class DeletionService:
+    """
+    Deletion in two steps.
+    A delete marks the user or conversations (and a user's documents) deleted_at in one
+    short transaction and records a DeletionJob; reads skip soft-deleted rows from then on.
+    The job is purged on a single background thread: messages go batch_size rows per
+    transaction with a pause in between, so other writers (and SQLite's database-wide
+    lock) get their turn, then conversation rows with their archive files, documents with
+    their vector files and finally the user. Every batch is idempotent, a failed or interrupted job is simply
+    run again ("flask purge" runs every unfinished job).
+    """
+
+    def __init__(self, retrieval_service: RetrievalService = None, batch_size: int = None, pause: float = None,
+                 archive_service: ArchiveService = None):
+        self.retrieval_service = retrieval_service or RetrievalService()
+        self.archive_service = archive_service or get_archive_service()
+        self.batch_size = batch_size or Config.PURGE_BATCH_SIZE
+        self.pause = Config.PURGE_PAUSE_MS / 1000.0 if pause is None else pause
+        self._lock = threading.RLock()  # submit() holds it while lazily building the executor
+        self._executor = None
+        self._inflight = {}  # job_id -> Future
+
+    # request path: soft delete, nothing is purged yet
+
+    def delete_conversation(self, conversation_id: str) -> Optional[dict]:
+        """Soft delete a live conversation, returns its job or None when there is nothing to delete"""
+        try:
+            job = self.stage_conversations([conversation_id])
+            if job is None:
+                return None
+            db.session.commit()
+            return job.to_dict()
+        except Exception:
+            db.session.rollback()
+            raise
+
+    def stage_conversations(self, conversation_ids: List[str]) -> Optional[DeletionJob]:
+        """Mark live conversations deleted and add their job to the session, the caller commits"""
+        ids = list(dict.fromkeys(conversation_ids))
+        # a single id compares with == so the entity cache invalidates just that conversation
+        match = Conversation.id == ids[0] if len(ids) == 1 else Conversation.id.in_(ids)
+        marked = db.session.execute(
+            update(Conversation).where(match, Conversation.deleted_at.is_(None)).values(deleted_at=datetime.utcnow())
+        ).rowcount
+        if not marked:
+            return None
+        for conversation_id in ids:
+            forget_prompt_state(conversation_id)
+        job = DeletionJob(
+            id=str(uuid.uuid4()), kind='conversations', target_ids=json.dumps(ids),
+            conversations_total=marked,
+            messages_total=db.session.scalar(select(func.count(Message.id)).where(Message.conversation_id.in_(ids)))
+        )
+        db.session.add(job)
+        return job
+
+    def delete_user(self, user_id: int) -> Optional[dict]:
+        """Soft delete a live user with their conversations and documents, returns the job or None"""
+        try:
+            now = datetime.utcnow()
+            marked = db.session.execute(
+                update(User).where(User.id == user_id, User.deleted_at.is_(None)).values(deleted_at=now)
+            ).rowcount
+            if not marked:
+                db.session.rollback()
+                return None
+            db.session.execute(update(Conversation).where(Conversation.user_id == user_id,
+                                                          Conversation.deleted_at.is_(None)).values(deleted_at=now))
+            db.session.execute(update(Document).where(Document.user_id == user_id,
+                                                      Document.deleted_at.is_(None)).values(deleted_at=now))
+            job = DeletionJob(
+                id=str(uuid.uuid4()), kind='user', target_ids=json.dumps([user_id]),
+                conversations_total=db.session.scalar(
+                    select(func.count(Conversation.id)).where(Conversation.user_id == user_id)),
+                messages_total=db.session.scalar(
+                    select(func.count(Message.id)).join(Conversation, Message.conversation_id == Conversation.id)
+                    .where(Conversation.user_id == user_id)),
+                documents_total=db.session.scalar(select(func.count(Document.id)).where(Document.user_id == user_id))
+            )
+            db.session.add(job)
+            db.session.commit()
+            return job.to_dict()
+        except Exception:
+            db.session.rollback()
+            raise
+
+    def get_job(self, job_id: str) -> Optional[dict]:
+        job = db.session.get(DeletionJob, job_id)
+        return job.to_dict() if job else None
+
+    # background purge
+
+    def _purger(self) -> ThreadPoolExecutor:
+        if self._executor is None:
+            with self._lock:
+                if self._executor is None:
+                    # one job at a time, purges are throttled rather than parallel
+                    self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='purge')
+        return self._executor
+
+    def submit(self, app, job_id: str) -> Future:
+        """Queue a job for purging, a job already queued is not queued twice"""
+        with self._lock:
+            future = self._inflight.get(job_id)
+            if future is not None and not future.done():
+                return future
+            future = self._purger().submit(self._run, app, job_id)
+            self._inflight[job_id] = future
+        future.add_done_callback(lambda f: self._forget(job_id, f))
+        return future
+
+    def _forget(self, job_id: str, future: Future):
+        with self._lock:
+            if self._inflight.get(job_id) is future:
+                del self._inflight[job_id]
+
+    def wait(self, job_id: str, timeout: float = None):
+        future = self._inflight.get(job_id)
+        if future is not None:
+            return future.result(timeout)
+
+    def _run(self, app, job_id: str) -> str:
+        with app.app_context():
+            try:
+                return self.purge(job_id)
+            finally:
+                db.session.remove()
+
+    def unfinished_jobs(self) -> List[str]:
+        return list(db.session.scalars(
+            select(DeletionJob.id).where(DeletionJob.status != 'done').order_by(DeletionJob.created_at)))
+
+    def purge(self, job_id: str) -> str:
+        """Purge one job synchronously, returns its final status"""
+        job = db.session.get(DeletionJob, job_id)
+        if job is None:
+            raise ValueError(f"Deletion job {job_id} not found")
+        if job.status == 'done':
+            return job.status
+        kind, target_ids = job.kind, json.loads(job.target_ids)
+        job.status = 'running'
+        job.error = None
+        db.session.commit()
+
+        try:
+            if kind == 'user':
+                self._purge_user(job_id, target_ids[0])
+            else:
+                for conversation_id in target_ids:
+                    self._purge_conversation(job_id, conversation_id)
+            status, error = 'done', None
+        except Exception as e:
+            db.session.rollback()
+            status, error = 'failed', str(e)
+        db.session.execute(update(DeletionJob).where(DeletionJob.id == job_id).values(
+            status=status, error=error, finished_at=datetime.utcnow() if status == 'done' else None))
+        db.session.commit()
+        return status
+
+    def _purge_user(self, job_id: str, user_id: int):
+        after = ''
+        while True:
+            conversation_ids = list(db.session.scalars(
+                select(Conversation.id).where(Conversation.user_id == user_id, Conversation.id > after)
+                .order_by(Conversation.id).limit(self.batch_size)))
+            db.session.rollback()
+            for conversation_id in conversation_ids:
+                # also one that raced in after the soft delete, the user goes either way
+                self._purge_conversation(job_id, conversation_id, soft_deleted_only=False)
+            if len(conversation_ids) < self.batch_size:
+                break
+            after = conversation_ids[-1]
+
+        while True:
+            document_ids = list(db.session.scalars(
+                select(Document.id).where(Document.user_id == user_id).order_by(Document.id).limit(self.batch_size)))
+            db.session.rollback()
+            if not document_ids:
+                break
+            # index files first: a crash in between leaves rows that a rerun cleans up
+            for document_id in document_ids:
+                self.retrieval_service.store.delete(document_id)
+            self._batch('document', job_id, delete(Document).where(Document.id.in_(document_ids)), 'documents_deleted')
+
+        self._batch('user', job_id, delete(User).where(User.id == user_id, User.deleted_at.isnot(None)), None)
+
+    def _purge_conversation(self, job_id: str, conversation_id: str, soft_deleted_only: bool = True):
+        if soft_deleted_only and db.session.scalar(select(Conversation.id).where(
+                Conversation.id == conversation_id, Conversation.deleted_at.is_(None))):
+            return  # live, never purge messages a reader can still see
+        while True:
+            message_ids = list(db.session.scalars(
+                select(Message.id).where(Message.conversation_id == conversation_id).order_by(Message.id)
+                .limit(self.batch_size)))
+            if not message_ids:
+                break
+            # conversation_id == x keeps the entity cache invalidation to this conversation
+            self._batch('message', job_id, delete(Message).where(Message.conversation_id == conversation_id,
+                                                                 Message.id.in_(message_ids)), 'messages_deleted')
+        self.archive_service.remove(conversation_id)
+        # a user's conversations are only known here, a soft-deleted one was forgotten already
+        forget_prompt_state(conversation_id)
+        statement = delete(Conversation).where(Conversation.id == conversation_id)
+        if soft_deleted_only:
+            statement = statement.where(Conversation.deleted_at.isnot(None))
+        self._batch('conversation', job_id, statement, 'conversations_deleted')
+
+    def _batch(self, table: str, job_id: str, statement, counter: Optional[str]):
+        """One short transaction: the delete and the job's progress, then make way for other writers"""
+        started = time.perf_counter()
+        try:
+            removed = db.session.execute(statement).rowcount
+            if counter is not None and removed:
+                column = getattr(DeletionJob, counter)
+                db.session.execute(update(DeletionJob).where(DeletionJob.id == job_id).values({column: column + removed}))
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            raise
+        purge_batch_seconds.labels(table=table).observe(time.perf_counter() - started)
+        purged_rows_total.labels(table=table).inc(removed)
+        if self.pause:
+            time.sleep(self.pause)
+
+
+@process_singleton
+def get_deletion_service() -> DeletionService:
+    return DeletionService()
@@ -0,0 +1,210 @@
+import json
+import threading
+import uuid
+from collections import Counter
+from typing import Callable, Optional
+
+from flask import current_app, has_app_context
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+from sqlalchemy.sql import operators
+from sqlalchemy.sql.elements import BinaryExpression, BindParameter, BooleanClauseList
+
+from app.models import Conversation, Document, Message, User
+from app.utils.db import db
+from app.utils.metrics import registry
+from app.utils.shared_store import get_shared_store
+from .response_cache import MemoryCacheBackend
+
+lookups_total = registry.counter('entity_cache_lookups_total', 'Entity cache lookups', ['kind', 'result'])
+invalidations_total = registry.counter('entity_cache_invalidations_total', 'Cached entities invalidated by commits', ['kind'])
+
+# model -> (cache kind, column holding the id of the cached entity it belongs to);
+# a message belongs to its conversation's payload
+TRACKED = {
+    User: ('user', User.id),
+    Document: ('document', Document.id),
+    Conversation: ('conversation', Conversation.id),
+    Message: ('conversation', Message.conversation_id),
+}
+
+
+class EntityCache:
+    """
+    Read-through cache of serialized User, Document and Conversation payloads.
+    Keys carry a version token per entity (and one per kind) kept in the shared store, a
+    commit touching an entity replaces its token so older entries are never read again.
+    Entries live in an in-process LRU and, optionally, in the shared store for other
+    workers. Versions must be shared for invalidation to reach every worker process, so
+    run more than one process only with SHARED_STORE_URL set.
+    """
+
+    def __init__(self, store=None, local: MemoryCacheBackend = None, shared: bool = False, ttl: float = 300,
+                 prefix: str = 'entity:'):
+        self.store = store or get_shared_store()
+        self.local = local if local is not None else MemoryCacheBackend(4096, ttl)
+        self.shared = shared
+        self.ttl = ttl
+        self.prefix = prefix
+        self._lock = threading.Lock()
+        self._counts = Counter()  # (kind, 'hit' | 'miss')
+
+    @staticmethod
+    def _decode(raw) -> str:
+        return raw.decode() if isinstance(raw, bytes) else raw
+
+    def _version(self, kind: str, entity_id) -> str:
+        kind_token = self.store.get(f"{self.prefix}v:{kind}")
+        entity_token = self.store.get(f"{self.prefix}v:{kind}:{entity_id}")
+        return f"{self._decode(kind_token) or 0}.{self._decode(entity_token) or 0}"
+
+    def get_or_load(self, kind: str, entity_id, load: Callable[[], Optional[dict]], cacheable: bool = True) -> Optional[dict]:
+        """
+        Cached payload of an entity, load() fills a miss. A None payload (missing row) is not
+        cached. cacheable=False serves the load without storing it, for callers whose
+        transaction may predate the latest commit.
+        """
+        key = f"{kind}:{entity_id}:{self._version(kind, entity_id)}"
+        raw = self.local.get(key)
+        if raw is None and self.shared:
+            raw = self.store.get(self.prefix + key)
+            if raw is not None:
+                raw = self._decode(raw)
+                self.local.set(key, raw)
+        if raw is not None:
+            self._count(kind, 'hit')
+            return json.loads(raw)
+
+        self._count(kind, 'miss')
+        payload = load()
+        if payload is not None and cacheable:
+            # stored under the version read before loading, a commit in between makes it unreachable
+            raw = json.dumps(payload)
+            self.local.set(key, raw)
+            if self.shared:
+                self.store.set(self.prefix + key, raw, px=int(self.ttl * 1000))
+        return payload
+
+    def invalidate(self, kind: str, entity_id=None):
+        """Drop one entity, or every entity of kind when entity_id is None (bulk statements)"""
+        key = f"{self.prefix}v:{kind}" if entity_id is None else f"{self.prefix}v:{kind}:{entity_id}"
+        # a fresh token rather than a counter: a version that expired and restarted could
+        # otherwise meet an old entry again; it outlives every entry written under it
+        self.store.set(key, uuid.uuid4().hex[:16], px=int(self.ttl * 2000))
+        invalidations_total.labels(kind=kind).inc()
+
+    def _count(self, kind: str, result: str):
+        lookups_total.labels(kind=kind, result=result).inc()
+        with self._lock:
+            self._counts[(kind, result)] += 1
+
+    def stats(self) -> dict:
+        """Hits, misses and hit ratio per kind since this cache was created"""
+        with self._lock:
+            counts = dict(self._counts)
+        stats = {}
+        for kind in sorted({kind for kind, _ in counts}):
+            hits, misses = counts.get((kind, 'hit'), 0), counts.get((kind, 'miss'), 0)
+            stats[kind] = {'hits': hits, 'misses': misses, 'hit_ratio': round(hits / (hits + misses), 4)}
+        return stats
+
+
+def init_entity_cache(app) -> Optional[EntityCache]:
+    """Cache for app stored on the app, None unless ENTITY_CACHE_ENABLED"""
+    if not app.config.get('ENTITY_CACHE_ENABLED'):
+        return None
+    ttl = app.config['ENTITY_CACHE_TTL']
+    cache = EntityCache(local=MemoryCacheBackend(app.config['ENTITY_CACHE_MAX_ENTRIES'], ttl),
+                        shared=app.config['ENTITY_CACHE_SHARED'], ttl=ttl)
+    app.extensions['entity_cache'] = cache
+    return cache
+
+
+def get_entity_cache() -> Optional[EntityCache]:
+    return current_app.extensions.get('entity_cache') if has_app_context() else None
+
+
+def cached(kind: str, entity_id, load: Callable[[], Optional[dict]]) -> Optional[dict]:
+    """Payload through the app's entity cache, or straight from load() when caching is off"""
+    cache = get_entity_cache()
+    if cache is None:
+        return load()
+    if kind == 'user':
+        # ids arrive as path or json strings, key them the way commits report them
+        try:
+            entity_id = int(entity_id)
+        except (TypeError, ValueError):
+            return load()
+    # a request that already read in this transaction may hold a snapshot older than the version
+    return cache.get_or_load(kind, entity_id, load, cacheable=not db.session().in_transaction())
+
+
+def user_payload(user_id) -> Optional[dict]:
+    user = db.session.get(User, user_id)
+    return user.to_dict() if user and user.deleted_at is None else None
+
+
+def document_payload(document_id) -> Optional[dict]:
+    doc = db.session.get(Document, document_id)
+    return doc.to_dict() if doc and doc.deleted_at is None else None
+
+
+# invalidation: entities touched by a flush or an ORM UPDATE/DELETE are collected on the
+# session and their versions replaced once the transaction has committed
+
+def _touched(session) -> set:
+    return session.info.setdefault('entity_cache_touched', set())
+
+
+def _pinned_value(whereclause, column):
+    """x when the criteria include column == x at the top level, otherwise None"""
+    clauses = [whereclause]
+    if isinstance(whereclause, BooleanClauseList) and whereclause.operator is operators.and_:
+        clauses = list(whereclause.clauses)
+    for clause in clauses:
+        if (isinstance(clause, BinaryExpression) and clause.operator is operators.eq
+                and isinstance(clause.right, BindParameter) and clause.left.compare(column.expression)):
+            return clause.right.effective_value
+    return None
+
+
+@event.listens_for(Session, 'after_flush')
+def _collect_flushed(session, flush_context):
+    if get_entity_cache() is None:
+        return
+    touched = _touched(session)
+    for obj in list(session.dirty) + list(session.deleted) + list(session.new):
+        tracked = TRACKED.get(type(obj))
+        # new rows have nothing cached unless they change a parent payload
+        if tracked is None or (obj in session.new and not isinstance(obj, Message)):
+            continue
+        kind, column = tracked
+        touched.add((kind, getattr(obj, column.key)))
+
+
+@event.listens_for(Session, 'do_orm_execute')
+def _collect_bulk(orm_execute_state):
+    if not (orm_execute_state.is_update or orm_execute_state.is_delete) or get_entity_cache() is None:
+        return
+    mapper = orm_execute_state.bind_mapper
+    tracked = TRACKED.get(mapper.class_) if mapper is not None else None
+    if tracked is None:
+        return
+    kind, column = tracked
+    whereclause = orm_execute_state.statement.whereclause
+    entity_id = _pinned_value(whereclause, column) if whereclause is not None else None
+    _touched(orm_execute_state.session).add((kind, entity_id))
+
+
+@event.listens_for(Session, 'after_commit')
+def _invalidate_committed(session):
+    touched = session.info.pop('entity_cache_touched', None)
+    cache = get_entity_cache()
+    if touched and cache is not None:
+        for kind, entity_id in touched:
+            cache.invalidate(kind, entity_id)
+
+
+@event.listens_for(Session, 'after_rollback')
+def _discard_rolled_back(session):
+    session.info.pop('entity_cache_touched', None)
@@ -0,0 +1,144 @@
+import base64
+import json
+import zlib
+from datetime import datetime
+from typing import Iterable, Iterator, Optional, Tuple
+
+from sqlalchemy import and_, or_, select
+
+from app import db
+from app.config import Config
+from app.models import Conversation, Message, User
+from app.utils.lazy import process_singleton
+from app.utils.metrics import registry
+from .archive_service import get_archive_service
+
+exported_lines_total = registry.counter('export_lines_total', 'Lines written by user exports', ['type'])
+
+# (conversation created_at, conversation id, message created_at, message id), the message
+# half is None right after a conversation line
+Position = Tuple[datetime, str, Optional[datetime], Optional[int]]
+
+
+def encode_export_cursor(position: Position) -> str:
+    conv_at, conv_id, msg_at, msg_id = position
+    raw = json.dumps([conv_at.isoformat(), conv_id, msg_at.isoformat() if msg_at else None, msg_id],
+                     separators=(',', ':')).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+
+def decode_export_cursor(cursor: str) -> Position:
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        conv_at, conv_id, msg_at, msg_id = json.loads(raw)
+        return (datetime.fromisoformat(conv_at), conv_id,
+                datetime.fromisoformat(msg_at) if msg_at else None, msg_id)
+    except (ValueError, TypeError):
+        raise ValueError("Invalid cursor")
+
+
+class ExportService:
+    """
+    A user's conversations and messages as NDJSON lines.
+    One query joins conversations to their messages in (created_at, id) order and is read
+    yield_per rows at a time over a server-side cursor where the driver has one, so memory
+    stays flat however long the history is. Every line carries the cursor of its position;
+    passing the last one received resumes the export right after it.
+    """
+
+    def __init__(self, yield_per: int = None, archive_service=None):
+        self.yield_per = yield_per or Config.EXPORT_YIELD_PER
+        self.archive_service = archive_service or get_archive_service()
+
+    def export_user(self, user: User, cursor: Optional[str] = None) -> Iterator[dict]:
+        """Lines of the export, raises ValueError for a malformed cursor before anything is read"""
+        position = decode_export_cursor(cursor) if cursor else None
+        return self._lines(user, position)
+
+    def _lines(self, user: User, position: Optional[Position]) -> Iterator[dict]:
+        if position is None:
+            yield self._line('user', user.to_dict())
+        query = (
+            select(Conversation, Message)
+            .outerjoin(Message, Message.conversation_id == Conversation.id)
+            .where(Conversation.user_id == user.id, Conversation.deleted_at.is_(None))
+            .order_by(Conversation.created_at, Conversation.id, Message.created_at, Message.id)
+            .execution_options(yield_per=self.yield_per)
+        )
+        if position is not None:
+            query = query.where(self._after(position))
+
+        conversations = messages = 0
+        current = position[1] if position is not None else None
+        archived = None  # archived conversation whose file was exported
+        # objects are only weakly held by the session, each batch is released once written
+        for conversation, message in db.session.execute(query):
+            conv_key = (conversation.created_at, conversation.id)
+            if conversation.id != current:
+                current = conversation.id
+                conversations += 1
+                yield self._line('conversation', conversation.to_dict(), (*conv_key, None, None))
+            if conversation.archived_at is not None and conversation.id != archived:
+                # its messages are in the archive file, the joined row has none
+                archived = conversation.id
+                resume = position[2:] if position is not None and position[1] == conversation.id else (None, None)
+                for archived_message in self.archive_service.messages(conversation.id):
+                    if resume[0] is not None and (archived_message.created_at, archived_message.id) <= resume:
+                        continue
+                    messages += 1
+                    yield self._line('message', archived_message.to_dict(),
+                                     (*conv_key, archived_message.created_at, archived_message.id))
+            if message is not None:
+                messages += 1
+                yield self._line('message', message.to_dict(), (*conv_key, message.created_at, message.id))
+        yield {'type': 'end', 'conversations': conversations, 'messages': messages}
+
+    @staticmethod
+    def _after(position: Position):
+        """Rows strictly after position in export order"""
+        conv_at, conv_id, msg_at, msg_id = position
+        later_conversation = or_(
+            Conversation.created_at > conv_at,
+            and_(Conversation.created_at == conv_at, Conversation.id > conv_id)
+        )
+        same_conversation = and_(Conversation.created_at == conv_at, Conversation.id == conv_id)
+        if msg_at is not None:
+            # the message-less row of an archived conversation too, its file resumes after msg_id
+            same_conversation = and_(same_conversation, or_(
+                Message.id.is_(None),
+                Message.created_at > msg_at,
+                and_(Message.created_at == msg_at, Message.id > msg_id)
+            ))
+        return or_(later_conversation, same_conversation)
+
+    @staticmethod
+    def _line(kind: str, data: dict, position: Position = None) -> dict:
+        exported_lines_total.labels(type=kind).inc()
+        line = {'type': kind, 'data': data}
+        if position is not None:
+            line['cursor'] = encode_export_cursor(position)
+        return line
+
+
+def ndjson_bytes(lines: Iterable[dict], gzip: bool = False, flush_every: int = 200) -> Iterator[bytes]:
+    """
+    Encode lines as NDJSON, optionally as one gzip stream. The compressor is sync-flushed
+    every flush_every lines so a client can decode (and record cursors) as data arrives.
+    """
+    if not gzip:
+        for line in lines:
+            yield (json.dumps(line) + "\n").encode()
+        return
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31)  # wbits 31: gzip container
+    for count, line in enumerate(lines, 1):
+        chunk = compressor.compress((json.dumps(line) + "\n").encode())
+        if count % flush_every == 0:
+            chunk += compressor.flush(zlib.Z_SYNC_FLUSH)
+        if chunk:
+            yield chunk
+    yield compressor.flush()
+
+
+@process_singleton
+def get_export_service() -> ExportService:
+    return ExportService()
@@ -0,0 +1,236 @@
+import codecs
+import hashlib
+import multiprocessing
+import os
+import threading
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor
+from datetime import datetime
+from typing import Iterator, List, Optional, Tuple
+
+from app import db
+from app.config import Config
+from app.models import Document
+from app.utils.lazy import process_singleton
+from .retrieval_service import RetrievalService, chunk_words, get_embedder, resolve_local_path
+
+_worker_embedders = {}
+
+
+def _embed_batch(embedder_name: str, dim: int, texts: List[str]):
+    """Runs in an ingestion worker process, the embedder is built once per process"""
+    key = (embedder_name, dim)
+    embedder = _worker_embedders.get(key)
+    if embedder is None:
+        embedder = _worker_embedders[key] = get_embedder(embedder_name, dim)
+    return embedder.embed(texts)
+
+
+def iter_file_words(path: str, block_size: int, on_block=None) -> Iterator[str]:
+    """
+    Stream whitespace separated words from a utf-8 file reading block_size bytes at a time,
+    on_block(raw bytes) sees every block read
+    """
+    decoder = codecs.getincrementaldecoder('utf-8')(errors='replace')
+    carry = ''
+    with open(path, 'rb') as f:
+        while True:
+            block = f.read(block_size)
+            text = carry + decoder.decode(block, final=not block)
+            if not block:
+                yield from text.split()
+                return
+            words = text.split()
+            # the last word may continue in the next block unless the block ended on whitespace
+            if words and not text[-1].isspace():
+                carry = words.pop()
+            else:
+                carry = ''
+            yield from words
+            if on_block:
+                on_block(block)
+
+
+def file_sha256(path: str, block_size: int) -> str:
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(block_size), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+class IngestionService:
+    """
+    Background ingestion of Document.uri into the vector store.
+    Each document is streamed in bounded blocks on a coordinator thread, passages are
+    embedded in batches on a shared process pool, and status/progress is written back to
+    the Document row. Unchanged content (same sha256) is a no-op. The stored hash is the
+    one of the bytes actually indexed, computed while streaming them.
+    """
+
+    def __init__(self, retrieval_service: RetrievalService = None, max_documents: int = None, processes: int = None):
+        self.retrieval_service = retrieval_service or RetrievalService()
+        self.max_documents = max_documents or Config.INGEST_MAX_DOCUMENTS
+        self.processes = Config.INGEST_PROCESSES if processes is None else processes
+        self._lock = threading.RLock()  # submit() holds it while lazily building the pools
+        self._threads = None
+        self._processes = None
+        self._inflight = {}  # document_id -> Future
+        self._rerun = set()  # in flight documents submitted again meanwhile
+
+    def _coordinators(self) -> ThreadPoolExecutor:
+        if self._threads is None:
+            with self._lock:
+                if self._threads is None:
+                    self._threads = ThreadPoolExecutor(max_workers=self.max_documents, thread_name_prefix='ingest')
+        return self._threads
+
+    def _embedding_pool(self) -> Optional[ProcessPoolExecutor]:
+        if self.processes <= 0:
+            return None
+        if self._processes is None:
+            with self._lock:
+                if self._processes is None:
+                    # spawn: forking a threaded web worker can copy held locks into the child
+                    self._processes = ProcessPoolExecutor(max_workers=self.processes,
+                                                          mp_context=multiprocessing.get_context('spawn'))
+        return self._processes
+
+    def submit(self, app, document_id: str) -> Future:
+        """
+        Queue a document for ingestion. One still queued is not queued twice; one being
+        ingested runs once more afterwards (on the same future) so a change made meanwhile
+        is picked up.
+        """
+        with self._lock:
+            future = self._inflight.get(document_id)
+            if future is not None:
+                if future.running():
+                    self._rerun.add(document_id)
+                return future
+            future = self._coordinators().submit(self._run, app, document_id)
+            self._inflight[document_id] = future
+        return future
+
+    def wait(self, document_id: str, timeout: float = None):
+        future = self._inflight.get(document_id)
+        if future is not None:
+            return future.result(timeout)
+
+    def _run(self, app, document_id: str) -> str:
+        with app.app_context():
+            try:
+                while True:
+                    status = self.ingest(document_id)
+                    with self._lock:
+                        if document_id not in self._rerun:
+                            del self._inflight[document_id]
+                            return status
+                        self._rerun.discard(document_id)
+            except BaseException:
+                with self._lock:
+                    self._inflight.pop(document_id, None)
+                    self._rerun.discard(document_id)
+                raise
+            finally:
+                db.session.remove()
+
+    def ingest(self, document_id: str) -> str:
+        """Ingest one document synchronously, returns the final status"""
+        doc = db.session.get(Document, document_id)
+        if not doc or doc.deleted_at is not None:
+            raise ValueError(f"Document with ID {document_id} not found")
+
+        path = resolve_local_path(doc.uri)
+        if not path:
+            return self._fail(doc, f"Cannot read uri {doc.uri!r}: only local paths and file:// uris are supported"
+                              if doc.uri else "Document has no uri")
+
+        try:
+            # cheap pre-check only, the stored hash comes from the indexing pass itself
+            if (doc.status == 'ready' and file_sha256(path, Config.INGEST_READ_BYTES) == doc.content_hash
+                    and self.retrieval_service.is_indexed(doc.id)):
+                return doc.status
+
+            doc.status = 'indexing'
+            doc.progress = 0.0
+            doc.error = None
+            db.session.commit()
+
+            chunk_count, content_hash = self._index_file(doc, path)
+        except Exception as e:
+            db.session.rollback()
+            return self._fail(doc, str(e))
+
+        doc.status = 'ready'
+        doc.progress = 1.0
+        doc.chunk_count = chunk_count
+        doc.content_hash = content_hash
+        doc.indexed_at = datetime.utcnow()
+        db.session.commit()
+        return doc.status
+
+    def _fail(self, doc: Document, error: str) -> str:
+        doc.status = 'failed'
+        doc.error = error
+        db.session.commit()
+        return doc.status
+
+    def _index_file(self, doc: Document, path: str) -> Tuple[int, str]:
+        """Index the file, returns its chunk count and the sha256 of the bytes indexed"""
+        total_bytes = max(1, os.path.getsize(path))
+        read = {'bytes': 0}
+        digest = hashlib.sha256()
+
+        def on_block(block):
+            read['bytes'] += len(block)
+            digest.update(block)
+
+        embedder = self.retrieval_service.embedder
+        pool = self._embedding_pool()
+        writer = self.retrieval_service.store.writer(doc.id)
+        pending = deque()  # (texts, future or vectors) in submission order
+
+        def flush(limit: int):
+            # write finished batches in order, waiting once too many are in flight
+            while len(pending) > limit:
+                texts, result = pending.popleft()
+                vectors = result.result() if isinstance(result, Future) else result
+                writer.append(vectors, texts)
+            doc.progress = min(0.99, read['bytes'] / total_bytes)
+            db.session.commit()
+
+        try:
+            words = iter_file_words(path, Config.INGEST_READ_BYTES, on_block)
+            batch = []
+            for passage in chunk_words(words, Config.CHUNK_WORDS, Config.CHUNK_OVERLAP):
+                batch.append(passage)
+                if len(batch) < Config.INGEST_BATCH_CHUNKS:
+                    continue
+                pending.append((batch, self._embed(pool, embedder, batch)))
+                batch = []
+                flush(Config.INGEST_MAX_INFLIGHT_BATCHES)
+            if batch:
+                pending.append((batch, self._embed(pool, embedder, batch)))
+            flush(0)
+        except Exception:
+            writer.abort()
+            raise
+        return writer.commit(), digest.hexdigest()
+
+    @staticmethod
+    def _embed(pool, embedder, texts):
+        if pool is None:
+            return embedder.embed(texts)
+        return pool.submit(_embed_batch, embedder.name, embedder.dim, texts)
+
+    def shutdown(self):
+        if self._threads is not None:
+            self._threads.shutdown(wait=False)
+        if self._processes is not None:
+            self._processes.shutdown(wait=False)
+
+
+@process_singleton
+def get_ingestion_service() -> IngestionService:
+    return IngestionService()
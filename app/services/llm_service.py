@@ -1,59 +1,178 @@
 import os
+import time
 import requests
 import json
+from functools import lru_cache
 from app.config import Config
-from typing import List, Dict, Any, Tuple
+from .provider_transport import get_transport
+from .response_cache import ResponseCache, cache_key, get_response_cache
+from .single_flight import SingleFlight, get_single_flight
+from .batch_dispatcher import BatchRejected, get_batch_dispatcher
+from .context_window import estimate_tokens
+from .provider_router import get_router
+from app.utils.tracing import record_completion, span
+from typing import List, Dict, Any, Tuple, Iterator
+
+RAG_SYSTEM_PROMPT = """You are a helpful assistant that answers questions based on the provided context.
+Use the context below to answer the user's question. If the context doesn't contain
+the information needed, say you don't have enough information to answer accurately.
+
+Context: {context}"""
+DEFAULT_SYSTEM_PROMPT = "You are a helpful AI assistant."
+
+
+@lru_cache(maxsize=256)
+def system_prompt(mode: str, context: str = None) -> str:
+    """System message for a mode, memoized: a reused RAG context is formatted once, not on every turn"""
+    if mode == 'rag' and context:
+        return RAG_SYSTEM_PROMPT.format(context=context)
+    return DEFAULT_SYSTEM_PROMPT
+
 
 class LLMService:
-    def __init__(self):
+    TEMPERATURE = 0.7
+
+    def __init__(self, response_cache: ResponseCache = None, single_flight: SingleFlight = None):
         self.config = Config()
-        if self.config.LLM_PROVIDER == 'groq' and not self.config.GROQ_API_KEY and os.getenv("ALLOW_EMPTY_KEYS"):
+        if self.config.LLM_ROUTER_PROVIDERS:
+            # several providers behind the latency-aware router
+            self.provider = 'router'
+        elif self.config.LLM_PROVIDER == 'groq' and not self.config.GROQ_API_KEY and os.getenv("ALLOW_EMPTY_KEYS"):
             self.provider = 'stub'
         else:
             self.provider = self.config.LLM_PROVIDER
+        self.response_cache = response_cache if response_cache is not None else get_response_cache()
+        self.single_flight = single_flight if single_flight is not None else get_single_flight()
+
+    @property
+    def model(self) -> str:
+        return {
+            'groq': self.config.GROQ_MODEL,
+            'huggingface': self.config.HUGGINGFACE_MODEL,
+            'gemini': self.config.GEMINI_MODEL
+        }.get(self.provider, self.provider)
 
     def get_response(self, conversation_history: List[Dict[str, str]], mode: str = 'open_chat', context: str = None) -> Tuple[str, int]:
         """
-        Get response from LLM based on conversation history
+        Get response from LLM based on conversation history, served from the response cache when enabled
+        Concurrent identical prompts share one provider call (single flight), only the
+        caller that made it gets its token count, the others get 0
         Returns: (response_text, token_count)
         """
+        if self.response_cache is None and self.single_flight is None:
+            return self._provider_response(conversation_history, mode, context)
+        messages = self._build_messages(conversation_history, mode, context)
+        if self.response_cache is not None:
+            hit = self.response_cache.get(mode, self.provider, self.model, messages, self.TEMPERATURE)
+            if hit is not None:
+                return hit.reply, hit.tokens_used
+
+        def call():
+            reply, tokens_used = self._provider_response(conversation_history, mode, context)
+            if self.response_cache is not None:
+                self.response_cache.put(self.provider, self.model, messages, self.TEMPERATURE, reply, tokens_used)
+            return reply, tokens_used
+
+        if self.single_flight is None:
+            return call()
+        fingerprint = cache_key(self.provider, self.model, messages, self.TEMPERATURE)
+        (reply, tokens_used), shared = self.single_flight.do(fingerprint, call, mode)
+        return reply, 0 if shared else tokens_used
+
+    def _provider_response(self, conversation_history: List[Dict[str, str]], mode: str, context: str) -> Tuple[str, int]:
+        with span('llm'):
+            started = time.perf_counter()
+            reply, tokens_used = self._call_provider(conversation_history, mode, context)
+            record_completion(self.provider, self.model, mode, time.perf_counter() - started, tokens_used)
+        return reply, tokens_used
+
+    def _call_provider(self, conversation_history: List[Dict[str, str]], mode: str, context: str) -> Tuple[str, int]:
         if self.provider == 'groq':
             return self._get_groq_response(conversation_history, mode, context)
         elif self.provider == 'huggingface':
             return self._get_huggingface_response(conversation_history, mode, context)
+        elif self.provider == 'gemini':
+            return self._get_gemini_response(conversation_history, mode, context)
+        elif self.provider == 'router':
+            return get_router(self).call(conversation_history, mode, context)
         elif self.provider == 'stub':
-            return "stub response", 0
+            if self.config.STUB_LATENCY_MS:
+                time.sleep(self.config.STUB_LATENCY_MS / 1000.0)
+            return self._stub_reply()
         else:
             raise ValueError(f"Unsupported LLM provider: {self.provider}")
 
-    def _get_groq_response(self, conversation_history: List[Dict[str, str]], mode: str, context: str) -> Tuple[str, int]:
-        """Get response from Groq API"""
-        if not self.config.GROQ_API_KEY:
-            raise ValueError("GROQ_API_KEY environment variable not set")
+    def stream_response(self, conversation_history: List[Dict[str, str]], mode: str = 'open_chat', context: str = None) -> Iterator[Dict[str, Any]]:
+        """
+        Stream response from LLM as it is generated
+        Yields {'delta': text} for each content chunk and a final {'tokens_used': count}
+        """
+        if self.response_cache is None:
+            return self._provider_stream(conversation_history, mode, context)
+        messages = self._build_messages(conversation_history, mode, context)
+        hit = self.response_cache.get(mode, self.provider, self.model, messages, self.TEMPERATURE)
+        if hit is not None:
+            return iter([{'delta': hit.reply}, {'tokens_used': hit.tokens_used}])
+        return self._caching_stream(self._provider_stream(conversation_history, mode, context), messages)
 
-        # formatting messages for groq api endpoint
-        messages = []
+    def _caching_stream(self, chunks: Iterator[Dict[str, Any]], messages: List[Dict[str, str]]) -> Iterator[Dict[str, Any]]:
+        """Pass chunks through and cache the reply once the stream has completed"""
+        parts = []
+        for chunk in chunks:
+            if 'delta' in chunk:
+                parts.append(chunk['delta'])
+            else:
+                self.response_cache.put(self.provider, self.model, messages, self.TEMPERATURE,
+                                        "".join(parts), chunk['tokens_used'])
+            yield chunk
 
-        # adding system message based on mode selection
-        if mode == 'rag' and context:
-            system_message = f"""
-            You are a helpful assistant that answers questions based on the provided context.
-            Use the context below to answer the user's question. If the context doesn't contain
-            the information needed, say you don't have enough information to answer accurately.
+    def _provider_stream(self, conversation_history: List[Dict[str, str]], mode: str, context: str) -> Iterator[Dict[str, Any]]:
+        return self._timed_stream(self._open_stream(conversation_history, mode, context), mode)
 
-            Context: {context}
-            """
+    def _timed_stream(self, chunks: Iterator[Dict[str, Any]], mode: str) -> Iterator[Dict[str, Any]]:
+        """Record a streamed completion once its final chunk (with the token count) arrives"""
+        started = time.perf_counter()
+        for chunk in chunks:
+            if 'tokens_used' in chunk:
+                record_completion(self.provider, self.model, mode, time.perf_counter() - started, chunk['tokens_used'])
+            yield chunk
+
+    def _open_stream(self, conversation_history: List[Dict[str, str]], mode: str, context: str) -> Iterator[Dict[str, Any]]:
+        if self.provider == 'groq':
+            return self._stream_groq_response(conversation_history, mode, context)
+        elif self.provider == 'stub':
+            return self._stream_stub_response()
+        elif self.provider in ('huggingface', 'gemini', 'router'):
+            # no streaming support yet, replay the full response as a single chunk
+            reply, tokens_used = self._call_provider(conversation_history, mode, context)
+            return iter([{'delta': reply}, {'tokens_used': tokens_used}])
         else:
-            system_message = "You are a helpful AI assistant."
+            raise ValueError(f"Unsupported LLM provider: {self.provider}")
 
-        messages.append({"role": "system", "content": system_message})
+    def _build_messages(self, conversation_history: List[Dict[str, str]], mode: str, context: str) -> List[Dict[str, str]]:
+        """
+        Format conversation history into chat completion messages
+        The order never changes (system prompt, rolling summary, history oldest first, new
+        question), so each turn's prompt starts with the previous one as long as the context
+        and summary are unchanged, which is what provider prefix caches match on
+        """
+        messages = [{"role": "system", "content": system_prompt(mode, context)}]
 
-        # conversation history addition
+        # conversation history addition, system entries carry the rolling summary
         for msg in conversation_history:
             messages.append({
-                "role": "user" if msg['role'] == 'user' else "assistant",
+                "role": msg['role'] if msg['role'] in ('user', 'system') else "assistant",
                 "content": msg['content']
             })
+        return messages
+
+    def _get_groq_response(self, conversation_history: List[Dict[str, str]], mode: str, context: str) -> Tuple[str, int]:
+        """Get response from Groq API"""
+        if not self.config.GROQ_API_KEY:
+            raise ValueError("GROQ_API_KEY environment variable not set")
+
+        # formatting messages for groq api endpoint
+        messages = self._build_messages(conversation_history, mode, context)
 
         url = "https://api.groq.com/openai/v1/chat/completions"
         headers = {
@@ -63,11 +182,11 @@ class LLMService:
         payload = {
             "model": self.config.GROQ_MODEL,
             "messages": messages,
-            "temperature": 0.7,
+            "temperature": self.TEMPERATURE,
             "max_tokens": 1024
         }
         try:
-            response = requests.post(url, headers=headers, json=payload)
+            response = get_transport('groq').post(url, headers=headers, json=payload)
             response.raise_for_status()
             data = response.json()
 
@@ -85,10 +204,177 @@ class LLMService:
         except Exception as e:
             raise Exception(f"Error calling Groq API: {str(e)}")
 
+    def _stream_groq_response(self, conversation_history: List[Dict[str, str]], mode: str, context: str) -> Iterator[Dict[str, Any]]:
+        """Stream response from Groq API using server-sent events"""
+        if not self.config.GROQ_API_KEY:
+            raise ValueError("GROQ_API_KEY environment variable not set")
+
+        url = "https://api.groq.com/openai/v1/chat/completions"
+        headers = {
+            "Authorization": f"Bearer {self.config.GROQ_API_KEY}",
+            "Content-Type": "application/json"
+        }
+        payload = {
+            "model": self.config.GROQ_MODEL,
+            "messages": self._build_messages(conversation_history, mode, context),
+            "temperature": self.TEMPERATURE,
+            "max_tokens": 1024,
+            "stream": True,
+            "stream_options": {"include_usage": True}
+        }
+        try:
+            with get_transport('groq').post(url, headers=headers, json=payload, stream=True) as response:
+                response.raise_for_status()
+                token_usage = 0
+                for line in response.iter_lines(decode_unicode=True):
+                    # sse frames look like "data: {...}", blank lines separate events
+                    if not line or not line.startswith("data:"):
+                        continue
+                    chunk = line[len("data:"):].strip()
+                    if chunk == "[DONE]":
+                        break
+                    data = json.loads(chunk)
+                    for choice in data.get("choices") or []:
+                        delta = (choice.get("delta") or {}).get("content")
+                        if delta:
+                            yield {'delta': delta}
+                    # usage is only present on the final chunk
+                    usage = data.get("usage") or (data.get("x_groq") or {}).get("usage")
+                    if usage:
+                        token_usage = usage.get("total_tokens", 0)
+                yield {'tokens_used': token_usage}
+
+        except requests.HTTPError as http_err:
+            body = http_err.response.text if http_err.response is not None else ""
+            status = http_err.response.status_code if http_err.response is not None else "n/a"
+            raise Exception(f"Groq API error {status}: {body}")
+        except Exception as e:
+            raise Exception(f"Error calling Groq API: {str(e)}")
+
+    def _stub_reply(self) -> Tuple[str, int]:
+        """Offline reply, STUB_TOKENS pads it to that many words and reports them as tokens"""
+        words = ["stub", "response"] + ["token"] * max(0, self.config.STUB_TOKENS - 2)
+        return " ".join(words), self.config.STUB_TOKENS
+
+    def _stream_stub_response(self) -> Iterator[Dict[str, Any]]:
+        """Stream the stub response word by word so streaming can be exercised offline"""
+        reply, tokens_used = self._stub_reply()
+        words = reply.split(" ")
+        # STUB_LATENCY_MS is spread over the words like a model generating them
+        delay = self.config.STUB_LATENCY_MS / 1000.0 / len(words)
+        for i, word in enumerate(words):
+            if delay:
+                time.sleep(delay)
+            yield {'delta': word if i == 0 else " " + word}
+        yield {'tokens_used': tokens_used}
+
+    def _get_gemini_response(self, conversation_history: List[Dict[str, str]], mode: str, context: str) -> Tuple[str, int]:
+        """Get response from the Gemini generateContent API"""
+        if not self.config.GEMINI_API_KEY:
+            raise ValueError("GEMINI_API_KEY environment variable not set")
+
+        messages = self._build_messages(conversation_history, mode, context)
+        # gemini takes the system prompt separately and calls the assistant role "model"
+        system = "\n\n".join(m['content'].strip() for m in messages if m['role'] == 'system')
+        contents = [
+            {"role": "user" if m['role'] == 'user' else "model", "parts": [{"text": m['content']}]}
+            for m in messages if m['role'] != 'system'
+        ]
+        url = f"https://generativelanguage.googleapis.com/v1beta/models/{self.config.GEMINI_MODEL}:generateContent"
+        headers = {
+            "x-goog-api-key": self.config.GEMINI_API_KEY,
+            "Content-Type": "application/json"
+        }
+        payload = {
+            "systemInstruction": {"parts": [{"text": system}]},
+            "contents": contents,
+            "generationConfig": {"temperature": self.TEMPERATURE, "maxOutputTokens": 1024}
+        }
+        try:
+            response = get_transport('gemini').post(url, headers=headers, json=payload)
+            response.raise_for_status()
+            data = response.json()
+
+            candidates = (data or {}).get("candidates") or []
+            if not candidates:
+                raise Exception(f"Unexpected response format from Gemini API: {data}")
+
+            parts = (candidates[0].get("content") or {}).get("parts") or []
+            assistant_reply = "".join(part.get("text", "") for part in parts)
+            token_usage = (data.get("usageMetadata") or {}).get("totalTokenCount", 0)
+            return assistant_reply.strip(), token_usage
+
+        except requests.HTTPError as http_err:
+            body = http_err.response.text if http_err.response is not None else ""
+            status = http_err.response.status_code if http_err.response is not None else "n/a"
+            raise Exception(f"Gemini API error {status}: {body}")
+        except Exception as e:
+            raise Exception(f"Error calling Gemini API: {str(e)}")
+
     def _get_huggingface_response(self, conversation_history: List[Dict[str, str]], mode: str, context: str) -> Tuple[str, int]:
-        """Get response from HuggingFace Inference API (stub implementation)"""
-        # this is just a placeholder - here we can implement actual HuggingFace api call
-        return "This is a simulated response from HuggingFace.", 50
+        """Get response from HuggingFace Inference API, through the micro-batching dispatcher when enabled"""
+        item = (conversation_history, mode, context)
+        batcher = get_batch_dispatcher('huggingface', self._get_huggingface_batch)
+        if batcher is not None:
+            return batcher.call(item, self.config.LLM_BATCH_ITEM_TIMEOUT)
+        result = self._get_huggingface_batch([item])[0]
+        if isinstance(result, Exception):
+            raise result
+        return result
+
+    def _get_huggingface_batch(self, items: List[Tuple[List[Dict[str, str]], str, str]]) -> List[Any]:
+        """
+        One text-generation request for several (conversation_history, mode, context) items
+        Returns a (response_text, token_count) per item, in order
+        """
+        if not self.config.HUGGINGFACE_API_KEY:
+            # no key configured, keep the simulated response
+            return [("This is a simulated response from HuggingFace.", 50) for _ in items]
+
+        prompts = [self._render_prompt(self._build_messages(*item)) for item in items]
+        url = self.config.HUGGINGFACE_API_URL or f"https://api-inference.huggingface.co/models/{self.config.HUGGINGFACE_MODEL}"
+        headers = {
+            "Authorization": f"Bearer {self.config.HUGGINGFACE_API_KEY}",
+            "Content-Type": "application/json"
+        }
+        payload = {
+            "inputs": prompts,
+            "parameters": {"temperature": self.TEMPERATURE, "max_new_tokens": 1024, "return_full_text": False}
+        }
+        try:
+            response = get_transport('huggingface').post(url, headers=headers, json=payload)
+            response.raise_for_status()
+            data = response.json()
+        except requests.HTTPError as http_err:
+            body = http_err.response.text if http_err.response is not None else ""
+            status = http_err.response.status_code if http_err.response is not None else "n/a"
+            if isinstance(status, int) and 400 <= status < 500 and status not in (408, 429):
+                # the request itself was refused, the dispatcher retries items one by one
+                raise BatchRejected(f"HuggingFace API error {status}: {body}")
+            raise Exception(f"HuggingFace API error {status}: {body}")
+        except Exception as e:
+            raise Exception(f"Error calling HuggingFace API: {str(e)}")
+
+        if not isinstance(data, list) or len(data) != len(prompts):
+            raise BatchRejected(f"Unexpected response format from HuggingFace API: {data}")
+        results = []
+        for prompt, generated in zip(prompts, data):
+            # one entry per input, a list of candidates or a single candidate
+            candidate = generated[0] if isinstance(generated, list) and generated else generated
+            if not isinstance(candidate, dict) or "generated_text" not in candidate:
+                results.append(Exception(f"Unexpected HuggingFace generation: {generated}"))
+                continue
+            reply = candidate["generated_text"].strip()
+            # the inference api reports no usage, estimate it like the context window does
+            results.append((reply, estimate_tokens(prompt) + estimate_tokens(reply)))
+        return results
+
+    @staticmethod
+    def _render_prompt(messages: List[Dict[str, str]]) -> str:
+        """Plain text chat transcript for text-generation endpoints without a chat template"""
+        lines = [f"{m['role']}: {m['content'].strip()}" for m in messages]
+        lines.append("assistant:")
+        return "\n".join(lines)
 
     def simulate_rag_retrieval(self, query: str, document_ids: List[str]) -> str:
         """
@@ -0,0 +1,72 @@
+from dataclasses import dataclass
+from typing import Hashable, Optional
+
+import numpy as np
+
+from app.config import Config
+from app.utils.lazy import process_singleton
+from app.utils.metrics import registry
+from .response_cache import MemoryCacheBackend
+
+lookups_total = registry.counter('prompt_state_lookups_total', 'RAG context lookups in per-conversation prompt state',
+                                 ['result'])
+
+
+@dataclass
+class PromptState:
+    """Retrieved context of a conversation and what it was retrieved for"""
+    key: Hashable  # document ids and their index generations
+    query_vector: np.ndarray
+    context: str
+
+
+class PromptStates:
+    """
+    Per-conversation prompt state kept between turns.
+    A turn whose question is within threshold (cosine) of the question that last retrieved
+    the context, over unchanged documents, reuses that context instead of searching again.
+    The system prompt then stays byte for byte identical across turns, so together with
+    the fixed message order the prompt of a turn extends the previous one and upstream
+    prefix (KV) caches keep matching. State is per process, a turn served by another
+    worker simply retrieves again.
+    """
+
+    def __init__(self, threshold: float = 0.5, max_entries: int = 2048, ttl: float = 1800):
+        self.threshold = threshold
+        self._entries = MemoryCacheBackend(max_entries, ttl)
+
+    def reuse(self, conversation_id: str, key: Hashable, query_vector: np.ndarray) -> Optional[str]:
+        """Context to reuse for this question, None when it has to be retrieved"""
+        state = self._entries.get(conversation_id)
+        if state is None:
+            lookups_total.labels(result='miss').inc()
+            return None
+        if state.key != key or float(state.query_vector @ query_vector) < self.threshold:
+            lookups_total.labels(result='refreshed').inc()
+            return None
+        lookups_total.labels(result='reused').inc()
+        return state.context
+
+    def remember(self, conversation_id: str, key: Hashable, query_vector: np.ndarray, context: str):
+        self._entries.set(conversation_id, PromptState(key, query_vector, context))
+
+    def forget(self, conversation_id: str):
+        self._entries.delete(conversation_id)
+
+    def __len__(self):
+        return len(self._entries)
+
+
+@process_singleton
+def get_prompt_states() -> Optional[PromptStates]:
+    """Per-process prompt state built from Config, None unless PROMPT_STATE_ENABLED"""
+    if not Config.PROMPT_STATE_ENABLED:
+        return None
+    return PromptStates(Config.PROMPT_STATE_REUSE_SIMILARITY, Config.PROMPT_STATE_MAX_ENTRIES, Config.PROMPT_STATE_TTL)
+
+
+def forget_prompt_state(conversation_id: str):
+    """Drop a conversation's prompt state once it is deleted or archived"""
+    states = get_prompt_states()
+    if states is not None:
+        states.forget(conversation_id)
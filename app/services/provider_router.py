@@ -0,0 +1,242 @@
+import json
+import random
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from typing import Callable, Dict, List, Optional, Tuple
+
+from app.config import Config
+from app.utils.metrics import registry
+from .provider_transport import get_transport
+
+routed_total = registry.counter('llm_router_requests_total', 'Completions served per provider and how they were won', ['provider', 'outcome'])
+hedges_total = registry.counter('llm_router_hedges_total', 'Hedge requests sent after the primary passed its p95', ['provider'])
+failovers_total = registry.counter('llm_router_failovers_total', 'Attempts that failed over to the next provider', ['provider'])
+latency_p95 = registry.gauge('llm_provider_latency_p95_seconds', 'Rolling p95 completion latency', ['provider', 'model'])
+error_rate_gauge = registry.gauge('llm_provider_error_rate', 'Rolling completion error rate', ['provider', 'model'])
+
+# (conversation_history, mode, context) -> (response_text, token_count)
+CompletionFn = Callable[[List[Dict[str, str]], str, Optional[str]], Tuple[str, int]]
+
+
+class ProviderStats:
+    """Rolling latency and error window for one provider and model"""
+
+    def __init__(self, window: int = 200):
+        self._lock = threading.Lock()
+        self._samples = deque(maxlen=window)  # (latency seconds, ok)
+
+    def record(self, latency: float, ok: bool):
+        with self._lock:
+            self._samples.append((latency, ok))
+
+    def __len__(self):
+        return len(self._samples)
+
+    def error_rate(self) -> float:
+        with self._lock:
+            samples = list(self._samples)
+        return sum(1 for _, ok in samples if not ok) / len(samples) if samples else 0.0
+
+    def percentile(self, q: float) -> Optional[float]:
+        """Latency percentile of successful calls, None before the first one"""
+        with self._lock:
+            latencies = sorted(latency for latency, ok in self._samples if ok)
+        if not latencies:
+            return None
+        return latencies[min(len(latencies) - 1, int(q * len(latencies)))]
+
+
+class StubProvider:
+    """Offline provider with configurable latency, jitter and error rate, used to exercise routing"""
+
+    def __init__(self, name: str, latency_ms: float = 0, jitter_ms: float = 0, error_rate: float = 0,
+                 reply: str = None, tokens: int = 0):
+        self.name = name
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.error_rate = error_rate
+        self.reply = reply or f"stub response from {name}"
+        self.tokens = tokens
+
+    def __call__(self, conversation_history, mode, context) -> Tuple[str, int]:
+        delay = self.latency_ms + random.uniform(0, self.jitter_ms)
+        if delay:
+            time.sleep(delay / 1000.0)
+        if self.error_rate and random.random() < self.error_rate:
+            raise Exception(f"Simulated failure from {self.name}")
+        return self.reply, self.tokens
+
+
+class ProviderRegistry:
+    """
+    Named completion functions, http providers are unavailable while their circuit is open.
+    model returns the model a provider currently serves (read when called, so a changed
+    setting is picked up).
+    """
+
+    def __init__(self):
+        self._providers: Dict[str, CompletionFn] = {}
+        self._models: Dict[str, Callable[[], str]] = {}
+        self._transported = set()
+
+    def register(self, name: str, fn: CompletionFn, transport: bool = False, model: Callable[[], str] = None):
+        self._providers[name] = fn
+        if model is not None:
+            self._models[name] = model
+        if transport:
+            self._transported.add(name)
+
+    def get(self, name: str) -> CompletionFn:
+        if name not in self._providers:
+            raise ValueError(f"Unsupported LLM provider: {name}")
+        return self._providers[name]
+
+    def names(self) -> List[str]:
+        return list(self._providers)
+
+    def model(self, name: str) -> str:
+        return self._models[name]() if name in self._models else ''
+
+    def is_available(self, name: str) -> bool:
+        return name not in self._transported or get_transport(name).breaker.state != 'open'
+
+
+class ProviderRouter:
+    """
+    Sends each completion to the fastest healthy provider.
+    Providers are ranked by rolling p50, those with fewer than min_samples calls go first
+    (in configured order) so every backend gets measured. A provider whose error rate is
+    above max_error_rate, or whose circuit is open, is skipped while others are healthy.
+    If the primary hasn't answered by its own p95, a hedge goes to the runner-up and the
+    first success wins; a failed attempt fails over to the next provider.
+    Stats are kept per (provider, model): switching a provider to another model starts
+    from a fresh window instead of inheriting the old model's latencies.
+    """
+
+    def __init__(self, registry_: ProviderRegistry, providers: List[str], hedge: bool = True,
+                 max_error_rate: float = 0.5, min_samples: int = 5, window: int = 200, max_workers: int = 32):
+        self.registry = registry_
+        self.providers = list(providers)
+        for name in self.providers:
+            registry_.get(name)
+        self.hedge = hedge
+        self.max_error_rate = max_error_rate
+        self.min_samples = min_samples
+        self.window = window
+        self.stats: Dict[Tuple[str, str], ProviderStats] = {}
+        self._stats_lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='llm-route')
+
+    def _stats(self, name: str) -> Tuple[str, ProviderStats]:
+        """Model the provider serves now and its stats"""
+        model = self.registry.model(name)
+        stats = self.stats.get((name, model))
+        if stats is None:
+            with self._stats_lock:
+                stats = self.stats.setdefault((name, model), ProviderStats(self.window))
+        return model, stats
+
+    def ranked(self) -> List[str]:
+        """Providers in the order they would be tried"""
+        def key(item):
+            position, name = item
+            _, stats = self._stats(name)
+            unhealthy = (not self.registry.is_available(name)
+                         or (len(stats) >= self.min_samples and stats.error_rate() > self.max_error_rate))
+            measured = len(stats) >= self.min_samples and stats.percentile(0.5) is not None
+            return (unhealthy, measured, stats.percentile(0.5) if measured else position)
+        return [name for _, name in sorted(enumerate(self.providers), key=key)]
+
+    def call(self, conversation_history, mode: str = 'open_chat', context: str = None) -> Tuple[str, int]:
+        candidates = self.ranked()
+        pending: Dict[Future, str] = {}
+        errors = []
+
+        def launch():
+            name = candidates.pop(0)
+            pending[self._executor.submit(self._attempt, name, conversation_history, mode, context)] = name
+            return name
+
+        primary = launch()
+        hedged = False
+        while pending:
+            timeout = None
+            if self.hedge and not hedged and candidates and len(pending) == 1:
+                timeout = self._hedge_deadline(next(iter(pending.values())))
+            done, _ = wait(pending, timeout=timeout, return_when=FIRST_COMPLETED)
+            if not done:
+                # the attempt is slower than its p95, race it against the runner-up
+                hedged = True
+                hedges_total.labels(provider=launch()).inc()
+                continue
+            for future in done:
+                name = pending.pop(future)
+                try:
+                    result = future.result()
+                except Exception as e:
+                    errors.append(f"{name}: {e}")
+                    failovers_total.labels(provider=name).inc()
+                    if not pending and candidates:
+                        launch()
+                    continue
+                outcome = 'primary' if name == primary else ('hedge' if hedged and len(errors) == 0 else 'failover')
+                routed_total.labels(provider=name, outcome=outcome).inc()
+                return result
+        raise Exception(f"All providers failed: {'; '.join(errors)}")
+
+    def _hedge_deadline(self, name: str) -> Optional[float]:
+        """p95 of a provider once it has enough samples to trust it"""
+        _, stats = self._stats(name)
+        return stats.percentile(0.95) if len(stats) >= self.min_samples else None
+
+    def _attempt(self, name: str, conversation_history, mode: str, context: str) -> Tuple[str, int]:
+        model, stats = self._stats(name)
+        started = time.monotonic()
+        ok = False
+        try:
+            result = self.registry.get(name)(conversation_history, mode, context)
+            ok = True
+            return result
+        finally:
+            stats.record(time.monotonic() - started, ok)
+            p95 = stats.percentile(0.95)
+            if p95 is not None:
+                latency_p95.set(p95, provider=name, model=model)
+            error_rate_gauge.set(stats.error_rate(), provider=name, model=model)
+
+
+def build_registry(llm_service) -> ProviderRegistry:
+    """Real providers bound to llm_service plus the stub providers described by STUB_PROVIDERS"""
+    providers = ProviderRegistry()
+    config = llm_service.config
+    providers.register('groq', llm_service._get_groq_response, transport=True, model=lambda: config.GROQ_MODEL)
+    providers.register('gemini', llm_service._get_gemini_response, transport=True, model=lambda: config.GEMINI_MODEL)
+    providers.register('huggingface', llm_service._get_huggingface_response, transport=True,
+                       model=lambda: config.HUGGINGFACE_MODEL)
+    providers.register('stub', lambda history, mode, context: ("stub response", 0))
+    # e.g. {"fast": {"latency_ms": 50}, "flaky": {"latency_ms": 200, "error_rate": 0.2}}
+    for name, options in json.loads(Config.STUB_PROVIDERS or '{}').items():
+        providers.register(f'stub:{name}', StubProvider(f'stub:{name}', **options))
+    return providers
+
+
+_router = None
+_router_lock = threading.Lock()
+
+
+def get_router(llm_service) -> ProviderRouter:
+    """Per-process router over LLM_ROUTER_PROVIDERS"""
+    global _router
+    if _router is None:
+        with _router_lock:
+            if _router is None:
+                _router = ProviderRouter(
+                    build_registry(llm_service),
+                    [name.strip() for name in Config.LLM_ROUTER_PROVIDERS.split(',') if name.strip()],
+                    hedge=Config.LLM_ROUTER_HEDGE,
+                    max_error_rate=Config.LLM_ROUTER_MAX_ERROR_RATE,
+                    min_samples=Config.LLM_ROUTER_MIN_SAMPLES
+                )
+    return _router
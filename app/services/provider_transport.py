@@ -0,0 +1,355 @@
+import asyncio
+import random
+import threading
+import time
+import weakref
+from email.utils import parsedate_to_datetime
+from datetime import datetime, timezone
+from typing import Dict, Optional
+
+import httpx
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+
+from app.config import Config
+from app.utils.metrics import registry
+
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+requests_total = registry.counter('llm_upstream_requests_total', 'Upstream LLM http attempts', ['provider', 'status'])
+retries_total = registry.counter('llm_upstream_retries_total', 'Upstream LLM retries', ['provider', 'reason'])
+pool_total = registry.counter('llm_pool_connections_total', 'Connection checkouts from the provider pool', ['provider', 'result'])
+circuit_total = registry.counter('llm_circuit_rejections_total', 'Calls rejected by an open circuit', ['provider'])
+latency_seconds = registry.histogram('llm_upstream_latency_seconds', 'Upstream LLM http latency', ['provider'])
+
+_local = threading.local()
+
+
+class CircuitOpenError(Exception):
+    """Raised when a provider circuit is open and calls are short-circuited"""
+
+
+class CircuitBreaker:
+    """Opens after consecutive failures and lets a single probe through once the reset timeout passes"""
+
+    def __init__(self, failure_threshold: int, reset_timeout: float):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._lock = threading.Lock()
+        self.failures = 0
+        self.opened_at = None
+        self._probing = False
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return 'closed'
+        if time.monotonic() - self.opened_at >= self.reset_timeout:
+            return 'half_open'
+        return 'open'
+
+    def acquire(self) -> Optional[str]:
+        """'call' when closed, 'probe' for the one half-open probe, None when rejected"""
+        with self._lock:
+            state = self.state
+            if state == 'closed':
+                return 'call'
+            if state == 'half_open' and not self._probing:
+                self._probing = True
+                return 'probe'
+            return None
+
+    def allow(self) -> bool:
+        return self.acquire() is not None
+
+    def release_probe(self):
+        """End a probe whatever happened to it (an unexpected error, a cancellation)"""
+        with self._lock:
+            self._probing = False
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+            self._probing = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            self._probing = False
+            if self.opened_at is not None or self.failures >= self.failure_threshold:
+                self.opened_at = time.monotonic()
+
+
+def _counting_pool(base, provider):
+    """Connection pool class that reports whether each checkout reused a kept-alive connection"""
+
+    class CountingPool(base):
+        def _get_conn(self, timeout=None):
+            _local.new_conn = False
+            conn = super()._get_conn(timeout)
+            pool_total.labels(provider=provider, result='new' if _local.new_conn else 'reused').inc()
+            return conn
+
+        def _new_conn(self):
+            _local.new_conn = True
+            return super()._new_conn()
+
+    return CountingPool
+
+
+class _PoolAdapter(HTTPAdapter):
+    def __init__(self, provider, **kwargs):
+        self.provider = provider
+        super().__init__(**kwargs)
+
+    def init_poolmanager(self, *args, **kwargs):
+        super().init_poolmanager(*args, **kwargs)
+        self.poolmanager.pool_classes_by_scheme = {
+            'http': _counting_pool(HTTPConnectionPool, self.provider),
+            'https': _counting_pool(HTTPSConnectionPool, self.provider),
+        }
+
+
+class ProviderTransport:
+    """
+    Keep-alive http client for one LLM provider.
+    Owns a sized connection pool, applies connect/read timeouts, retries 429/5xx
+    with jittered exponential backoff (honouring Retry-After) and trips a circuit
+    breaker when the upstream keeps failing.
+    """
+
+    def __init__(self, provider: str, pool_size: int = 10, connect_timeout: float = 5, read_timeout: float = 60,
+                 max_retries: int = 3, backoff_base: float = 0.5, backoff_max: float = 8, retry_after_max: float = 30,
+                 failure_threshold: int = 5, reset_timeout: float = 30):
+        self.provider = provider
+        self.timeout = (connect_timeout, read_timeout)
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.retry_after_max = retry_after_max
+        self.breaker = CircuitBreaker(failure_threshold, reset_timeout)
+
+        self.session = requests.Session()
+        adapter = _PoolAdapter(provider, pool_connections=4, pool_maxsize=pool_size, max_retries=0)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+
+    def post(self, url: str, headers: Dict[str, str] = None, json=None, stream: bool = False) -> requests.Response:
+        """POST with retries, the final response is returned as is so callers can raise_for_status"""
+        permit = self.breaker.acquire()
+        if permit is None:
+            circuit_total.labels(provider=self.provider).inc()
+            raise CircuitOpenError(f"Circuit open for provider {self.provider}, upstream is failing")
+        try:
+            response = self._send(url, headers, json, stream)
+        except Exception:
+            # whatever failed, a half-open probe must not leave the breaker probing forever
+            self.breaker.record_failure()
+            raise
+        finally:
+            if permit == 'probe':
+                self.breaker.release_probe()
+        if response.status_code in RETRY_STATUSES:
+            self.breaker.record_failure()
+        else:
+            self.breaker.record_success()
+        return response
+
+    def _send(self, url: str, headers, json, stream: bool) -> requests.Response:
+        """The retry loop: the final response, or the last transport error raised"""
+        attempt = 0
+        while True:
+            start = time.perf_counter()
+            try:
+                response = self.session.post(url, headers=headers, json=json, stream=stream, timeout=self.timeout)
+            except (requests.ConnectionError, requests.Timeout) as e:
+                latency_seconds.labels(provider=self.provider).observe(time.perf_counter() - start)
+                requests_total.labels(provider=self.provider, status='error').inc()
+                if attempt >= self.max_retries:
+                    raise
+                retries_total.labels(provider=self.provider, reason=type(e).__name__).inc()
+                attempt += 1
+                time.sleep(self._backoff(attempt))
+                continue
+
+            latency_seconds.labels(provider=self.provider).observe(time.perf_counter() - start)
+            requests_total.labels(provider=self.provider, status=response.status_code).inc()
+
+            if response.status_code not in RETRY_STATUSES:
+                return response
+
+            delay = self._retry_delay(response, attempt + 1)
+            if attempt >= self.max_retries or delay is None:
+                return response
+
+            retries_total.labels(provider=self.provider, reason=response.status_code).inc()
+            response.close()
+            attempt += 1
+            time.sleep(delay)
+
+    def _backoff(self, attempt: int) -> float:
+        """Full jitter: uniform between zero and the capped exponential delay"""
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * (2 ** (attempt - 1))))
+
+    def _retry_delay(self, response: requests.Response, attempt: int) -> Optional[float]:
+        """Delay before the next attempt, None when the upstream asks us to wait too long"""
+        retry_after = parse_retry_after(response.headers.get('Retry-After'))
+        if retry_after is None:
+            return self._backoff(attempt)
+        if retry_after > self.retry_after_max:
+            return None
+        return retry_after
+
+    def stats(self) -> dict:
+        def value(metric, **labels):
+            return metric.value(provider=self.provider, **labels)
+        return {
+            'provider': self.provider,
+            'circuit': self.breaker.state,
+            'pool_reused': value(pool_total, result='reused'),
+            'pool_new': value(pool_total, result='new'),
+            'retries': retries_total.total(provider=self.provider),
+        }
+
+    def close(self):
+        self.session.close()
+
+
+def parse_retry_after(value: Optional[str]) -> Optional[float]:
+    """Retry-After is either delta seconds or an http date"""
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        when = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    if when.tzinfo is None:
+        when = when.replace(tzinfo=timezone.utc)
+    return max(0.0, (when - datetime.now(timezone.utc)).total_seconds())
+
+
+_transports = {}
+_transports_lock = threading.Lock()
+
+
+def get_transport(provider: str) -> ProviderTransport:
+    """Shared per-process transport for a provider, built from Config on first use"""
+    transport = _transports.get(provider)
+    if transport is None:
+        with _transports_lock:
+            transport = _transports.get(provider)
+            if transport is None:
+                transport = ProviderTransport(
+                    provider,
+                    pool_size=getattr(Config, f'{provider.upper()}_POOL_SIZE', 10),
+                    connect_timeout=Config.LLM_CONNECT_TIMEOUT,
+                    read_timeout=Config.LLM_READ_TIMEOUT,
+                    max_retries=Config.LLM_MAX_RETRIES,
+                    backoff_base=Config.LLM_BACKOFF_BASE,
+                    backoff_max=Config.LLM_BACKOFF_MAX,
+                    retry_after_max=Config.LLM_RETRY_AFTER_MAX,
+                    failure_threshold=Config.LLM_CIRCUIT_FAILURE_THRESHOLD,
+                    reset_timeout=Config.LLM_CIRCUIT_RESET_SECONDS,
+                )
+                _transports[provider] = transport
+    return transport
+
+
+class AsyncProviderTransport:
+    """
+    asyncio counterpart of ProviderTransport built on httpx.
+    Shares the circuit breaker and metrics of the sync transport for the same provider,
+    so both request paths see the same upstream health.
+    """
+
+    def __init__(self, provider: str, sync_transport: ProviderTransport, pool_size: int = 100):
+        self.provider = provider
+        self.sync = sync_transport
+        self.breaker = sync_transport.breaker
+        connect_timeout, read_timeout = sync_transport.timeout
+        self.client = httpx.AsyncClient(
+            timeout=httpx.Timeout(read_timeout, connect=connect_timeout),
+            limits=httpx.Limits(max_connections=pool_size, max_keepalive_connections=pool_size),
+        )
+
+    async def post(self, url: str, headers: Dict[str, str] = None, json=None):
+        """POST with the same retry and circuit policy as ProviderTransport.post"""
+        permit = self.breaker.acquire()
+        if permit is None:
+            circuit_total.labels(provider=self.provider).inc()
+            raise CircuitOpenError(f"Circuit open for provider {self.provider}, upstream is failing")
+        try:
+            response = await self._send(url, headers, json)
+        except Exception:
+            self.breaker.record_failure()
+            raise
+        finally:
+            # also on cancellation, which is no upstream failure but must end the probe
+            if permit == 'probe':
+                self.breaker.release_probe()
+        if response.status_code in RETRY_STATUSES:
+            self.breaker.record_failure()
+        else:
+            self.breaker.record_success()
+        return response
+
+    async def _send(self, url: str, headers, json):
+        attempt = 0
+        while True:
+            start = time.perf_counter()
+            try:
+                response = await self.client.post(url, headers=headers, json=json)
+            except (httpx.TransportError, httpx.TimeoutException) as e:
+                latency_seconds.labels(provider=self.provider).observe(time.perf_counter() - start)
+                requests_total.labels(provider=self.provider, status='error').inc()
+                if attempt >= self.sync.max_retries:
+                    raise
+                retries_total.labels(provider=self.provider, reason=type(e).__name__).inc()
+                attempt += 1
+                await asyncio.sleep(self.sync._backoff(attempt))
+                continue
+
+            latency_seconds.labels(provider=self.provider).observe(time.perf_counter() - start)
+            requests_total.labels(provider=self.provider, status=response.status_code).inc()
+
+            if response.status_code not in RETRY_STATUSES:
+                return response
+
+            delay = self.sync._retry_delay(response, attempt + 1)
+            if attempt >= self.sync.max_retries or delay is None:
+                return response
+
+            retries_total.labels(provider=self.provider, reason=response.status_code).inc()
+            attempt += 1
+            await asyncio.sleep(delay)
+
+    async def aclose(self):
+        await self.client.aclose()
+
+
+_async_transports = weakref.WeakKeyDictionary()
+
+
+def get_async_transport(provider: str) -> AsyncProviderTransport:
+    """Async transport for a provider, one per event loop since httpx clients are loop bound"""
+    loop = asyncio.get_running_loop()
+    per_loop = _async_transports.setdefault(loop, {})
+    transport = per_loop.get(provider)
+    if transport is None:
+        transport = AsyncProviderTransport(provider, get_transport(provider), pool_size=Config.LLM_ASYNC_POOL_SIZE)
+        per_loop[provider] = transport
+    return transport
+
+
+async def close_async_transports():
+    """Close the async clients bound to the running loop, called on ASGI shutdown"""
+    loop = asyncio.get_running_loop()
+    per_loop = _async_transports.pop(loop, {})
+    for transport in per_loop.values():
+        await transport.aclose()
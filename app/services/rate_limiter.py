@@ -0,0 +1,254 @@
+import math
+import threading
+import time
+from dataclasses import dataclass
+from typing import List, Optional, Tuple
+
+from app.config import Config
+from app.utils.metrics import registry
+from app.utils.shared_store import get_shared_store
+
+rejections_total = registry.counter('rate_limit_rejections_total', 'Requests rejected by admission control', ['scope'])
+
+# (key, refill rate per second, capacity, amount taken)
+Check = Tuple[str, float, float, float]
+
+
+class RateLimitExceeded(Exception):
+    """Admission was refused, retry_after is in seconds"""
+
+    def __init__(self, scope: str, retry_after: float):
+        self.scope = scope
+        self.retry_after = retry_after
+        super().__init__(f"Rate limit exceeded ({scope}), retry in {self.retry_after_seconds}s")
+
+    @property
+    def retry_after_seconds(self) -> int:
+        """Value for the Retry-After header"""
+        return max(1, math.ceil(self.retry_after))
+
+
+class MemoryRateBackend:
+    """
+    Token buckets and concurrency counters in process memory.
+    Buckets refill lazily on access, a check against several buckets takes from all of
+    them or from none. A bucket may go negative when LLM tokens are charged after the
+    fact, admission then waits until the debt is refilled.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._buckets = {}  # key -> [tokens, updated_at]
+        self._active = {}  # key -> requests in flight
+
+    def _level(self, key: str, rate: float, capacity: float, now: float) -> float:
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            return capacity
+        return min(capacity, bucket[0] + (now - bucket[1]) * rate)
+
+    def take(self, checks: List[Check]) -> Tuple[Optional[str], float]:
+        """Returns (None, 0) when admitted, otherwise (key of the first empty bucket, seconds to wait)"""
+        now = time.monotonic()
+        with self._lock:
+            levels = [self._level(key, rate, capacity, now) for key, rate, capacity, _ in checks]
+            for (key, rate, _, amount), level in zip(checks, levels):
+                if level < amount:
+                    return key, (amount - level) / rate
+            for (key, _, _, amount), level in zip(checks, levels):
+                self._buckets[key] = [level - amount, now]
+        return None, 0.0
+
+    def charge(self, key: str, rate: float, capacity: float, amount: float):
+        now = time.monotonic()
+        with self._lock:
+            self._buckets[key] = [self._level(key, rate, capacity, now) - amount, now]
+
+    def acquire(self, key: str, limit: int) -> bool:
+        with self._lock:
+            active = self._active.get(key, 0)
+            if active >= limit:
+                return False
+            self._active[key] = active + 1
+            return True
+
+    def release(self, key: str):
+        with self._lock:
+            active = self._active.get(key, 0) - 1
+            if active > 0:
+                self._active[key] = active
+            else:
+                self._active.pop(key, None)
+
+
+class SharedRateBackend:
+    """
+    Limits shared by every worker process through the shared store.
+    The store only offers atomic increments, so each bucket is approximated by a fixed
+    window of capacity / rate seconds allowing capacity units; concurrency counters carry
+    a lease so a crashed process cannot hold slots forever.
+    """
+
+    def __init__(self, store=None, prefix: str = 'ratelimit:', lease_seconds: float = 600):
+        self.store = store or get_shared_store()
+        self.prefix = prefix
+        self.lease_ms = int(lease_seconds * 1000)
+
+    def _window(self, key: str, rate: float, capacity: float, now: float) -> Tuple[str, float, float]:
+        length = capacity / rate
+        slot = int(now // length)
+        return f"{self.prefix}{key}:{slot}", length, (slot + 1) * length - now
+
+    def take(self, checks: List[Check]) -> Tuple[Optional[str], float]:
+        now = time.time()
+        taken = []
+        for key, rate, capacity, amount in checks:
+            window_key, length, remaining = self._window(key, rate, capacity, now)
+            used = self.store.incrby(window_key, int(amount))
+            if used == amount:
+                self.store.pexpire(window_key, int(length * 2000))
+            if used > capacity or (amount == 0 and used >= capacity):
+                if amount:
+                    self.store.incrby(window_key, -int(amount))
+                for undo_key, undo_amount in taken:
+                    self.store.incrby(undo_key, -undo_amount)
+                return key, remaining
+            taken.append((window_key, int(amount)))
+        return None, 0.0
+
+    def charge(self, key: str, rate: float, capacity: float, amount: float):
+        window_key, length, _ = self._window(key, rate, capacity, time.time())
+        if self.store.incrby(window_key, int(amount)) == int(amount):
+            self.store.pexpire(window_key, int(length * 2000))
+
+    def acquire(self, key: str, limit: int) -> bool:
+        active_key = f"{self.prefix}{key}"
+        if self.store.incrby(active_key, 1) > limit:
+            self.store.incrby(active_key, -1)
+            return False
+        self.store.pexpire(active_key, self.lease_ms)
+        return True
+
+    def release(self, key: str):
+        self.store.incrby(f"{self.prefix}{key}", -1)
+
+
+@dataclass
+class RateLimits:
+    """Per second rates and burst capacities, a rate of 0 disables that limit"""
+    user_requests_rate: float = 0
+    user_requests_burst: float = 0
+    user_tokens_rate: float = 0
+    user_tokens_burst: float = 0
+    global_requests_rate: float = 0
+    global_requests_burst: float = 0
+    global_tokens_rate: float = 0
+    global_tokens_burst: float = 0
+    user_max_concurrent: int = 0
+
+    @classmethod
+    def from_config(cls) -> 'RateLimits':
+        return cls(
+            user_requests_rate=Config.USER_REQUESTS_PER_MINUTE / 60.0,
+            user_requests_burst=Config.USER_REQUEST_BURST,
+            user_tokens_rate=Config.USER_TOKENS_PER_MINUTE / 60.0,
+            user_tokens_burst=Config.USER_TOKENS_PER_MINUTE,
+            global_requests_rate=Config.GLOBAL_REQUESTS_PER_SECOND,
+            global_requests_burst=Config.GLOBAL_REQUEST_BURST,
+            global_tokens_rate=Config.GLOBAL_TOKENS_PER_MINUTE / 60.0,
+            global_tokens_burst=Config.GLOBAL_TOKENS_PER_MINUTE,
+            user_max_concurrent=Config.USER_MAX_CONCURRENT
+        )
+
+
+class Permit:
+    """An admitted request, holds its concurrency slot until released"""
+
+    def __init__(self, limiter: 'RateLimiter', user_id):
+        self.limiter = limiter
+        self.user_id = user_id
+        self._held = limiter.limits.user_max_concurrent > 0
+        self._lock = threading.Lock()
+
+    def charge(self, tokens_used: int):
+        """Debit LLM tokens once the provider has reported them"""
+        if tokens_used:
+            self.limiter.charge_tokens(self.user_id, tokens_used)
+
+    def release(self):
+        with self._lock:
+            held, self._held = self._held, False
+        if held:
+            self.limiter.backend.release(f"user:{self.user_id}:active")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.release()
+
+
+class RateLimiter:
+    """
+    Admission control in front of the LLM call.
+    A request needs a request token from the user's and the global bucket, a user and a
+    global token budget that is not in debt, and a free per-user concurrency slot.
+    """
+
+    def __init__(self, backend=None, limits: RateLimits = None):
+        self.backend = backend if backend is not None else MemoryRateBackend()
+        self.limits = limits or RateLimits.from_config()
+        limits = self.limits
+        self._checks = [
+            (name, rate, burst, amount) for name, rate, burst, amount in (
+                ('user:{}:requests', limits.user_requests_rate, limits.user_requests_burst, 1),
+                ('user:{}:tokens', limits.user_tokens_rate, limits.user_tokens_burst, 0),
+                ('global:requests', limits.global_requests_rate, limits.global_requests_burst, 1),
+                ('global:tokens', limits.global_tokens_rate, limits.global_tokens_burst, 0),
+            ) if rate > 0
+        ]
+
+    def admit(self, user_id) -> Permit:
+        """Admit a request or raise RateLimitExceeded, release the returned permit when done"""
+        # ids arrive as ints or as strings from request bodies, both must hit the same buckets
+        user_id = int(user_id)
+        if self.limits.user_max_concurrent > 0:
+            if not self.backend.acquire(f"user:{user_id}:active", self.limits.user_max_concurrent):
+                rejections_total.labels(scope='user_concurrency').inc()
+                # a slot frees up when a turn completes, typically within a second or two
+                raise RateLimitExceeded('user_concurrency', 1)
+        permit = Permit(self, user_id)
+        if self._checks:
+            checks = [(name.format(user_id), rate, burst, amount) for name, rate, burst, amount in self._checks]
+            key, retry_after = self.backend.take(checks)
+            if key is not None:
+                permit.release()
+                scope = key.replace(f"user:{user_id}:", "user_").replace("global:", "global_")
+                rejections_total.labels(scope=scope).inc()
+                raise RateLimitExceeded(scope, retry_after)
+        return permit
+
+    def charge_tokens(self, user_id, tokens_used: int):
+        user_id = int(user_id)
+        for name, rate, burst, amount in self._checks:
+            if name.endswith(':tokens'):
+                self.backend.charge(name.format(user_id), rate, burst, tokens_used)
+
+
+_limiter = None
+_limiter_lock = threading.Lock()
+
+
+def get_rate_limiter() -> RateLimiter:
+    """Per-process limiter built from Config, it admits everything when RATE_LIMIT_ENABLED is off"""
+    global _limiter
+    if _limiter is None:
+        with _limiter_lock:
+            if _limiter is None:
+                if not Config.RATE_LIMIT_ENABLED:
+                    _limiter = RateLimiter(limits=RateLimits())
+                elif Config.RATE_LIMIT_BACKEND == 'shared':
+                    _limiter = RateLimiter(SharedRateBackend())
+                else:
+                    _limiter = RateLimiter(MemoryRateBackend())
+    return _limiter
@@ -0,0 +1,214 @@
+import hashlib
+import json
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from app.config import Config
+from app.utils.metrics import registry
+from app.utils.shared_store import get_shared_store
+from .retrieval_service import get_embedder
+
+lookups_total = registry.counter('llm_cache_lookups_total', 'Completion cache lookups', ['mode', 'result'])
+saved_tokens_total = registry.counter('llm_cache_saved_tokens_total', 'Tokens not spent thanks to cache hits', ['mode'])
+
+
+def _normalize(text: str) -> str:
+    return " ".join((text or "").split())
+
+
+def _digest(payload) -> str:
+    raw = json.dumps(payload, sort_keys=True, separators=(',', ':'), ensure_ascii=False)
+    return hashlib.sha256(raw.encode('utf-8')).hexdigest()
+
+
+def cache_key(provider: str, model: str, messages: List[Dict[str, str]], temperature: float) -> str:
+    """
+    Key over (provider, model, system prompt, history, temperature).
+    messages is the prompt as sent, already trimmed to the context window; whitespace is
+    collapsed so re-indented prompts or trailing spaces still hit.
+    """
+    return _digest({
+        'provider': provider,
+        'model': model,
+        'temperature': round(float(temperature), 3),
+        'messages': [[m['role'], _normalize(m['content'])] for m in messages]
+    })
+
+
+@dataclass
+class CachedResponse:
+    reply: str
+    tokens_used: int
+
+    def dumps(self) -> str:
+        return json.dumps({'reply': self.reply, 'tokens_used': self.tokens_used})
+
+    @classmethod
+    def loads(cls, raw) -> 'CachedResponse':
+        data = json.loads(raw)
+        return cls(data['reply'], data['tokens_used'])
+
+
+class MemoryCacheBackend:
+    """In-process LRU with a per-entry time to live"""
+
+    def __init__(self, max_entries: int = 1024, ttl: float = 3600):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()  # key -> (CachedResponse, expires_at)
+
+    def get(self, key: str) -> Optional[CachedResponse]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if entry[1] <= time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return entry[0]
+
+    def set(self, key: str, value: CachedResponse):
+        with self._lock:
+            self._entries[key] = (value, time.monotonic() + self.ttl)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def delete(self, key: str):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class SharedCacheBackend:
+    """Cache entries in the shared store so every worker process sees them, expiry is left to the store"""
+
+    def __init__(self, store=None, ttl: float = 3600, prefix: str = 'llm-cache:'):
+        self.store = store or get_shared_store()
+        self.ttl = ttl
+        self.prefix = prefix
+
+    def get(self, key: str) -> Optional[CachedResponse]:
+        raw = self.store.get(self.prefix + key)
+        return CachedResponse.loads(raw) if raw is not None else None
+
+    def set(self, key: str, value: CachedResponse):
+        self.store.set(self.prefix + key, value.dumps(), px=int(self.ttl * 1000))
+
+
+class SemanticIndex:
+    """
+    Near-duplicate lookup for the last user message.
+    Entries are grouped by everything else in the prompt (system prompt with its context,
+    earlier history, provider, model, temperature), so only the question may differ. Each
+    entry points at an exact cache key, whose TTL in the backend still applies.
+    """
+
+    def __init__(self, embedder=None, threshold: float = 0.95, max_entries: int = 4096):
+        self.embedder = embedder or get_embedder()
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._order = OrderedDict()  # (namespace, exact key), least recently added first
+        self._namespaces = {}  # namespace -> {exact key: vector}
+
+    def find(self, namespace: str, question: str) -> Optional[str]:
+        with self._lock:
+            candidates = list(self._namespaces.get(namespace, {}).items())
+        if not candidates:
+            return None
+        query = self.embedder.embed([question])[0]
+        scores = np.stack([vector for _, vector in candidates]) @ query
+        best = int(np.argmax(scores))
+        return candidates[best][0] if scores[best] >= self.threshold else None
+
+    def add(self, namespace: str, question: str, key: str):
+        vector = self.embedder.embed([question])[0]
+        with self._lock:
+            self._namespaces.setdefault(namespace, {})[key] = vector
+            self._order[(namespace, key)] = None
+            self._order.move_to_end((namespace, key))
+            while len(self._order) > self.max_entries:
+                (old_ns, old_key), _ = self._order.popitem(last=False)
+                entries = self._namespaces[old_ns]
+                del entries[old_key]
+                if not entries:
+                    del self._namespaces[old_ns]
+
+
+class ResponseCache:
+    """
+    Completion cache consulted before a provider round trip.
+    Exact hits are served from the backend (in-process LRU or the shared store); with a
+    semantic index, a question close enough to a cached one under an identical rest of
+    the prompt is served too. Counters are labelled by conversation mode.
+    """
+
+    def __init__(self, backend=None, semantic: SemanticIndex = None):
+        self.backend = backend if backend is not None else MemoryCacheBackend()
+        self.semantic = semantic
+
+    @staticmethod
+    def _split(provider: str, model: str, messages: List[Dict[str, str]], temperature: float) -> Tuple[Optional[str], Optional[str]]:
+        """(namespace, question) for the semantic tier, (None, None) when the prompt doesn't end with a user turn"""
+        if not messages or messages[-1]['role'] != 'user':
+            return None, None
+        return cache_key(provider, model, messages[:-1], temperature), messages[-1]['content']
+
+    def get(self, mode: str, provider: str, model: str, messages: List[Dict[str, str]], temperature: float) -> Optional[CachedResponse]:
+        hit = self.backend.get(cache_key(provider, model, messages, temperature))
+        result = 'hit'
+        if hit is None and self.semantic is not None:
+            namespace, question = self._split(provider, model, messages, temperature)
+            similar = self.semantic.find(namespace, question) if namespace else None
+            hit = self.backend.get(similar) if similar else None
+            result = 'semantic_hit'
+        if hit is None:
+            lookups_total.labels(mode=mode, result='miss').inc()
+            return None
+        lookups_total.labels(mode=mode, result=result).inc()
+        saved_tokens_total.labels(mode=mode).inc(hit.tokens_used)
+        return hit
+
+    def put(self, provider: str, model: str, messages: List[Dict[str, str]], temperature: float, reply: str, tokens_used: int):
+        if not reply:
+            return
+        key = cache_key(provider, model, messages, temperature)
+        self.backend.set(key, CachedResponse(reply, tokens_used))
+        if self.semantic is not None:
+            namespace, question = self._split(provider, model, messages, temperature)
+            if namespace:
+                self.semantic.add(namespace, question, key)
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_response_cache() -> Optional[ResponseCache]:
+    """Shared per-process cache built from Config, None unless RESPONSE_CACHE_ENABLED"""
+    global _cache
+    if not Config.RESPONSE_CACHE_ENABLED:
+        return None
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                if Config.RESPONSE_CACHE_BACKEND == 'shared':
+                    backend = SharedCacheBackend(ttl=Config.RESPONSE_CACHE_TTL)
+                else:
+                    backend = MemoryCacheBackend(Config.RESPONSE_CACHE_MAX_ENTRIES, Config.RESPONSE_CACHE_TTL)
+                semantic = None
+                if Config.RESPONSE_CACHE_SEMANTIC:
+                    semantic = SemanticIndex(threshold=Config.RESPONSE_CACHE_SEMANTIC_THRESHOLD,
+                                             max_entries=Config.RESPONSE_CACHE_MAX_ENTRIES)
+                _cache = ResponseCache(backend, semantic)
+    return _cache
@@ -0,0 +1,369 @@
+import json
+import os
+import re
+import threading
+import time
+import zlib
+from typing import Dict, Iterable, Iterator, List, Optional
+from urllib.parse import unquote, urlparse
+
+import numpy as np
+
+from app.config import Config
+
+TOKEN_PATTERN = re.compile(r"[a-z0-9]+")
+
+
+def tokenize(text: str) -> List[str]:
+    return TOKEN_PATTERN.findall(text.lower())
+
+
+def chunk_words(words: Iterable[str], size: int, overlap: int) -> Iterator[str]:
+    """Group a (possibly streamed) sequence of words into overlapping passages"""
+    step = max(1, size - overlap)
+    window = []
+    emitted = 0  # words of the current window already covered by an emitted passage
+    for word in words:
+        window.append(word)
+        if len(window) == size:
+            yield " ".join(window)
+            window = window[step:]
+            emitted = len(window)
+    if len(window) > emitted:
+        yield " ".join(window)
+
+
+def chunk_text(text: str, size: int = None, overlap: int = None) -> List[str]:
+    size = size or Config.CHUNK_WORDS
+    overlap = Config.CHUNK_OVERLAP if overlap is None else overlap
+    return list(chunk_words(text.split(), size, overlap))
+
+
+class HashingEmbedder:
+    """
+    Feature-hashing embedder over unigrams and bigrams.
+    Needs no model or vocabulary and is stable across processes (crc32, not hash()),
+    so vectors built by ingestion workers match query vectors built in the web process.
+    """
+    name = 'hashing'
+
+    def __init__(self, dim: int = 256):
+        self.dim = dim
+
+    def _features(self, text: str) -> Iterator[str]:
+        tokens = tokenize(text)
+        yield from tokens
+        for a, b in zip(tokens, tokens[1:]):
+            yield a + " " + b
+
+    def embed(self, texts: List[str]) -> np.ndarray:
+        vectors = np.zeros((len(texts), self.dim), dtype=np.float32)
+        for row, text in enumerate(texts):
+            hashes = np.fromiter((zlib.crc32(f.encode('utf-8')) for f in self._features(text)), dtype=np.uint32)
+            if not len(hashes):
+                continue
+            # top bit picks the sign so collisions tend to cancel out
+            signs = np.where(hashes & 0x80000000, 1.0, -1.0).astype(np.float32)
+            np.add.at(vectors[row], hashes % self.dim, signs)
+        # sublinear term frequency then l2 normalisation, scores become cosine similarities
+        vectors = np.sign(vectors) * np.log1p(np.abs(vectors))
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        return (vectors / norms).astype(np.float32)
+
+
+EMBEDDERS = {
+    'hashing': HashingEmbedder,
+}
+
+
+def get_embedder(name: str = None, dim: int = None):
+    name = name or Config.EMBEDDER
+    if name not in EMBEDDERS:
+        raise ValueError(f"Unsupported embedder: {name}")
+    return EMBEDDERS[name](dim or Config.EMBEDDING_DIM)
+
+
+class ChunkTexts:
+    """
+    Read-only view over a generation's chunk texts: utf-8 bodies concatenated in one file
+    plus a uint64 offsets file, both memory-mapped so a lookup decodes only the chunk hit
+    """
+
+    def __init__(self, text_path: str, offsets_path: str):
+        self.offsets = np.memmap(offsets_path, dtype=np.uint64, mode='r') if os.path.getsize(offsets_path) else np.zeros(1, dtype=np.uint64)
+        self.data = np.memmap(text_path, dtype=np.uint8, mode='r') if os.path.getsize(text_path) else b''
+
+    def __len__(self) -> int:
+        return len(self.offsets) - 1
+
+    def __getitem__(self, index: int) -> str:
+        if not 0 <= index < len(self):
+            raise IndexError(index)
+        start, end = int(self.offsets[index]), int(self.offsets[index + 1])
+        return bytes(self.data[start:end]).decode('utf-8')
+
+
+class DocumentIndex:
+    """Vectors and texts of one published generation, always used together"""
+
+    def __init__(self, generation: str, matrix: np.ndarray, texts: ChunkTexts):
+        self.generation = generation
+        self.matrix = matrix
+        self.texts = texts
+
+
+class VectorStoreWriter:
+    """
+    Appends embedding batches for one document into a new generation of files.
+    Nothing is visible to readers until commit() atomically replaces the manifest,
+    which only ever names generations whose vector, text and offset files are complete.
+    """
+
+    def __init__(self, store: 'VectorStore', document_id: str):
+        self.store = store
+        self.document_id = document_id
+        self.count = 0
+        self.generation = f"{time.time_ns():x}-{os.getpid()}-{threading.get_ident():x}"
+        os.makedirs(store.root, exist_ok=True)
+        self._paths = store.generation_paths(document_id, self.generation)
+        self._vectors = open(self._paths['vectors'], 'wb')
+        self._texts = open(self._paths['texts'], 'wb')
+        self._offsets = open(self._paths['offsets'], 'wb')
+        self._offset = 0
+        self._offsets.write(np.array([0], dtype=np.uint64).tobytes())
+
+    def append(self, vectors: np.ndarray, texts: List[str]):
+        if len(vectors) != len(texts):
+            raise ValueError("vectors and texts must have the same length")
+        vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+        if vectors.ndim != 2 or vectors.shape[1] != self.store.dim:
+            raise ValueError(f"Expected vectors of dimension {self.store.dim}")
+        ends = []
+        for text in texts:
+            body = text.encode('utf-8')
+            self._texts.write(body)
+            self._offset += len(body)
+            ends.append(self._offset)
+        self._vectors.write(vectors.tobytes())
+        self._offsets.write(np.array(ends, dtype=np.uint64).tobytes())
+        self.count += len(texts)
+
+    def _close(self):
+        for f in (self._vectors, self._texts, self._offsets):
+            f.close()
+
+    def commit(self) -> int:
+        self._close()
+        previous = self.store.read_manifest(self.document_id)
+        manifest_path = self.store.manifest_path(self.document_id)
+        with open(manifest_path + '.tmp', 'w', encoding='utf-8') as f:
+            json.dump({'generation': self.generation, 'rows': self.count, 'dim': self.store.dim}, f)
+        os.replace(manifest_path + '.tmp', manifest_path)
+        self.store.forget(self.document_id)
+        if previous and previous['generation'] != self.generation:
+            # open memmaps keep the old inodes alive until readers drop them
+            self.store.remove_generation(self.document_id, previous['generation'])
+        return self.count
+
+    def abort(self):
+        self._close()
+        self.store.remove_generation(self.document_id, self.generation)
+
+
+class VectorStore:
+    """
+    Per-document embedding matrices kept as raw float32 files and opened with np.memmap,
+    so only the pages touched by scoring are resident and the OS shares them across workers.
+    A small json manifest per document names the current generation of files.
+    """
+
+    def __init__(self, root: str = None, dim: int = None):
+        self.root = root or Config.VECTOR_STORE_DIR
+        self.dim = dim or Config.EMBEDDING_DIM
+        self._lock = threading.Lock()
+        self._indexes = {}  # document_id -> (manifest mtime, DocumentIndex)
+
+    def _base(self, document_id: str) -> str:
+        return os.path.join(self.root, re.sub(r'[^A-Za-z0-9_.-]', '_', document_id))
+
+    def manifest_path(self, document_id: str) -> str:
+        return self._base(document_id) + '.json'
+
+    def generation_paths(self, document_id: str, generation: str) -> Dict[str, str]:
+        base = f"{self._base(document_id)}.{generation}"
+        return {'vectors': base + '.f32', 'texts': base + '.txt', 'offsets': base + '.off'}
+
+    def read_manifest(self, document_id: str) -> Optional[Dict]:
+        try:
+            with open(self.manifest_path(document_id), encoding='utf-8') as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return None
+
+    def remove_generation(self, document_id: str, generation: str):
+        for path in self.generation_paths(document_id, generation).values():
+            if os.path.exists(path):
+                os.remove(path)
+
+    def has(self, document_id: str) -> bool:
+        return os.path.exists(self.manifest_path(document_id))
+
+    def writer(self, document_id: str) -> VectorStoreWriter:
+        return VectorStoreWriter(self, document_id)
+
+    def write(self, document_id: str, vectors: np.ndarray, texts: List[str]) -> int:
+        writer = self.writer(document_id)
+        try:
+            writer.append(vectors, texts)
+        except Exception:
+            writer.abort()
+            raise
+        return writer.commit()
+
+    def index(self, document_id: str) -> Optional[DocumentIndex]:
+        """Current generation of a document, reopened only when the manifest changes"""
+        try:
+            return self._open(document_id)
+        except FileNotFoundError:
+            # a commit swapped the manifest and removed the generation we had just read,
+            # the manifest now names the new one
+            return self._open(document_id)
+
+    def _open(self, document_id: str) -> Optional[DocumentIndex]:
+        try:
+            mtime = os.stat(self.manifest_path(document_id)).st_mtime_ns
+        except FileNotFoundError:
+            return None
+        cached = self._indexes.get(document_id)
+        if cached and cached[0] == mtime:
+            return cached[1]
+
+        manifest = self.read_manifest(document_id)
+        if manifest is None:
+            return None
+        paths = self.generation_paths(document_id, manifest['generation'])
+        rows = manifest['rows']
+        if rows == 0:
+            matrix = np.zeros((0, self.dim), dtype=np.float32)
+        else:
+            matrix = np.memmap(paths['vectors'], dtype=np.float32, mode='r', shape=(rows, self.dim))
+        index = DocumentIndex(manifest['generation'], matrix, ChunkTexts(paths['texts'], paths['offsets']))
+        with self._lock:
+            self._indexes[document_id] = (mtime, index)
+        return index
+
+    def matrix(self, document_id: str) -> Optional[np.ndarray]:
+        index = self.index(document_id)
+        return index.matrix if index else None
+
+    def texts(self, document_id: str) -> Optional[ChunkTexts]:
+        index = self.index(document_id)
+        return index.texts if index else None
+
+    def forget(self, document_id: str):
+        """Drop cached handles so the next read sees the new files"""
+        with self._lock:
+            self._indexes.pop(document_id, None)
+
+    def delete(self, document_id: str):
+        manifest = self.read_manifest(document_id)
+        self.forget(document_id)
+        if os.path.exists(self.manifest_path(document_id)):
+            os.remove(self.manifest_path(document_id))
+        if manifest:
+            self.remove_generation(document_id, manifest['generation'])
+
+    def search(self, query_vectors: np.ndarray, document_ids: List[str], top_k: int = 5) -> List[List[Dict]]:
+        """
+        Top-k chunks per query, restricted to document_ids.
+        Scores are one matrix product per document (rows x queries), candidates are
+        reduced with argpartition per document before the final merge.
+        """
+        queries = np.atleast_2d(np.asarray(query_vectors, dtype=np.float32))
+        candidate_scores = []
+        candidate_refs = []
+        for document_id in dict.fromkeys(document_ids):
+            index = self.index(document_id)
+            if index is None or len(index.matrix) == 0:
+                continue
+            scores = index.matrix @ queries.T  # (rows, n_queries)
+            k = min(top_k, len(scores))
+            idx = np.argpartition(-scores, k - 1, axis=0)[:k]  # (k, n_queries)
+            candidate_scores.append(np.take_along_axis(scores, idx, axis=0))
+            candidate_refs.append((document_id, index, idx))
+
+        results = [[] for _ in range(len(queries))]
+        if not candidate_scores:
+            return results
+
+        all_scores = np.concatenate(candidate_scores, axis=0)
+        owners = [(doc_id, index) for doc_id, index, idx in candidate_refs for _ in range(len(idx))]
+        all_idx = np.concatenate([idx for _, _, idx in candidate_refs], axis=0)
+        for q in range(len(queries)):
+            order = np.argsort(-all_scores[:, q])[:top_k]
+            for pos in order:
+                document_id, index = owners[pos]
+                chunk_index = int(all_idx[pos, q])
+                results[q].append({
+                    'document_id': document_id,
+                    'chunk_index': chunk_index,
+                    'score': float(all_scores[pos, q]),
+                    'text': index.texts[chunk_index]
+                })
+        return results
+
+
+def resolve_local_path(uri: Optional[str]) -> Optional[str]:
+    """Map a Document.uri to a readable local path, remote schemes are not fetched"""
+    if not uri:
+        return None
+    parsed = urlparse(uri)
+    if parsed.scheme == 'file':
+        path = unquote(parsed.path)
+    elif '://' in uri:
+        return None
+    else:
+        path = uri
+    return path if os.path.isfile(path) else None
+
+
+class RetrievalService:
+    """Chunk, embed and search documents for RAG conversations"""
+
+    def __init__(self, store: VectorStore = None, embedder=None):
+        self.embedder = embedder or get_embedder()
+        self.store = store or VectorStore(dim=self.embedder.dim)
+
+    def index_text(self, document_id: str, text: str) -> int:
+        """Chunk and embed a document body, replacing any previous index"""
+        chunks = chunk_text(text)
+        vectors = self.embedder.embed(chunks) if chunks else np.zeros((0, self.embedder.dim), dtype=np.float32)
+        return self.store.write(document_id, vectors, chunks)
+
+    def is_indexed(self, document_id: str) -> bool:
+        return self.store.has(document_id)
+
+    def embed_query(self, query: str) -> np.ndarray:
+        return self.embedder.embed([query])[0]
+
+    def generations(self, document_ids: List[str]) -> tuple:
+        """Current index generation per document (None when not indexed), changes on re-ingestion"""
+        indexes = [self.store.index(document_id) for document_id in document_ids]
+        return tuple(index.generation if index else None for index in indexes)
+
+    def retrieve(self, query: str, document_ids: List[str], top_k: int = None, query_vector: np.ndarray = None) -> List[Dict]:
+        """Most similar chunks for the query across the given documents, query_vector skips embedding it again"""
+        if not document_ids:
+            return []
+        if query_vector is None:
+            query_vector = self.embed_query(query)
+        return self.store.search(query_vector, document_ids, top_k or Config.RETRIEVAL_TOP_K)[0]
+
+    def build_context(self, query: str, document_ids: List[str], top_k: int = None,
+                      query_vector: np.ndarray = None) -> Optional[str]:
+        """Retrieved chunks joined into a context block, None when nothing relevant is indexed"""
+        hits = [hit for hit in self.retrieve(query, document_ids, top_k, query_vector) if hit['score'] > 0]
+        if not hits:
+            return None
+        return "\n\n".join(hit['text'] for hit in hits)
@@ -0,0 +1,160 @@
+import asyncio
+import json
+import threading
+import time
+import uuid
+from typing import Any, Callable, Dict, Optional, Tuple
+
+from app.config import Config
+from app.utils.metrics import registry
+from app.utils.shared_store import get_shared_store
+
+coalesced_total = registry.counter('llm_coalesced_total', 'Provider calls avoided by joining an identical in-flight call', ['mode', 'scope'])
+
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """
+    Deduplicates concurrent calls with the same key within a process.
+    The first caller runs fn, callers arriving while it is in flight wait and get the same
+    result (or exception). do() returns (result, shared): shared is True for every caller
+    that did not make the call itself, so usage is only accounted to the one that did.
+    Nothing is remembered once the call has finished.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls: Dict[str, _Call] = {}
+
+    def do(self, key: str, fn: Callable[[], Any], mode: str = '') -> Tuple[Any, bool]:
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+        if not leader:
+            coalesced_total.labels(mode=mode, scope='thread').inc()
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result, True
+
+        try:
+            call.result, shared = self._lead(key, fn, mode)
+            return call.result, shared
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+
+    def _lead(self, key: str, fn: Callable[[], Any], mode: str) -> Tuple[Any, bool]:
+        return fn(), False
+
+
+class SharedSingleFlight(SingleFlight):
+    """
+    Extends coalescing across processes through a lock in the shared store.
+    One thread per process takes part: the process holding the lock calls upstream, the
+    others register as waiters and poll. The result is published (JSON encoded) only when
+    someone is waiting, and the last waiter to read it deletes it, so it never serves as
+    a cache; lock_ttl bounds it if a waiter dies. When the holder fails (or its lock
+    expires) without a result, a waiter takes the lock and calls itself.
+    """
+
+    def __init__(self, store=None, lock_ttl: float = 60, poll_interval: float = 0.05, prefix: str = 'llm-flight:'):
+        super().__init__()
+        self.store = store or get_shared_store()
+        self.lock_ttl = lock_ttl
+        self.poll_interval = poll_interval
+        self.prefix = prefix
+
+    def _lead(self, key: str, fn: Callable[[], Any], mode: str) -> Tuple[Any, bool]:
+        lock_key, result_key = f"{self.prefix}{key}:lock", f"{self.prefix}{key}:result"
+        waiters_key = f"{self.prefix}{key}:waiters"
+        ttl_ms = int(self.lock_ttl * 1000)
+        token = uuid.uuid4().hex
+        waiting = False
+        while True:
+            raw = self.store.get(result_key)
+            if raw is not None:
+                coalesced_total.labels(mode=mode, scope='process').inc()
+                # one that arrived after publishing reads along, the last registered waiter deletes it
+                if waiting and self.store.incrby(waiters_key, -1) <= 0:
+                    self.store.delete(result_key, waiters_key)
+                return json.loads(raw), True
+            if self.store.set(lock_key, token, nx=True, px=ttl_ms):
+                break
+            if not waiting:
+                waiting = True
+                self.store.incrby(waiters_key, 1)
+                self.store.pexpire(waiters_key, ttl_ms)
+            time.sleep(self.poll_interval)
+        if waiting:
+            self.store.incrby(waiters_key, -1)  # calling ourselves now
+
+        try:
+            result = fn()
+            if int(self.store.get(waiters_key) or 0) > 0:
+                self.store.set(result_key, json.dumps(result), px=ttl_ms)
+            return result, False
+        finally:
+            if self.store.get(lock_key) in (token, token.encode()):
+                self.store.delete(lock_key)
+
+
+class AsyncSingleFlight:
+    """SingleFlight for coroutines on one event loop"""
+
+    def __init__(self):
+        self._calls: Dict[str, asyncio.Future] = {}
+
+    async def do(self, key: str, fn: Callable[[], Any], mode: str = '') -> Tuple[Any, bool]:
+        """(result, shared) like SingleFlight.do"""
+        future = self._calls.get(key)
+        if future is not None:
+            coalesced_total.labels(mode=mode, scope='task').inc()
+            # shield so a cancelled follower doesn't cancel the leader's call
+            return await asyncio.shield(future), True
+
+        future = self._calls[key] = asyncio.get_running_loop().create_future()
+        try:
+            result = await fn()
+            future.set_result(result)
+            return result, False
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except BaseException as e:
+            future.set_exception(e)
+            # mark it retrieved, followers may not exist
+            future.exception()
+            raise
+        finally:
+            del self._calls[key]
+
+
+_flights = {}
+_flights_lock = threading.Lock()
+
+
+def get_single_flight() -> Optional[SingleFlight]:
+    """Per-process coalescer for LLM_SINGLE_FLIGHT ("local", "shared" or "off")"""
+    scope = Config.LLM_SINGLE_FLIGHT
+    if scope == 'off':
+        return None
+    flight = _flights.get(scope)
+    if flight is None:
+        with _flights_lock:
+            flight = _flights.get(scope)
+            if flight is None:
+                flight = _flights[scope] = SharedSingleFlight() if scope == 'shared' else SingleFlight()
+    return flight
@@ -0,0 +1,171 @@
+import json
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from dataclasses import dataclass
+from datetime import datetime
+from typing import List, Optional
+
+from sqlalchemy import or_, update
+
+from app import db
+from app.config import Config
+from app.models import Conversation, Message
+from app.utils.metrics import registry
+
+group_size = registry.histogram('db_group_commit_turns', 'Chat turns persisted per commit', buckets=(1, 2, 4, 8, 16, 32, 64, 128))
+group_fallbacks_total = registry.counter('db_group_commit_fallbacks_total', 'Group commits retried turn by turn')
+
+
+@dataclass
+class TurnWrite:
+    """Rows one chat turn writes, built outside any session"""
+    conversation_id: str
+    user_message: str
+    user_created_at: datetime
+    assistant_reply: str
+    tokens_used: int
+    # set for the first turn of a conversation
+    new_conversation: Optional[dict] = None
+    summary: Optional[str] = None
+    summary_upto_id: Optional[int] = None
+
+
+def apply_turn(session, write: TurnWrite) -> dict:
+    """
+    Stage one turn in session and flush it: the conversation insert or a single UPDATE of
+    updated_at (and the rolling summary, which only moves forward), plus both messages.
+    Returns the persisted messages as dicts so nothing session-bound leaves the writer.
+    """
+    if write.new_conversation is not None:
+        session.add(Conversation(id=write.conversation_id, **write.new_conversation))
+    else:
+        touched = session.execute(
+            update(Conversation).where(Conversation.id == write.conversation_id, Conversation.deleted_at.is_(None))
+            .values(updated_at=datetime.utcnow())
+        ).rowcount
+        if not touched:
+            raise ValueError(f"Conversation with ID {write.conversation_id} not found")
+        if write.summary_upto_id is not None:
+            # a concurrent turn may already have folded further
+            session.execute(
+                update(Conversation)
+                .where(Conversation.id == write.conversation_id,
+                       or_(Conversation.summary_upto_id.is_(None), Conversation.summary_upto_id < write.summary_upto_id))
+                .values(summary=write.summary, summary_upto_id=write.summary_upto_id)
+            )
+
+    user_msg = Message(conversation_id=write.conversation_id, content=write.user_message,
+                       role='user', created_at=write.user_created_at)
+    assistant_msg = Message(conversation_id=write.conversation_id, content=write.assistant_reply, role='assistant',
+                            tokens_used=write.tokens_used, created_at=max(datetime.utcnow(), write.user_created_at))
+    session.add_all([user_msg, assistant_msg])
+    session.flush()
+    return {'user_message': user_msg.to_dict(), 'assistant_message': assistant_msg.to_dict()}
+
+
+def commit_turns(session, writes: List[TurnWrite]) -> list:
+    """Persist turns in one transaction, returns apply_turn results in order"""
+    try:
+        results = [apply_turn(session, write) for write in writes]
+        session.commit()
+        return results
+    except Exception:
+        session.rollback()
+        raise
+
+
+class GroupCommitWriter:
+    """
+    Write-behind queue that persists chat turns from many request threads with one commit.
+    A writer thread takes whatever turns are queued (up to max_batch, waiting at most
+    max_delay for company) and commits them together; each caller blocks on its future
+    until its turn is durable. A batch that fails is retried turn by turn, so one bad turn
+    only fails its own request.
+    """
+
+    def __init__(self, app, max_batch: int = 64, max_delay: float = 0.002, timeout: float = None):
+        self.app = app
+        self.max_batch = max_batch
+        self.max_delay = max_delay
+        # how long a caller waits for its turn: the batching delay plus the batch commit
+        # and the turn's own retry, each bounded by the statement timeout
+        self.timeout = timeout or max_delay + 2 * Config.DB_STATEMENT_TIMEOUT_MS / 1000.0
+        self._queue = queue.Queue()
+        self._thread = threading.Thread(target=self._run, name='turn-writer', daemon=True)
+        self._thread.start()
+
+    def submit(self, write: TurnWrite) -> Future:
+        future = Future()
+        self._queue.put((write, future))
+        return future
+
+    def write(self, write: TurnWrite) -> dict:
+        """Submit a turn and wait until it is committed, at most timeout seconds"""
+        return self.submit(write).result(timeout=self.timeout)
+
+    def _run(self):
+        while True:
+            batch = [self._queue.get()]
+            deadline = time.monotonic() + self.max_delay
+            while len(batch) < self.max_batch:
+                try:
+                    batch.append(self._queue.get(timeout=max(0.0, deadline - time.monotonic())))
+                except queue.Empty:
+                    break
+            try:
+                with self.app.app_context():
+                    try:
+                        self._commit(batch)
+                    finally:
+                        db.session.remove()
+            except Exception as e:
+                # fail what this batch left unanswered and keep the thread serving the queue
+                for _, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
+
+    def _commit(self, batch):
+        group_size.observe(len(batch))
+        try:
+            results = commit_turns(db.session, [write for write, _ in batch])
+        except Exception:
+            if len(batch) > 1:
+                group_fallbacks_total.inc()
+            results = []
+            for write, _ in batch:
+                try:
+                    results.append(commit_turns(db.session, [write])[0])
+                except Exception as e:
+                    results.append(e)
+        for (_, future), result in zip(batch, results):
+            if isinstance(result, Exception):
+                future.set_exception(result)
+            else:
+                future.set_result(result)
+
+
+_writers = {}
+_writers_lock = threading.Lock()
+
+
+def get_group_writer(app) -> GroupCommitWriter:
+    """One writer thread per application per process"""
+    writer = _writers.get(app)
+    if writer is None:
+        with _writers_lock:
+            writer = _writers.get(app)
+            if writer is None:
+                writer = _writers[app] = GroupCommitWriter(app, Config.DB_GROUP_COMMIT_MAX_TURNS,
+                                                           Config.DB_GROUP_COMMIT_DELAY_MS / 1000.0)
+    return writer
+
+
+def new_conversation_fields(user_id: int, mode: str, document_ids: Optional[list], first_message: str) -> dict:
+    return {
+        'user_id': user_id,
+        'mode': mode,
+        'document_ids': json.dumps(document_ids) if document_ids else None,
+        'title': first_message[:50] + "..." if len(first_message) > 50 else first_message
+    }
@@ -0,0 +1,96 @@
+import zlib
+
+from sqlalchemy import JSON, LargeBinary, Text
+from sqlalchemy.dialects.postgresql import JSONB
+from sqlalchemy.types import TypeDecorator
+
+from app.config import Config
+
+try:
+    import zstandard
+except ImportError:  # optional, zlib is used without it
+    zstandard = None
+
+# compressed values start with a NUL byte (text columns never hold one) and a codec byte,
+# anything else is plain UTF-8
+HEADER = b'\x00'
+RAW, ZLIB, ZSTD = b'r', b'z', b's'
+
+
+def default_codec() -> str:
+    codec = Config.MESSAGE_COMPRESSION
+    if codec == 'auto':
+        return 'zstd' if zstandard is not None else 'zlib'
+    if codec == 'zstd' and zstandard is None:
+        raise RuntimeError("MESSAGE_COMPRESSION is zstd but the zstandard package is not installed")
+    return codec
+
+
+def compress(data: bytes, codec: str = None, min_bytes: int = 0) -> bytes:
+    """data framed for decompress(), compressed when at least min_bytes long and it pays off"""
+    codec = codec or default_codec()
+    if codec != 'none' and len(data) >= min_bytes:
+        if codec == 'zstd':
+            packed = HEADER + ZSTD + zstandard.ZstdCompressor(level=3).compress(data)
+        else:
+            packed = HEADER + ZLIB + zlib.compress(data, 6)
+        if len(packed) < len(data):
+            return packed
+    return HEADER + RAW + data if data.startswith(HEADER) else data
+
+
+def decompress(data: bytes) -> bytes:
+    if not data.startswith(HEADER):
+        return data
+    codec, payload = data[1:2], data[2:]
+    if codec == ZLIB:
+        return zlib.decompress(payload)
+    if codec == ZSTD:
+        if zstandard is None:
+            raise RuntimeError("zstd compressed data but the zstandard package is not installed")
+        return zstandard.ZstdDecompressor().decompress(payload)
+    if codec == RAW:
+        return payload
+    raise ValueError(f"Unknown compression codec {codec!r}")
+
+
+class CompressedText(TypeDecorator):
+    """
+    Text stored as bytes, compressed (MESSAGE_COMPRESSION) from MESSAGE_COMPRESSION_MIN_BYTES
+    up; short values stay plain UTF-8. SQLite keeps bytes in a TEXT column as they are, so
+    rows written before compression read back unchanged there, PostgreSQL stores bytea
+    ("flask migrate" converts an existing text column).
+    """
+    impl = LargeBinary
+    cache_ok = True
+    retype_using = "convert_to({column}, 'UTF8')"
+
+    def load_dialect_impl(self, dialect):
+        if dialect.name == 'sqlite':
+            return dialect.type_descriptor(Text())
+        return dialect.type_descriptor(LargeBinary())
+
+    def process_bind_param(self, value, dialect):
+        if value is None:
+            return None
+        return compress(value.encode(), min_bytes=Config.MESSAGE_COMPRESSION_MIN_BYTES)
+
+    def process_result_value(self, value, dialect):
+        if value is None or isinstance(value, str):
+            return value
+        return decompress(bytes(value)).decode()
+
+
+class JSONDocument(TypeDecorator):
+    """JSON column: json on SQLite (legacy json text reads back parsed), jsonb on PostgreSQL"""
+    impl = JSON
+    cache_ok = True
+    retype_using = "{column}::jsonb"
+
+    def __init__(self):
+        super().__init__(none_as_null=True)
+
+    def load_dialect_impl(self, dialect):
+        if dialect.name == 'postgresql':
+            return dialect.type_descriptor(JSONB(none_as_null=True))
+        return dialect.type_descriptor(JSON(none_as_null=True))
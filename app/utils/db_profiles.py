@@ -0,0 +1,123 @@
+"""
+Database profiles: engine options and connection setup per backend.
+
+SQLite gets WAL, synchronous=NORMAL, a busy timeout and mmap on every new connection so
+readers don't block the writer and concurrent writers wait instead of failing with
+"database is locked". PostgreSQL gets a sized, pre-pinged, recycled pool and a statement
+timeout. An optional read replica serves the conversation list/detail reads.
+"""
+from flask import current_app
+from sqlalchemy import create_engine, event
+from sqlalchemy.engine import Engine, make_url
+from sqlalchemy.orm import scoped_session, sessionmaker
+
+from app.config import Config
+from app.utils.db import db
+from app.utils.metrics import registry
+
+pool_checked_out = registry.gauge('db_pool_checked_out', 'Connections currently checked out of the pool', ['engine'])
+pool_size_gauge = registry.gauge('db_pool_size', 'Configured pool size (0 for pools without a fixed size)', ['engine'])
+pool_connects_total = registry.counter('db_pool_connects_total', 'New DBAPI connections opened', ['engine'])
+pool_checkouts_total = registry.counter('db_pool_checkouts_total', 'Connections checked out of the pool', ['engine'])
+
+
+def profile_for(uri: str) -> str:
+    """'sqlite', 'sqlite_memory' or 'postgresql', other backends get 'default'"""
+    url = make_url(uri)
+    if url.get_backend_name() == 'sqlite':
+        return 'sqlite_memory' if url.database in (None, '', ':memory:') else 'sqlite'
+    if url.get_backend_name() == 'postgresql':
+        return 'postgresql'
+    return 'default'
+
+
+def engine_options(uri: str) -> dict:
+    """create_engine keyword arguments for the profile of uri"""
+    profile = profile_for(uri)
+    if profile == 'sqlite':
+        # the driver level timeout is the busy handler for connections opened before the pragma runs
+        return {'connect_args': {'timeout': Config.SQLITE_BUSY_TIMEOUT_MS / 1000.0, 'check_same_thread': False}}
+    if profile == 'postgresql':
+        options = {
+            'pool_size': Config.DB_POOL_SIZE,
+            'max_overflow': Config.DB_MAX_OVERFLOW,
+            'pool_timeout': Config.DB_POOL_TIMEOUT,
+            'pool_recycle': Config.DB_POOL_RECYCLE,
+            'pool_pre_ping': True,
+        }
+        if Config.DB_STATEMENT_TIMEOUT_MS:
+            options['connect_args'] = {'options': f'-c statement_timeout={Config.DB_STATEMENT_TIMEOUT_MS}'}
+        return options
+    return {}
+
+
+def _sqlite_pragmas(dbapi_connection, connection_record):
+    cursor = dbapi_connection.cursor()
+    try:
+        cursor.execute("PRAGMA journal_mode=WAL")
+        cursor.execute(f"PRAGMA synchronous={Config.SQLITE_SYNCHRONOUS}")
+        cursor.execute(f"PRAGMA busy_timeout={int(Config.SQLITE_BUSY_TIMEOUT_MS)}")
+        cursor.execute(f"PRAGMA mmap_size={int(Config.SQLITE_MMAP_SIZE)}")
+    finally:
+        cursor.close()
+
+
+def configure_engine(engine: Engine, name: str = 'primary') -> Engine:
+    """Install the profile's connection setup and pool metrics on engine"""
+    if profile_for(str(engine.url)) == 'sqlite' and Config.SQLITE_PRAGMAS:
+        event.listen(engine, 'connect', _sqlite_pragmas)
+
+    pool_size_gauge.set(getattr(engine.pool, 'size', lambda: 0)(), engine=name)
+    checked_out = pool_checked_out.labels(engine=name)
+
+    @event.listens_for(engine, 'connect')
+    def on_connect(dbapi_connection, connection_record):
+        pool_connects_total.labels(engine=name).inc()
+
+    @event.listens_for(engine, 'checkout')
+    def on_checkout(dbapi_connection, connection_record, connection_proxy):
+        pool_checkouts_total.labels(engine=name).inc()
+        checked_out.inc()
+
+    @event.listens_for(engine, 'checkin')
+    def on_checkin(dbapi_connection, connection_record):
+        checked_out.inc(-1)
+
+    return engine
+
+
+def init_read_replica(app):
+    """
+    Session factory for DATABASE_REPLICA_URL, stored on the app; read_session() falls back
+    to the primary session when no replica is configured.
+    """
+    uri = app.config.get('DATABASE_REPLICA_URL')
+    if not uri:
+        return None
+    engine = configure_engine(create_engine(uri, **engine_options(uri)), name='replica')
+    sessions = scoped_session(sessionmaker(bind=engine))
+    app.extensions['read_replica'] = sessions
+
+    @app.teardown_appcontext
+    def remove_replica_session(exc):
+        sessions.remove()
+
+    return sessions
+
+
+def read_session():
+    """Session for read-only queries: the replica when configured, else the primary session"""
+    replica = current_app.extensions.get('read_replica')
+    return replica() if replica is not None else db.session
+
+
+def dispose_after_fork(app):
+    """
+    Drop pooled connections inherited from the parent process, call first thing in a forked
+    worker (gunicorn post_fork). close=False leaves the parent's sockets alone.
+    """
+    with app.app_context():
+        db.engine.dispose(close=False)
+    replica = app.extensions.get('read_replica')
+    if replica is not None:
+        replica.session_factory.kw['bind'].dispose(close=False)
@@ -0,0 +1,51 @@
+import json
+from typing import Any, Iterable, Iterator, Optional
+
+from flask import Response, request, stream_with_context
+from werkzeug.datastructures import MIMEAccept
+from werkzeug.http import parse_accept_header
+
+
+def wants_event_stream(stream_param, accept_header) -> bool:
+    """
+    Streaming is requested with ?stream=1 or when text/event-stream is the client's
+    preferred Accept type. Shared by the Flask routes and the ASGI entry point so both
+    make the same decision for the same request.
+    """
+    if (stream_param or '').lower() in ('1', 'true', 'yes'):
+        return True
+    return parse_accept_header(accept_header or '', MIMEAccept).best == 'text/event-stream'
+
+
+def bulk_items(key: str, invalid) -> Optional[Iterable[Any]]:
+    """
+    Items of a bulk request: an application/x-ndjson body (one item per line, parsed as it
+    is read) or a json object holding a list under key. Unparsable lines become
+    invalid(error) so they fail on their own. None when the body has neither.
+    """
+    if request.mimetype == 'application/x-ndjson':
+        def lines():
+            for line in request.stream:
+                if not line.strip():
+                    continue
+                try:
+                    yield json.loads(line)
+                except ValueError as e:
+                    yield invalid(f"Invalid JSON: {e}")
+        return lines()
+    data = request.get_json(silent=True)
+    if isinstance(data, dict) and isinstance(data.get(key), list):
+        return data[key]
+    return None
+
+
+def ndjson_response(results: Iterator[dict]) -> Response:
+    """Stream per-item results as they are produced, closed by a {"summary": ...} line"""
+    def generate():
+        counts = {}
+        for result in results:
+            counts[result['status']] = counts.get(result['status'], 0) + 1
+            yield json.dumps(result) + "\n"
+        yield json.dumps({'summary': {'total': sum(counts.values()), **counts}}) + "\n"
+    return Response(stream_with_context(generate()), mimetype='application/x-ndjson',
+                    headers={'X-Accel-Buffering': 'no'})
@@ -0,0 +1,33 @@
+import functools
+import os
+import threading
+
+
+class process_singleton:
+    """
+    Decorator turning a factory into a getter that builds the instance on first call and
+    returns it afterwards. Nothing is built at import, so importing the routes is cheap and
+    an app preloaded before workers fork (gunicorn --preload) holds no threads, pools or
+    sockets. A child forked after the instance was built starts over and builds its own.
+    """
+
+    def __init__(self, factory):
+        functools.update_wrapper(self, factory)
+        self.factory = factory
+        self.reset()
+        if hasattr(os, 'register_at_fork'):
+            os.register_at_fork(after_in_child=self.reset)
+
+    def __call__(self):
+        instance = self._instance
+        if instance is None:
+            with self._lock:
+                if self._instance is None:
+                    self._instance = self.factory()
+                instance = self._instance
+        return instance
+
+    def reset(self):
+        """Forget the instance (and a lock a parent thread may have held while forking)"""
+        self._lock = threading.Lock()
+        self._instance = None
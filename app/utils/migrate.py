@@ -0,0 +1,95 @@
+import click
+from sqlalchemy import inspect, text
+
+from app.utils.db import db
+
+
+def _column_ddl(column, dialect) -> str:
+    ddl = f"{column.name} {column.type.compile(dialect=dialect)}"
+    default = column.default.arg if column.default is not None and column.default.is_scalar else None
+    if default is not None:
+        literal = f"'{default}'" if isinstance(default, str) else repr(default)
+        ddl += f" DEFAULT {literal}"
+        if not column.nullable:
+            ddl += " NOT NULL"
+    return ddl
+
+
+def _retype(conn, table, column, current) -> bool:
+    """Convert a column created with an older type, SQLite needs none of these conversions"""
+    using = getattr(column.type, 'retype_using', None)
+    dialect = db.engine.dialect
+    if using is None or dialect.name != 'postgresql':
+        return False
+    target = column.type.compile(dialect=dialect)
+    if current.compile(dialect=dialect) == target:
+        return False
+    conn.execute(text(f"ALTER TABLE {table.name} ALTER COLUMN {column.name} TYPE {target} "
+                      f"USING {using.format(column=column.name)}"))
+    return True
+
+
+def upgrade_schema():
+    """
+    Create missing tables, and add columns and indexes introduced since a database was created.
+    db.create_all() never alters existing tables, so new model columns would otherwise
+    fail with "no such column" on databases created by an older release. On PostgreSQL,
+    columns whose type declares retype_using (compressed text, json) are converted in place.
+    Returns the list of "table.column" / index names that were added or converted.
+    """
+    db.create_all()
+    inspector = inspect(db.engine)
+    added = []
+    with db.engine.begin() as conn:
+        for table in db.metadata.sorted_tables:
+            existing = {col['name']: col['type'] for col in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.name in existing:
+                    if _retype(conn, table, column, existing[column.name]):
+                        added.append(f"{table.name}.{column.name} ({column.type.compile(dialect=db.engine.dialect)})")
+                    continue
+                conn.execute(text(f"ALTER TABLE {table.name} ADD COLUMN {_column_ddl(column, db.engine.dialect)}"))
+                added.append(f"{table.name}.{column.name}")
+            existing_indexes = {index['name'] for index in inspector.get_indexes(table.name)}
+            for index in table.indexes:
+                if index.name not in existing_indexes:
+                    index.create(bind=conn)
+                    added.append(index.name)
+    return added
+
+
+def init_cli(app):
+    """
+    Maintenance commands, run outside the web workers:
+
+        flask --app app migrate     once per deploy, instead of on every worker boot
+        flask --app app purge       finish deletion jobs a restart or an error interrupted
+        flask --app app archive     move idle conversations to the archive tier (cron it)
+    """
+
+    @app.cli.command('migrate')
+    def migrate_command():
+        """Create missing tables, columns and indexes"""
+        added = upgrade_schema()
+        click.echo("\n".join(f"added {name}" for name in added) if added else "schema is up to date")
+
+    @app.cli.command('purge')
+    def purge_command():
+        """Run every unfinished deletion job to completion"""
+        from app.services.deletion_service import get_deletion_service
+
+        service = get_deletion_service()
+        jobs = service.unfinished_jobs()
+        for job_id in jobs:
+            click.echo(f"{job_id} {service.purge(job_id)}")
+        if not jobs:
+            click.echo("no unfinished deletion jobs")
+
+    @app.cli.command('archive')
+    @click.option('--older-than-days', type=float, default=None,
+                  help='idle age to archive at, ARCHIVE_AFTER_DAYS by default')
+    def archive_command(older_than_days):
+        """Move the messages of idle conversations into compressed archive files"""
+        from app.services.archive_service import get_archive_service
+
+        click.echo(f"archived {get_archive_service().archive_idle(older_than_days)} conversations")
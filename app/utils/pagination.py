@@ -0,0 +1,70 @@
+import base64
+import json
+from datetime import datetime
+from typing import List, Optional, Tuple
+
+from flask import request
+from sqlalchemy import and_, or_
+
+DEFAULT_LIMIT = 50
+MAX_LIMIT = 200
+
+
+def parse_limit(default: int = DEFAULT_LIMIT, maximum: int = MAX_LIMIT) -> int:
+    """?limit=N clamped to [1, maximum], raises ValueError on garbage"""
+    raw = request.args.get('limit')
+    if raw is None:
+        return default
+    try:
+        limit = int(raw)
+    except ValueError:
+        raise ValueError("limit must be an integer")
+    return max(1, min(limit, maximum))
+
+
+def parse_fields(allowed) -> Optional[List[str]]:
+    """?fields=a,b sparse field selection, None when not given, ValueError on unknown names"""
+    raw = request.args.get('fields')
+    if not raw:
+        return None
+    fields = [name.strip() for name in raw.split(',') if name.strip()]
+    unknown = [name for name in fields if name not in allowed]
+    if unknown:
+        raise ValueError(f"Unknown fields: {', '.join(unknown)}")
+    return fields
+
+
+def encode_cursor(sort_value: datetime, row_id) -> str:
+    """Opaque cursor for the position right after (sort_value, row_id)"""
+    raw = json.dumps([sort_value.isoformat(), row_id], separators=(',', ':')).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+
+def decode_cursor(cursor: str) -> Tuple[datetime, object]:
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        sort_value, row_id = json.loads(raw)
+        return datetime.fromisoformat(sort_value), row_id
+    except (ValueError, TypeError):
+        raise ValueError("Invalid cursor")
+
+
+def keyset_page(query, sort_column, id_column, cursor: Optional[str], limit: int):
+    """
+    One page of query ordered newest first on (sort_column, id_column).
+    Returns (rows, next_cursor), next_cursor is None on the last page.
+    """
+    if cursor:
+        sort_value, row_id = decode_cursor(cursor)
+        query = query.filter(or_(
+            sort_column < sort_value,
+            and_(sort_column == sort_value, id_column < row_id)
+        ))
+    # one extra row tells whether another page exists
+    rows = query.order_by(sort_column.desc(), id_column.desc()).limit(limit + 1).all()
+    page = rows[:limit]
+    next_cursor = None
+    if len(rows) > limit:
+        last = page[-1]
+        next_cursor = encode_cursor(getattr(last, sort_column.key), getattr(last, id_column.key))
+    return page, next_cursor
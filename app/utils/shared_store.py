@@ -0,0 +1,80 @@
+import threading
+import time
+from typing import Optional
+
+from app.config import Config
+
+
+class LocalSharedStore:
+    """
+    In-process stand-in for a shared key/value server (a subset of the redis client API).
+    Values are bytes or str, px is a time to live in milliseconds. Swap in a real
+    redis client with SHARED_STORE_URL to share state between worker processes.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._data = {}  # key -> (value, expires_at or None)
+
+    def _live(self, key):
+        entry = self._data.get(key)
+        if entry is None:
+            return None
+        if entry[1] is not None and entry[1] <= time.monotonic():
+            del self._data[key]
+            return None
+        return entry
+
+    def get(self, key: str):
+        with self._lock:
+            entry = self._live(key)
+            return entry[0] if entry else None
+
+    def set(self, key: str, value, nx: bool = False, px: Optional[int] = None) -> bool:
+        """Returns False when nx is set and the key already exists, like redis SET NX"""
+        with self._lock:
+            if nx and self._live(key) is not None:
+                return False
+            expires_at = time.monotonic() + px / 1000.0 if px else None
+            self._data[key] = (value, expires_at)
+            return True
+
+    def delete(self, *keys: str) -> int:
+        with self._lock:
+            return sum(1 for key in keys if self._data.pop(key, None) is not None)
+
+    def incrby(self, key: str, amount: int = 1) -> int:
+        with self._lock:
+            entry = self._live(key)
+            value = int(entry[0]) + amount if entry else amount
+            self._data[key] = (value, entry[1] if entry else None)
+            return value
+
+    def pexpire(self, key: str, px: int) -> bool:
+        with self._lock:
+            entry = self._live(key)
+            if entry is None:
+                return False
+            self._data[key] = (entry[0], time.monotonic() + px / 1000.0)
+            return True
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_shared_store():
+    """Process-wide shared store: redis when SHARED_STORE_URL is set, otherwise the local stand-in"""
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                if Config.SHARED_STORE_URL:
+                    try:
+                        import redis
+                    except ImportError:
+                        raise RuntimeError("SHARED_STORE_URL is set but the redis package is not installed")
+                    _store = redis.Redis.from_url(Config.SHARED_STORE_URL)
+                else:
+                    _store = LocalSharedStore()
+    return _store
@@ -0,0 +1,236 @@
+"""
+Per-request tracing and hot-path instrumentation.
+
+A request carries a Trace in a context variable (so it follows the request thread and
+async tasks alike). span() times a phase into the trace and into the
+request_phase_seconds histogram; SQLAlchemy engine events add query counts and time.
+At the end of a request the totals go to http_request_seconds, an optional structured
+timing log line and the Server-Timing header. A sampling profiler can be attached to
+single requests at runtime.
+"""
+import contextvars
+import json
+import logging
+import random
+import sys
+import threading
+import time
+import uuid
+from collections import Counter as Tally, OrderedDict
+from contextlib import contextmanager
+from typing import Optional
+
+from flask import g, request
+from sqlalchemy import event
+
+from app.utils.metrics import registry
+
+logger = logging.getLogger('app.timing')
+
+phase_seconds = registry.histogram('request_phase_seconds', 'Time spent per phase of a request', ['phase'])
+http_seconds = registry.histogram('http_request_seconds', 'Request latency up to the response being handed to the server',
+                                  ['method', 'endpoint', 'status'])
+db_query_seconds = registry.histogram('db_query_seconds', 'SQL statement execution time', ['statement'],
+                                      buckets=(0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 5.0))
+db_queries_per_request = registry.histogram('db_queries_per_request', 'SQL statements per request', ['endpoint'],
+                                            buckets=(0, 1, 2, 4, 8, 16, 32, 64, 128))
+llm_seconds = registry.histogram('llm_completion_seconds', 'Provider completion latency', ['provider', 'model', 'mode'])
+llm_tokens = registry.histogram('llm_completion_tokens', 'Tokens per provider completion', ['provider', 'model', 'mode'],
+                                buckets=(16, 64, 128, 256, 512, 1024, 2048, 4096, 8192))
+
+_current = contextvars.ContextVar('trace', default=None)
+
+
+class Trace:
+    """Timings collected while serving one request"""
+
+    def __init__(self, request_id: str):
+        self.request_id = request_id
+        self.started = time.perf_counter()
+        self.spans = Tally()  # phase -> seconds, repeated phases add up
+        self.db_queries = 0
+        self.db_seconds = 0.0
+
+    def elapsed(self) -> float:
+        return time.perf_counter() - self.started
+
+
+def current_trace() -> Optional[Trace]:
+    return _current.get()
+
+
+@contextmanager
+def span(phase: str):
+    """Time a phase of the current request, also usable as a decorator"""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - started
+        phase_seconds.labels(phase=phase).observe(elapsed)
+        trace = _current.get()
+        if trace is not None:
+            trace.spans[phase] += elapsed
+
+
+def record_completion(provider: str, model: str, mode: str, seconds: float, tokens: int):
+    """Upstream latency and token count of one completion"""
+    llm_seconds.labels(provider=provider, model=model, mode=mode).observe(seconds)
+    if tokens:
+        llm_tokens.labels(provider=provider, model=model, mode=mode).observe(tokens)
+
+
+def instrument_engine(engine):
+    """Time every statement executed on engine"""
+
+    @event.listens_for(engine, 'before_cursor_execute')
+    def before(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault('query_started', []).append(time.perf_counter())
+
+    @event.listens_for(engine, 'after_cursor_execute')
+    def after(conn, cursor, statement, parameters, context, executemany):
+        elapsed = time.perf_counter() - conn.info['query_started'].pop()
+        verb = statement.lstrip().split(None, 1)[0].upper() if statement.strip() else 'OTHER'
+        db_query_seconds.labels(statement=verb).observe(elapsed)
+        trace = _current.get()
+        if trace is not None:
+            trace.db_queries += 1
+            trace.db_seconds += elapsed
+
+    @event.listens_for(engine, 'handle_error')
+    def failed(context):
+        # after_cursor_execute doesn't run for a failed statement
+        started = context.connection.info.get('query_started') if context.connection is not None else None
+        if started:
+            started.pop()
+
+    return engine
+
+
+class SamplingProfiler:
+    """
+    Samples the stack of one thread every interval seconds from a background thread.
+    Stacks are kept in the collapsed format flame graph tools read ("a;b;c count").
+    """
+
+    def __init__(self, thread_id: int, interval: float = 0.005):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks = Tally()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='request-profiler', daemon=True)
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def stop(self) -> str:
+        self._stop.set()
+        self._thread.join()
+        return "\n".join(f"{stack} {count}" for stack, count in self.stacks.most_common())
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is None:
+                continue
+            names = []
+            while frame is not None:
+                names.append(f"{frame.f_code.co_name} ({frame.f_code.co_filename.rsplit('/', 1)[-1]}:{frame.f_lineno})")
+                frame = frame.f_back
+            self.stacks[";".join(reversed(names))] += 1
+
+
+class ProfilerControl:
+    """
+    Runtime switch for request profiling: when allowed, a request sending X-Profile: 1 is
+    profiled, and sample_rate profiles that fraction of all requests. The latest profiles
+    are kept in memory by request id.
+    """
+
+    def __init__(self, allowed: bool = False, sample_rate: float = 0.0, interval: float = 0.005, keep: int = 20):
+        self.allowed = allowed
+        self.sample_rate = sample_rate
+        self.interval = interval
+        self.keep = keep
+        self._lock = threading.Lock()
+        self._profiles = OrderedDict()  # request id -> collapsed stacks
+
+    def wanted(self) -> bool:
+        if not self.allowed:
+            return False
+        return request.headers.get('X-Profile') == '1' or (self.sample_rate > 0 and random.random() < self.sample_rate)
+
+    def save(self, request_id: str, stacks: str):
+        with self._lock:
+            self._profiles[request_id] = stacks
+            while len(self._profiles) > self.keep:
+                self._profiles.popitem(last=False)
+
+    def get(self, request_id: str) -> Optional[str]:
+        with self._lock:
+            return self._profiles.get(request_id)
+
+    def ids(self) -> list:
+        with self._lock:
+            return list(reversed(self._profiles))
+
+
+def init_tracing(app):
+    """Request hooks for traces, request metrics, the timing log and profiling"""
+    profiler = ProfilerControl(allowed=app.config['PROFILER_ALLOWED'], interval=app.config['PROFILER_INTERVAL_MS'] / 1000.0)
+    app.extensions['profiler'] = profiler
+
+    @app.before_request
+    def start_trace():
+        trace = Trace(request.headers.get('X-Request-ID') or uuid.uuid4().hex)
+        g.trace_token = _current.set(trace)
+        g.trace = trace
+        if profiler.wanted():
+            g.profiler = SamplingProfiler(threading.get_ident(), profiler.interval).start()
+
+    @app.after_request
+    def finish_trace(response):
+        trace = g.get('trace')
+        if trace is None:
+            return response
+        elapsed = trace.elapsed()
+        endpoint = request.endpoint or 'unmatched'
+        http_seconds.labels(method=request.method, endpoint=endpoint, status=response.status_code).observe(elapsed)
+        db_queries_per_request.labels(endpoint=endpoint).observe(trace.db_queries)
+        response.headers['X-Request-ID'] = trace.request_id
+        timings = [f"db;dur={trace.db_seconds * 1000:.1f}"] + [
+            f"{phase};dur={seconds * 1000:.1f}" for phase, seconds in trace.spans.items()]
+        response.headers['Server-Timing'] = ", ".join(timings + [f"total;dur={elapsed * 1000:.1f}"])
+
+        sampler = g.pop('profiler', None)
+        if sampler is not None:
+            profiler.save(trace.request_id, sampler.stop())
+            response.headers['X-Profile-ID'] = trace.request_id
+        if app.config['REQUEST_TIMING_LOG']:
+            logger.info(json.dumps({
+                'request_id': trace.request_id,
+                'method': request.method,
+                'endpoint': endpoint,
+                'status': response.status_code,
+                'duration_ms': round(elapsed * 1000, 2),
+                'db_queries': trace.db_queries,
+                'db_ms': round(trace.db_seconds * 1000, 2),
+                'spans_ms': {phase: round(seconds * 1000, 2) for phase, seconds in trace.spans.items()},
+            }))
+        return response
+
+    @app.teardown_request
+    def end_trace(exc):
+        sampler = g.pop('profiler', None)
+        if sampler is not None:
+            sampler.stop()
+        token = g.pop('trace_token', None)
+        if token is not None:
+            try:
+                _current.reset(token)
+            except ValueError:
+                # a streamed response finishes in another context
+                _current.set(None)
+
+    return profiler
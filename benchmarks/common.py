@@ -0,0 +1,36 @@
+"""Helpers shared by the benchmark scripts"""
+import os
+import resource
+import subprocess
+import sys
+
+
+def percentiles(samples) -> dict:
+    """p50/p95/p99 of latencies in seconds, reported in milliseconds"""
+    if not samples:
+        return {}
+    samples = sorted(samples)
+    pick = lambda q: round(samples[min(len(samples) - 1, int(q * len(samples)))] * 1000, 3)
+    return {'p50_ms': pick(0.50), 'p95_ms': pick(0.95), 'p99_ms': pick(0.99)}
+
+
+def memory_mb() -> dict:
+    """Current and peak resident memory of this process"""
+    peak_kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if sys.platform == 'darwin':
+        peak_kb //= 1024  # bytes there
+    current = None
+    try:
+        with open('/proc/self/statm') as statm:
+            current = int(statm.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') / 2 ** 20
+    except OSError:
+        pass
+    return {'rss_mb': round(current, 1) if current is not None else None, 'peak_rss_mb': round(peak_kb / 1024, 1)}
+
+
+def git_revision() -> str:
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
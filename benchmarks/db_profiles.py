@@ -0,0 +1,131 @@
+"""
+Compare database profiles under concurrent chat-turn writes and conversation reads.
+
+    python -m benchmarks.db_profiles --writers 4 --readers 4 --turns 200
+    python -m benchmarks.db_profiles --postgres postgresql://localhost/botgpt_bench
+
+Each profile gets a fresh database; writer threads append turns to their own
+conversation while reader threads load conversations with their messages. The report
+is JSON: throughput, p50/p95/p99 latencies, "database is locked" errors and pool stats.
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import threading
+import time
+
+from app import create_app, db
+from app.models import Conversation, Message, User
+from app.config import Config
+from app.utils.db_profiles import pool_checkouts_total
+from benchmarks.common import percentiles
+
+
+def run_profile(name, uri, engine_options, writers, readers, turns, pragmas=True):
+    Config.SQLITE_PRAGMAS = pragmas
+    checkouts_before = pool_checkouts_total.value(engine='primary')
+    config = {'TESTING': True, 'SQLALCHEMY_DATABASE_URI': uri}
+    if engine_options is not None:
+        config['SQLALCHEMY_ENGINE_OPTIONS'] = engine_options
+    app = create_app(config)
+    with app.app_context():
+        db.drop_all()
+        db.create_all()
+        user = User(username='bench')
+        db.session.add(user)
+        db.session.flush()
+        for i in range(writers):
+            db.session.add(Conversation(id=f'bench-{i}', user_id=user.id, title='bench'))
+        db.session.commit()
+
+    write_latencies, read_latencies, errors = [], [], []
+    done = threading.Event()
+    lock = threading.Lock()
+
+    def writer(index):
+        with app.app_context():
+            for n in range(turns):
+                started = time.perf_counter()
+                try:
+                    db.session.add_all([
+                        Message(conversation_id=f'bench-{index}', role='user', content=f'question {n}'),
+                        Message(conversation_id=f'bench-{index}', role='assistant', content=f'answer {n}', tokens_used=8),
+                    ])
+                    db.session.commit()
+                    with lock:
+                        write_latencies.append(time.perf_counter() - started)
+                except Exception as e:
+                    db.session.rollback()
+                    with lock:
+                        errors.append(type(e).__name__)
+            db.session.remove()
+
+    def reader(index):
+        from app.services.conversation_service import ConversationService
+        service = ConversationService()
+        with app.app_context():
+            while not done.is_set():
+                started = time.perf_counter()
+                try:
+                    service.get_conversation_by_id(f'bench-{index % writers}')
+                    with lock:
+                        read_latencies.append(time.perf_counter() - started)
+                except Exception as e:
+                    with lock:
+                        errors.append(type(e).__name__)
+                db.session.remove()
+
+    write_threads = [threading.Thread(target=writer, args=(i,)) for i in range(writers)]
+    read_threads = [threading.Thread(target=reader, args=(i,)) for i in range(readers)]
+    started = time.perf_counter()
+    for thread in write_threads + read_threads:
+        thread.start()
+    for thread in write_threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+    done.set()
+    for thread in read_threads:
+        thread.join()
+
+    with app.app_context():
+        db.engine.dispose()
+    return {
+        'profile': name,
+        'seconds': round(elapsed, 3),
+        'turns_per_second': round(len(write_latencies) / elapsed, 1),
+        'reads_per_second': round(len(read_latencies) / elapsed, 1),
+        'writes': percentiles(write_latencies),
+        'reads': percentiles(read_latencies),
+        'errors': len(errors),
+        'error_types': sorted(set(errors)),
+        'pool_checkouts': pool_checkouts_total.value(engine='primary') - checkouts_before,
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--writers', type=int, default=4)
+    parser.add_argument('--readers', type=int, default=4)
+    parser.add_argument('--turns', type=int, default=200, help='turns per writer')
+    parser.add_argument('--postgres', help='also run the postgresql profile against this URL')
+    args = parser.parse_args(argv)
+
+    results = []
+    with tempfile.TemporaryDirectory() as tmp:
+        # the driver default: rollback journal, synchronous=FULL, 5s driver timeout
+        results.append(run_profile('sqlite_default', f"sqlite:///{os.path.join(tmp, 'default.db')}",
+                                   {'connect_args': {'check_same_thread': False}},
+                                   args.writers, args.readers, args.turns, pragmas=False))
+        results.append(run_profile('sqlite_wal', f"sqlite:///{os.path.join(tmp, 'wal.db')}", None,
+                                   args.writers, args.readers, args.turns))
+    if args.postgres:
+        results.append(run_profile('postgresql', args.postgres, None, args.writers, args.readers, args.turns))
+    json.dump({'writers': args.writers, 'readers': args.readers, 'turns': args.turns, 'results': results},
+              sys.stdout, indent=2)
+    sys.stdout.write('\n')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,281 @@
+"""
+End-to-end load test of the chat API with the stub LLM provider.
+
+    python -m benchmarks.load_test --concurrency 1,8,32 --duration 10 > report.json
+    python -m benchmarks.load_test --stub-latency-ms 300 --stub-tokens 120 --mix create=1,append=4,get=3
+    python -m benchmarks.load_test --url http://localhost:8000       # a running server
+    python -m benchmarks.load_test --baseline report.json            # exit 1 on regression
+
+Every virtual user owns a user account and drives a weighted mix of create, append,
+list, get and delete; each concurrency level runs for --duration seconds. In-process
+runs (the default) serve the app from this process on a fresh sqlite file, so SQL
+statements per request and process memory are measured too. The report is JSON with
+throughput and p50/p95/p99 latency per level and per operation.
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+import uuid
+from collections import defaultdict
+from datetime import datetime
+
+from benchmarks.common import git_revision, memory_mb, percentiles
+
+DEFAULT_MIX = 'create=2,append=4,list=2,get=3,delete=1'
+
+
+class InProcessTarget:
+    """The app served from this process, SQL statements are counted per request"""
+
+    def __init__(self, database_url=None):
+        from app import create_app, db
+        from sqlalchemy import event
+
+        self._tmp = None
+        if database_url is None:
+            self._tmp = tempfile.TemporaryDirectory()
+            database_url = f"sqlite:///{os.path.join(self._tmp.name, 'load.db')}"
+        self.app = create_app({'SQLALCHEMY_DATABASE_URI': database_url})
+        self._local = threading.local()
+        with self.app.app_context():
+            db.create_all()
+            event.listen(db.engine, 'before_cursor_execute', self._count_statement)
+
+    def _count_statement(self, *args):
+        self._local.queries = getattr(self._local, 'queries', 0) + 1
+
+    def client(self):
+        app = self.app
+        local = self._local
+
+        class Client:
+            def __init__(self):
+                self._client = app.test_client()
+
+            def request(self, method, path, body=None):
+                local.queries = 0
+                resp = self._client.open(path, method=method, json=body)
+                return resp.status_code, resp.get_json(silent=True), local.queries
+
+        return Client()
+
+    def memory(self):
+        return memory_mb()
+
+    def close(self):
+        if self._tmp is not None:
+            self._tmp.cleanup()
+
+
+class HttpTarget:
+    """A running server, only latency and status are observable from here"""
+
+    def __init__(self, url):
+        self.url = url.rstrip('/')
+
+    def client(self):
+        import requests
+
+        session = requests.Session()
+        url = self.url
+
+        class Client:
+            def request(self, method, path, body=None):
+                resp = session.request(method, url + path, json=body, timeout=120)
+                try:
+                    data = resp.json()
+                except ValueError:
+                    data = None
+                return resp.status_code, data, None
+
+        return Client()
+
+    def memory(self):
+        return None
+
+    def close(self):
+        pass
+
+
+class VirtualUser:
+    """One simulated client with its own account and conversations"""
+
+    def __init__(self, client, mix, rng):
+        self.client = client
+        self.ops, self.weights = zip(*mix.items())
+        self.rng = rng
+        self.conversations = []
+        status, data, _ = client.request('POST', '/api/users', {'username': f'bench-{uuid.uuid4().hex[:12]}'})
+        if status != 201:
+            raise RuntimeError(f"could not create a benchmark user: {status} {data}")
+        self.user_id = data['id']
+
+    def step(self):
+        """Run one operation, returns (op, ok, queries)"""
+        op = self.rng.choices(self.ops, self.weights)[0]
+        if op != 'create' and op != 'list' and not self.conversations:
+            op = 'create'
+        message = f"question {self.rng.randrange(10 ** 6)} about the benchmark"
+        if op == 'create':
+            status, data, queries = self.client.request('POST', '/api/conversations',
+                                                        {'user_id': self.user_id, 'message': message})
+            if status == 201:
+                self.conversations.append(data['id'])
+            return op, status == 201, queries
+        if op == 'list':
+            status, _, queries = self.client.request('GET', f'/api/users/{self.user_id}/conversations?limit=20')
+            return op, status == 200, queries
+        conversation_id = self.rng.choice(self.conversations)
+        if op == 'append':
+            status, _, queries = self.client.request('POST', f'/api/conversations/{conversation_id}/messages',
+                                                     {'message': message})
+            return op, status == 200, queries
+        if op == 'get':
+            status, _, queries = self.client.request('GET', f'/api/conversations/{conversation_id}')
+            return op, status == 200, queries
+        self.conversations.remove(conversation_id)
+        status, _, queries = self.client.request('DELETE', f'/api/conversations/{conversation_id}')
+        return op, status == 200, queries
+
+
+def run_level(target, concurrency, duration, mix, seed):
+    samples = defaultdict(list)  # op -> [(latency, ok, queries)]
+    lock = threading.Lock()
+    ready = threading.Barrier(concurrency + 1)
+    start_at = []
+
+    def worker(index):
+        try:
+            user = VirtualUser(target.client(), mix, random.Random(seed * 1000 + index))
+        except Exception:
+            ready.abort()
+            raise
+        ready.wait()
+        deadline = start_at[0] + duration
+        while time.monotonic() < deadline:
+            started = time.perf_counter()
+            op, ok, queries = user.step()
+            with lock:
+                samples[op].append((time.perf_counter() - started, ok, queries))
+
+    threads = [threading.Thread(target=worker, args=(i,), daemon=True) for i in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    start_at.append(time.monotonic())
+    ready.wait()
+    for thread in threads:
+        thread.join()
+    elapsed = time.monotonic() - start_at[0]
+
+    ops = {}
+    for op, rows in sorted(samples.items()):
+        queries = [q for _, _, q in rows if q is not None]
+        ops[op] = {
+            'requests': len(rows),
+            'errors': sum(1 for _, ok, _ in rows if not ok),
+            **percentiles([latency for latency, _, _ in rows]),
+            'queries_per_request': round(sum(queries) / len(queries), 2) if queries else None,
+        }
+    everything = [row for rows in samples.values() for row in rows]
+    return {
+        'concurrency': concurrency,
+        'seconds': round(elapsed, 3),
+        'requests': len(everything),
+        'errors': sum(1 for _, ok, _ in everything if not ok),
+        'throughput_rps': round(len(everything) / elapsed, 1) if elapsed else None,
+        **percentiles([latency for latency, _, _ in everything]),
+        'ops': ops,
+        'memory': target.memory(),
+    }
+
+
+def compare(report, baseline, tolerance):
+    """Levels whose throughput dropped or p95 rose by more than tolerance against baseline"""
+    previous = {level['concurrency']: level for level in baseline.get('levels', [])}
+    regressions = []
+    for level in report['levels']:
+        old = previous.get(level['concurrency'])
+        if old is None:
+            continue
+        if old.get('throughput_rps') and level['throughput_rps'] < old['throughput_rps'] * (1 - tolerance):
+            regressions.append({'concurrency': level['concurrency'], 'metric': 'throughput_rps',
+                                'baseline': old['throughput_rps'], 'current': level['throughput_rps']})
+        if old.get('p95_ms') and level.get('p95_ms') and level['p95_ms'] > old['p95_ms'] * (1 + tolerance):
+            regressions.append({'concurrency': level['concurrency'], 'metric': 'p95_ms',
+                                'baseline': old['p95_ms'], 'current': level['p95_ms']})
+    return regressions
+
+
+def parse_mix(text):
+    mix = {}
+    for part in text.split(','):
+        op, _, weight = part.partition('=')
+        if op.strip() not in ('create', 'append', 'list', 'get', 'delete'):
+            raise argparse.ArgumentTypeError(f"unknown operation in mix: {op}")
+        mix[op.strip()] = float(weight or 1)
+    return mix
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--concurrency', default='1,4,16', help='comma separated levels, run in order')
+    parser.add_argument('--duration', type=float, default=10, help='seconds per level')
+    parser.add_argument('--mix', type=parse_mix, default=parse_mix(DEFAULT_MIX), help=f'operation weights ({DEFAULT_MIX})')
+    parser.add_argument('--stub-latency-ms', type=float, default=100, help='simulated LLM latency per completion')
+    parser.add_argument('--stub-tokens', type=int, default=60, help='simulated reply length in tokens')
+    parser.add_argument('--database-url', help='in-process runs only, defaults to a fresh sqlite file')
+    parser.add_argument('--url', help='load an already running server instead of the in-process app')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--baseline', help='previous report to compare against')
+    parser.add_argument('--tolerance', type=float, default=0.2, help='allowed relative regression against the baseline')
+    parser.add_argument('--output', help='write the report here instead of stdout')
+    args = parser.parse_args(argv)
+
+    if args.url:
+        target = HttpTarget(args.url)
+    else:
+        # read by Config at import time, so set before the app is imported
+        os.environ.update({
+            'LLM_PROVIDER': 'stub',
+            'LLM_ROUTER_PROVIDERS': '',
+            'STUB_LATENCY_MS': str(args.stub_latency_ms),
+            'STUB_TOKENS': str(args.stub_tokens),
+            'RATE_LIMIT_ENABLED': 'false',
+        })
+        target = InProcessTarget(args.database_url)
+
+    report = {
+        'revision': git_revision(),
+        'started_at': datetime.utcnow().isoformat(),
+        'target': args.url or 'in-process',
+        'duration': args.duration,
+        'mix': args.mix,
+        'stub': {'latency_ms': args.stub_latency_ms, 'tokens': args.stub_tokens} if not args.url else None,
+        'levels': [],
+    }
+    try:
+        for concurrency in [int(level) for level in args.concurrency.split(',')]:
+            report['levels'].append(run_level(target, concurrency, args.duration, args.mix, args.seed))
+            print(f"concurrency {concurrency}: {report['levels'][-1]['throughput_rps']} req/s", file=sys.stderr)
+    finally:
+        target.close()
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            report['regressions'] = compare(report, json.load(f), args.tolerance)
+
+    output = open(args.output, 'w') if args.output else sys.stdout
+    json.dump(report, output, indent=2)
+    output.write('\n')
+    if args.output:
+        output.close()
+    return 1 if report.get('regressions') else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
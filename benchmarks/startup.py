@@ -0,0 +1,202 @@
+"""
+Worker startup: import-time profile, time to first request and per-worker memory.
+
+    python -m benchmarks.startup --workers 4
+    python -m benchmarks.startup --workers 4 --top 15 --output startup.json
+
+Every measurement runs in fresh interpreters:
+
+    imports  python -X importtime of the app package, slowest modules first
+    cold     --workers separate processes that import, build the app and serve a first request
+    preload  one process builds the app and forks --workers children that serve a first
+             request each, the way gunicorn --preload (gunicorn.conf.py) runs
+
+The first request creates a conversation against the stub provider, so the services
+built lazily on first use are part of it. Memory is RSS and USS (pages private to the
+process): forked workers share the parent's imported code, their USS is what each
+extra worker costs.
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+from benchmarks.common import git_revision, memory_mb
+
+WORKER_ENV = {
+    'LLM_PROVIDER': 'stub',
+    'LLM_ROUTER_PROVIDERS': '',
+    'STUB_LATENCY_MS': '0',
+    'RATE_LIMIT_ENABLED': 'false',
+}
+
+
+def private_mb():
+    """USS: resident pages not shared with any other process (Linux only)"""
+    try:
+        with open('/proc/self/smaps_rollup') as f:
+            kb = sum(int(line.split()[1]) for line in f if line.startswith(('Private_Clean:', 'Private_Dirty:')))
+        return round(kb / 1024, 1)
+    except OSError:
+        return None
+
+
+def first_request(app) -> dict:
+    client = app.test_client()
+    started = time.perf_counter()
+    resp = client.post('/api/conversations', json={'user_id': 1, 'message': 'hello'})
+    if resp.status_code != 201:
+        raise RuntimeError(f"first request failed: {resp.status_code} {resp.get_data(as_text=True)}")
+    return {'first_request_s': round(time.perf_counter() - started, 4),
+            'rss_mb': memory_mb()['rss_mb'], 'uss_mb': private_mb()}
+
+
+# child processes
+
+def cold_worker(database_url):
+    started = time.perf_counter()
+    from app import create_app
+    imported = time.perf_counter()
+    app = create_app({'SQLALCHEMY_DATABASE_URI': database_url})
+    built = time.perf_counter()
+    result = {'import_s': round(imported - started, 4), 'create_app_s': round(built - imported, 4)}
+    result.update(first_request(app))
+    print(json.dumps(result), flush=True)
+
+
+def preload_parent(database_url, workers):
+    started = time.perf_counter()
+    from app import create_app
+    from app.utils.db_profiles import dispose_after_fork
+    app = create_app({'SQLALCHEMY_DATABASE_URI': database_url})
+    parent = {'import_and_create_app_s': round(time.perf_counter() - started, 4),
+              'rss_mb': memory_mb()['rss_mb'], 'uss_mb': private_mb()}
+
+    children = []
+    for _ in range(workers):
+        read_fd, write_fd = os.pipe()
+        forked_at = time.monotonic()
+        pid = os.fork()
+        if pid == 0:
+            os.close(read_fd)
+            try:
+                dispose_after_fork(app)
+                result = first_request(app)
+                result['fork_to_first_response_s'] = round(time.monotonic() - forked_at, 4)
+            except Exception as e:
+                result = {'error': str(e)}
+            os.write(write_fd, json.dumps(result).encode())
+            os._exit(0)
+        os.close(write_fd)
+        children.append((pid, read_fd))
+
+    results = []
+    for pid, read_fd in children:
+        with os.fdopen(read_fd) as f:
+            results.append(json.loads(f.read() or '{"error": "no output"}'))
+        os.waitpid(pid, 0)
+    print(json.dumps({'parent': parent, 'workers': results}), flush=True)
+
+
+# driver
+
+def import_profile(top):
+    """Slowest imports of the app package by self and cumulative time"""
+    out = subprocess.run([sys.executable, '-X', 'importtime', '-c', 'import app'], capture_output=True,
+                         text=True, check=True, env={**os.environ, **WORKER_ENV}).stderr
+    modules = []
+    for line in out.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        self_us, cumulative_us, name = line[len('import time:'):].split('|')
+        modules.append({'module': name.strip(), 'self_ms': round(int(self_us) / 1000, 2),
+                        'cumulative_ms': round(int(cumulative_us) / 1000, 2)})
+    total = next((m['cumulative_ms'] for m in modules if m['module'] == 'app'), None)
+    return {
+        'total_ms': total,
+        'slowest_self': sorted(modules, key=lambda m: -m['self_ms'])[:top],
+        'app_modules': sorted((m for m in modules if m['module'].startswith('app.')),
+                              key=lambda m: -m['cumulative_ms'])[:top],
+    }
+
+
+def spawn(args, database_url):
+    """Run a child mode of this script, returns its json line and the wall time until it arrived"""
+    started = time.perf_counter()
+    proc = subprocess.Popen([sys.executable, '-m', 'benchmarks.startup', *args, '--database-url', database_url],
+                            stdout=subprocess.PIPE, text=True, env={**os.environ, **WORKER_ENV})
+    line = proc.stdout.readline()
+    elapsed = time.perf_counter() - started
+    proc.stdout.close()
+    if proc.wait() != 0 or not line:
+        raise RuntimeError(f"benchmark child {args} failed")
+    return json.loads(line), elapsed
+
+
+def summarize(workers, key):
+    ok = [w for w in workers if 'error' not in w]
+    mean = lambda field: round(sum(w[field] for w in ok) / len(ok), 4) if ok and all(w.get(field) is not None for w in ok) else None
+    return {'workers': len(workers), 'errors': len(workers) - len(ok),
+            f'mean_{key}': mean(key), 'mean_rss_mb': mean('rss_mb'), 'mean_uss_mb': mean('uss_mb'),
+            'total_uss_mb': round(sum(w['uss_mb'] for w in ok), 1) if ok and all(w.get('uss_mb') is not None for w in ok) else None}
+
+
+def prepare_database(path):
+    os.environ.update(WORKER_ENV)
+    from app import create_app, db
+    from app.models import User
+    from app.utils.migrate import upgrade_schema
+
+    app = create_app({'SQLALCHEMY_DATABASE_URI': f"sqlite:///{path}"})
+    with app.app_context():
+        upgrade_schema()
+        db.session.add(User(username='startup-bench'))
+        db.session.commit()
+        db.engine.dispose()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--workers', type=int, default=4)
+    parser.add_argument('--top', type=int, default=10, help='modules listed in the import profile')
+    parser.add_argument('--output', help='write the report here instead of stdout')
+    parser.add_argument('--child', choices=('cold', 'preload'), help=argparse.SUPPRESS)
+    parser.add_argument('--database-url', help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.child == 'cold':
+        return cold_worker(args.database_url)
+    if args.child == 'preload':
+        return preload_parent(args.database_url, args.workers)
+
+    report = {'revision': git_revision(), 'python': sys.version.split()[0], 'workers': args.workers,
+              'imports': import_profile(args.top)}
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'startup.db')
+        prepare_database(path)
+        database_url = f"sqlite:///{path}"
+
+        cold = []
+        for _ in range(args.workers):
+            result, elapsed = spawn(['--child', 'cold'], database_url)
+            result['time_to_first_response_s'] = round(elapsed, 4)
+            cold.append(result)
+        report['cold'] = {'summary': summarize(cold, 'time_to_first_response_s'), 'workers': cold}
+
+        preload, _ = spawn(['--child', 'preload', '--workers', str(args.workers)], database_url)
+        report['preload'] = {'parent': preload['parent'],
+                             'summary': summarize(preload['workers'], 'fork_to_first_response_s'),
+                             'workers': preload['workers']}
+
+    output = open(args.output, 'w') if args.output else sys.stdout
+    json.dump(report, output, indent=2)
+    output.write('\n')
+    if args.output:
+        output.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,135 @@
+"""
+Storage footprint of message bodies: compression codecs and the archive tier.
+
+    python -m benchmarks.storage --conversations 200 --turns 10
+    python -m benchmarks.storage --reply-words 400 --output storage.json
+
+For each codec (none, zlib, and zstd when the zstandard package is installed) a fresh
+SQLite database is filled with synthetic conversations, then VACUUMed and measured; the
+report also times conversation reads. The last codec's database then has every
+conversation archived (ARCHIVE_AFTER_DAYS 0) to show the hot table and archive sizes
+and the cost of reading an archived conversation.
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+from sqlalchemy import insert, text
+
+from app import create_app, db
+from app.config import Config
+from app.models import Conversation, Message, User
+from app.services.archive_service import ArchiveService
+from app.services.conversation_service import ConversationService
+from app.utils.compression import zstandard
+from benchmarks.common import git_revision, percentiles
+
+WORDS = ("the index query table vacuum row page cache write read lock commit replica latency "
+         "throughput batch chunk vector token prompt context summary model reply stream").split()
+
+
+def sentence(rng, words):
+    return " ".join(rng.choice(WORDS) for _ in range(words)).capitalize() + "."
+
+
+def fill(conversations, turns, reply_words, seed=7):
+    rng = random.Random(seed)
+    user = User(username='storage-bench')
+    db.session.add(user)
+    db.session.flush()
+    for c in range(conversations):
+        conversation_id = f'bench-{c:05d}'
+        db.session.add(Conversation(id=conversation_id, user_id=user.id, title='bench'))
+        db.session.flush()
+        rows = []
+        for _ in range(turns):
+            rows.append({'conversation_id': conversation_id, 'role': 'user', 'content': sentence(rng, 12),
+                         'created_at': datetime.utcnow()})
+            reply = " ".join(sentence(rng, 15) for _ in range(max(1, reply_words // 15)))
+            rows.append({'conversation_id': conversation_id, 'role': 'assistant', 'content': reply,
+                         'created_at': datetime.utcnow(), 'tokens_used': reply_words, 'meta': {'model': 'bench'}})
+        db.session.execute(insert(Message), rows)
+    db.session.commit()
+
+
+def db_mb(path):
+    """Database file size once compacted and the WAL is folded back in"""
+    db.session.execute(text('VACUUM'))
+    db.session.execute(text('PRAGMA wal_checkpoint(TRUNCATE)'))
+    return round(os.path.getsize(path) / 2 ** 20, 3)
+
+
+def dir_mb(root):
+    total = sum(os.path.getsize(os.path.join(d, f)) for d, _, files in os.walk(root) for f in files)
+    return round(total / 2 ** 20, 3)
+
+
+def time_reads(service, ids, rounds=3):
+    latencies = []
+    for _ in range(rounds):
+        for conversation_id in ids:
+            started = time.perf_counter()
+            service.get_conversation_by_id(conversation_id)
+            latencies.append(time.perf_counter() - started)
+            db.session.remove()
+    return percentiles(latencies)
+
+
+def run_codec(codec, tmp, args, archive=False):
+    Config.MESSAGE_COMPRESSION = codec
+    path = os.path.join(tmp, f'{codec}.db')
+    app = create_app({'TESTING': True, 'SQLALCHEMY_DATABASE_URI': f"sqlite:///{path}"})
+    result = {'codec': codec}
+    with app.app_context():
+        db.create_all()
+        started = time.perf_counter()
+        fill(args.conversations, args.turns, args.reply_words)
+        result['fill_s'] = round(time.perf_counter() - started, 3)
+        result['db_mb'] = db_mb(path)
+
+        service = ConversationService()
+        ids = [f'bench-{c:05d}' for c in range(0, args.conversations, max(1, args.conversations // 20))]
+        result['reads'] = time_reads(service, ids)
+
+        if archive:
+            service.archive_service = ArchiveService(root=os.path.join(tmp, 'archive'), after_days=0)
+            started = time.perf_counter()
+            result['archived'] = service.archive_service.archive_idle()
+            result['archive_s'] = round(time.perf_counter() - started, 3)
+            result['db_mb_after_archive'] = db_mb(path)
+            result['archive_mb'] = dir_mb(service.archive_service.root)
+            result['archived_reads'] = time_reads(service, ids)
+        db.session.remove()
+        db.engine.dispose()
+    return result
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--conversations', type=int, default=200)
+    parser.add_argument('--turns', type=int, default=10, help='user/assistant pairs per conversation')
+    parser.add_argument('--reply-words', type=int, default=200, help='words per assistant reply')
+    parser.add_argument('--output', help='write the report here instead of stdout')
+    args = parser.parse_args(argv)
+
+    codecs = ['none', 'zlib'] + (['zstd'] if zstandard is not None else [])
+    report = {'revision': git_revision(), 'conversations': args.conversations, 'turns': args.turns,
+              'reply_words': args.reply_words, 'min_bytes': Config.MESSAGE_COMPRESSION_MIN_BYTES, 'results': []}
+    with tempfile.TemporaryDirectory() as tmp:
+        for codec in codecs:
+            report['results'].append(run_codec(codec, tmp, args, archive=codec == codecs[-1]))
+
+    output = open(args.output, 'w') if args.output else sys.stdout
+    json.dump(report, output, indent=2)
+    output.write('\n')
+    if args.output:
+        output.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,32 @@
+"""
+gunicorn settings, values can be overridden from the environment.
+
+    gunicorn -c gunicorn.conf.py app.main:app
+
+The app is preloaded: imports, blueprints and engine objects are built once in the
+master and shared copy-on-write by the forked workers. create_app opens no connections
+and starts no threads, services (thread pools, provider sessions, caches) are built
+lazily in each worker on first use. Run "flask --app app migrate" before starting.
+"""
+import multiprocessing
+import os
+
+bind = os.environ.get('GUNICORN_BIND', '0.0.0.0:8000')
+workers = int(os.environ.get('GUNICORN_WORKERS', multiprocessing.cpu_count() * 2 + 1))
+worker_class = 'gthread'
+threads = int(os.environ.get('GUNICORN_THREADS', 4))
+preload_app = True
+# chat turns wait on the LLM round trip
+timeout = int(os.environ.get('GUNICORN_TIMEOUT', 120))
+graceful_timeout = 30
+keepalive = 5
+# recycle workers now and then, jitter keeps them from restarting together
+max_requests = int(os.environ.get('GUNICORN_MAX_REQUESTS', 0))
+max_requests_jitter = max_requests // 10
+
+
+def post_fork(server, worker):
+    from app.main import app
+    from app.utils.db_profiles import dispose_after_fork
+
+    dispose_after_fork(app)
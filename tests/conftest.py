@@ -0,0 +1,4 @@
+import os
+
+# suites drive many turns for the same user id within seconds, admission control has its own tests
+os.environ.setdefault("RATE_LIMIT_ENABLED", "false")
@@ -0,0 +1,120 @@
+import json
+import os
+from datetime import datetime, timedelta
+
+import numpy as np
+import pytest
+from sqlalchemy import text, update
+
+from app import create_app, db
+from app.config import Config
+from app.models import Conversation, Message, User
+from app.routes import conversations, users
+from app.services import archive_service as archive_module
+from app.services.archive_service import ArchiveService
+from app.services.prompt_state import get_prompt_states
+
+
+@pytest.fixture
+def app(tmp_path, monkeypatch):
+    os.environ["LLM_PROVIDER"] = "stub"
+    app = create_app({'TESTING': True, 'SQLALCHEMY_DATABASE_URI': f"sqlite:///{tmp_path / 'app.db'}"})
+    archive = ArchiveService(root=str(tmp_path / "archive"), after_days=30)
+    monkeypatch.setattr(archive_module, "get_archive_service", lambda: archive)
+    monkeypatch.setattr(conversations.get_conversation_service(), "archive_service", archive)
+    monkeypatch.setattr(users.get_export_service(), "archive_service", archive)
+    with app.app_context():
+        db.create_all()
+        db.session.add(User(username="alice"))
+        db.session.commit()
+    return app
+
+
+def _import(client, count):
+    history = [{"role": role, "content": f"{role} {i} " + "words " * (i * 100),
+                "created_at": f"2024-01-01T10:00:{i:02d}Z"}
+               for i, role in enumerate(["user", "assistant"] * (count // 2))]
+    return client.post("/api/conversations/import",
+                       json={"conversations": [{"user_id": 1, "messages": history}]}).get_data(as_text=True)
+
+
+def _idle(conversation_id, days):
+    db.session.execute(update(Conversation).where(Conversation.id == conversation_id).values(
+        updated_at=datetime.utcnow() - timedelta(days=days)))
+    db.session.commit()
+
+
+def test_large_bodies_are_compressed_and_metadata_is_json(app):
+    with app.app_context():
+        db.session.add(Conversation(id="c1", user_id=1))
+        db.session.add_all([
+            Message(conversation_id="c1", role="user", content="short"),
+            Message(conversation_id="c1", role="assistant", content="repeated text " * 200, meta={"model": "stub"}),
+        ])
+        db.session.commit()
+        # written before compression: plain text and json text in the same columns
+        db.session.execute(text("INSERT INTO message (conversation_id, role, content, meta, tokens_used, created_at) "
+                                "VALUES ('c1', 'user', 'legacy', '{\"source\": \"import\"}', 0, '2024-01-01 10:00:00')"))
+        db.session.commit()
+
+        stored = db.session.execute(text("SELECT content FROM message ORDER BY id")).scalars().all()
+        assert stored[0] == b"short"
+        assert stored[1][:1] == b"\x00" and len(stored[1]) < len("repeated text " * 200) // 10
+        assert stored[2] == "legacy"
+
+        messages = Message.query.order_by(Message.id).all()
+        assert [m.content for m in messages] == ["short", "repeated text " * 200, "legacy"]
+        assert messages[1].to_dict()["metadata"] == {"model": "stub"}
+        assert messages[2].to_dict()["metadata"] == {"source": "import"}
+        assert "metadata" not in messages[0].to_dict()
+
+
+def test_idle_conversations_are_archived_and_rehydrated(app, monkeypatch):
+    monkeypatch.setattr(Config, "MESSAGE_COMPRESSION_MIN_BYTES", 64)
+    client = app.test_client()
+    archived_id = json.loads(_import(client, 6).splitlines()[0])["id"]
+    recent_id = json.loads(_import(client, 2).splitlines()[0])["id"]
+    with app.app_context():
+        _idle(archived_id, 60)
+        _idle(recent_id, 10)
+    before = client.get(f"/api/conversations/{archived_id}").get_json()
+    export_before = client.get("/api/users/1/export").get_data(as_text=True)
+
+    states = get_prompt_states()
+    states.remember(archived_id, ("doc",), np.ones(2), "context")
+    result = app.test_cli_runner().invoke(args=["archive"])
+    assert "archived 1 conversations" in result.output
+    assert states.reuse(archived_id, ("doc",), np.ones(2)) is None
+    archive = archive_module.get_archive_service()
+    assert os.path.exists(archive.path(archived_id))
+    with app.app_context():
+        assert Message.query.filter_by(conversation_id=archived_id).count() == 0
+        assert Message.query.filter_by(conversation_id=recent_id).count() == 2
+
+    # reads are served from the archive file
+    assert client.get(f"/api/conversations/{archived_id}").get_json() == before
+    page = client.get(f"/api/conversations/{archived_id}/messages?limit=4").get_json()
+    assert [m["id"] for m in page["messages"]] == [m["id"] for m in before["messages"][:4]]
+    rest = client.get(f"/api/conversations/{archived_id}/messages?after={page['next_cursor']}").get_json()
+    assert [m["id"] for m in rest["messages"]] == [m["id"] for m in before["messages"][4:]]
+    assert rest["next_cursor"] is None
+    assert client.get("/api/users/1/export").get_data(as_text=True) == export_before
+
+    # an export resumed inside the archived conversation continues after the cursor
+    lines = [json.loads(line) for line in export_before.splitlines()]
+    cursor = next(line["cursor"] for line in lines if line["type"] == "message")
+    resumed = [json.loads(line) for line in client.get(f"/api/users/1/export?cursor={cursor}").get_data(as_text=True).splitlines()]
+    assert [line["data"]["id"] for line in resumed if line["type"] == "message"] == \
+           [line["data"]["id"] for line in lines if line["type"] == "message"][1:]
+
+    # a new turn brings the messages back into the table
+    resp = client.post(f"/api/conversations/{archived_id}/messages", json={"message": "back again"})
+    assert resp.status_code == 200
+    assert resp.get_json()["messages"][:6] == before["messages"]
+    assert len(resp.get_json()["messages"]) == 8
+    assert not os.path.exists(archive.path(archived_id))
+    with app.app_context():
+        conversation = db.session.get(Conversation, archived_id)
+        assert conversation.archived_at is None
+        assert Message.query.filter_by(conversation_id=archived_id).count() == 8
+    assert "archived 0 conversations" in app.test_cli_runner().invoke(args=["archive"]).output
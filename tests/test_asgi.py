@@ -0,0 +1,68 @@
+import os
+
+import pytest
+from starlette.testclient import TestClient
+
+from app import db
+from app.asgi import create_asgi_app
+from app.models import User
+
+
+@pytest.fixture
+def client():
+    os.environ["LLM_PROVIDER"] = "stub"
+    asgi_app = create_asgi_app({'TESTING': True, 'SQLALCHEMY_DATABASE_URI': 'sqlite:///:memory:'})
+    with asgi_app.flask_app.app_context():
+        db.create_all()
+        db.session.add(User(username="alice"))
+        db.session.commit()
+    with TestClient(asgi_app) as client:
+        yield client
+
+
+def test_async_create_and_add_message(client):
+    resp = client.post("/api/conversations", json={"user_id": 1, "message": "Hello"})
+    assert resp.status_code == 201
+    conv = resp.json()
+    assert [m["content"] for m in conv["messages"]] == ["Hello", "stub response"]
+
+    resp = client.post(f"/api/conversations/{conv['id']}/messages", json={"message": "Next"})
+    assert resp.status_code == 200
+    assert [m["role"] for m in resp.json()["messages"]] == ["user", "assistant", "user", "assistant"]
+
+
+def test_async_errors_match_flask_routes(client):
+    assert client.post("/api/conversations", json={"user_id": 1}).status_code == 400
+    assert client.post("/api/conversations", json={"user_id": 42, "message": "Hi"}).status_code == 404
+    assert client.post("/api/conversations/missing/messages", json={"message": "Hi"}).status_code == 404
+
+
+def test_other_routes_fall_through_to_flask(client):
+    conv = client.post("/api/conversations", json={"user_id": 1, "message": "Hello"}).json()
+    resp = client.get(f"/api/conversations/{conv['id']}")
+    assert resp.status_code == 200
+    assert resp.json()["id"] == conv["id"]
+
+    resp = client.post(f"/api/conversations/{conv['id']}/messages?stream=1", json={"message": "Next"})
+    assert resp.headers["content-type"].startswith("text/event-stream")
+
+
+def test_mixed_accept_header_is_not_streamed(client):
+    conv = client.post("/api/conversations", json={"user_id": 1, "message": "Hello"}).json()
+    resp = client.post(f"/api/conversations/{conv['id']}/messages", json={"message": "Next"},
+                       headers={"Accept": "application/json, text/event-stream"})
+    assert resp.status_code == 200
+    assert resp.headers["content-type"].startswith("application/json")
+
+
+def test_shutdown_closes_async_clients():
+    import asyncio
+    from app.services import provider_transport
+
+    async def run():
+        transport = provider_transport.get_async_transport("groq")
+        await provider_transport.close_async_transports()
+        return transport
+
+    transport = asyncio.run(run())
+    assert transport.client.is_closed
@@ -0,0 +1,81 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from app.services.batch_dispatcher import BatchDispatcher, BatchRejected, batch_fallbacks_total
+
+
+def test_concurrent_items_share_a_batch():
+    batches = []
+
+    def send(items):
+        batches.append(list(items))
+        return [item * 2 for item in items]
+
+    dispatcher = BatchDispatcher("test", send, window=0.05, max_batch=8)
+    with ThreadPoolExecutor(6) as pool:
+        results = list(pool.map(lambda i: dispatcher.call(i, timeout=5), range(6)))
+    assert results == [0, 2, 4, 6, 8, 10]
+    assert len(batches) < 6
+    assert max(len(b) for b in batches) > 1
+
+
+def test_max_batch_caps_batch_size():
+    sizes = []
+
+    def send(items):
+        sizes.append(len(items))
+        return items
+
+    dispatcher = BatchDispatcher("test", send, window=0.2, max_batch=3)
+    futures = [dispatcher.submit(i) for i in range(7)]
+    assert [f.result(5) for f in futures] == list(range(7))
+    assert max(sizes) <= 3
+
+
+def test_errors_are_isolated_per_item():
+    def send(items):
+        if "bad" in items and len(items) > 1:
+            raise BatchRejected("batch rejected")
+        return [ValueError("bad prompt") if item == "bad" else item.upper() for item in items]
+
+    dispatcher = BatchDispatcher("isolation", send, window=0.05, max_batch=8)
+    before = batch_fallbacks_total.value(provider="isolation")
+    futures = [dispatcher.submit(item) for item in ("a", "bad", "c")]
+    assert futures[0].result(5) == "A"
+    assert futures[2].result(5) == "C"
+    with pytest.raises(ValueError):
+        futures[1].result(5)
+    assert batch_fallbacks_total.value(provider="isolation") - before == 1
+
+
+def test_upstream_failure_fails_the_batch_without_retries():
+    calls = []
+
+    def send(items):
+        calls.append(list(items))
+        raise ConnectionError("upstream down")
+
+    dispatcher = BatchDispatcher("outage", send, window=0.05, max_batch=8)
+    futures = [dispatcher.submit(item) for item in ("a", "b", "c")]
+    for future in futures:
+        with pytest.raises(ConnectionError):
+            future.result(5)
+    assert len(calls) == 1
+
+
+def test_item_timeout_does_not_affect_others():
+    release = threading.Event()
+
+    def send(items):
+        release.wait(5)
+        return items
+
+    dispatcher = BatchDispatcher("timeout", send, window=0.01, max_batch=1)
+    with pytest.raises(TimeoutError):
+        dispatcher.call("slow", timeout=0.05)
+    other = dispatcher.submit("next")
+    release.set()
+    assert other.result(5) == "next"
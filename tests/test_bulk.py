@@ -0,0 +1,81 @@
+import json
+import os
+
+import pytest
+
+from app import create_app, db
+from app.models import Conversation, Message, User
+from app.services import bulk_service as bulk_module
+from app.services.deletion_service import get_deletion_service
+
+
+@pytest.fixture
+def client(monkeypatch, tmp_path):
+    os.environ["LLM_PROVIDER"] = "stub"
+    # a file database, the deletion purge runs on its own thread and connection
+    app = create_app({'TESTING': True, 'SQLALCHEMY_DATABASE_URI': f"sqlite:///{tmp_path / 'bulk.db'}"})
+    with app.app_context():
+        db.create_all()
+        db.session.add(User(username="alice"))
+        db.session.commit()
+    with app.test_client() as client:
+        yield client
+
+
+def _lines(resp):
+    return [json.loads(line) for line in resp.get_data(as_text=True).splitlines()]
+
+
+def test_bulk_users_streams_per_item_results(client):
+    users = [{"username": f"u{i}"} for i in range(5)] + [{"username": "alice"}, {"email": "x@y"}, {"username": "u1"}]
+    resp = client.post("/api/users/bulk", json={"users": users})
+    assert resp.status_code == 200
+    assert resp.mimetype == "application/x-ndjson"
+    results = _lines(resp)
+    assert [r["status"] for r in results[:-1]] == ["created"] * 5 + ["error"] * 3
+    assert results[5]["error"] == "Username already exists"
+    assert results[-1]["summary"] == {"total": 8, "created": 5, "error": 3}
+    assert client.get(f"/api/users/{results[2]['id']}").get_json()["username"] == "u2"
+
+
+def test_bulk_users_ndjson_body_in_small_chunks(client, monkeypatch):
+    monkeypatch.setattr(bulk_module.Config, "BULK_CHUNK_SIZE", 3)
+    from app.routes import users as users_routes
+    service = bulk_module.BulkService()
+    monkeypatch.setattr(users_routes, "get_bulk_service", lambda: service)
+    body = "\n".join(json.dumps({"username": f"n{i}"}) for i in range(7)) + "\n{not json\n"
+    resp = client.post("/api/users/bulk", data=body, content_type="application/x-ndjson")
+    results = _lines(resp)
+    assert [r["index"] for r in results[:-1]] == list(range(8))
+    assert results[7]["status"] == "error" and "Invalid JSON" in results[7]["error"]
+    assert results[-1]["summary"]["created"] == 7
+
+
+def test_import_and_bulk_delete_conversations(client):
+    conversations = [
+        {"user_id": 1, "messages": [
+            {"role": "user", "content": "Hi", "created_at": "2024-01-01T10:00:00Z"},
+            {"role": "assistant", "content": "Hello!", "tokens_used": 3, "created_at": "2024-01-01T10:00:01Z"}]},
+        {"user_id": 1, "title": "empty"},
+        {"user_id": 99, "messages": []},
+        {"user_id": 1, "messages": [{"role": "robot", "content": "beep"}]},
+    ]
+    results = _lines(client.post("/api/conversations/import", json={"conversations": conversations}))
+    assert [r["status"] for r in results[:-1]] == ["imported", "imported", "error", "error"]
+    imported = client.get(f"/api/conversations/{results[0]['id']}").get_json()
+    assert imported["title"] == "Hi"
+    assert imported["created_at"].startswith("2024-01-01T10:00:00")
+    assert [(m["role"], m["content"]) for m in imported["messages"]] == [("user", "Hi"), ("assistant", "Hello!")]
+
+    ids = [results[0]["id"], results[1]["id"], "missing", results[0]["id"]]
+    deleted = _lines(client.post("/api/conversations/bulk-delete", json={"ids": ids}))
+    assert [r["status"] for r in deleted[:-1]] == ["deleted", "deleted", "not_found", "not_found"]
+    assert client.get(f"/api/conversations/{results[0]['id']}").status_code == 404
+    get_deletion_service().wait(deleted[0]["job_id"], timeout=10)
+    with client.application.app_context():
+        assert Conversation.query.count() == 0
+        assert Message.query.count() == 0
+
+
+def test_bulk_rejects_bad_body(client):
+    assert client.post("/api/documents/bulk", json={"docs": []}).status_code == 400
@@ -0,0 +1,72 @@
+import os
+
+import pytest
+
+from app import create_app, db
+from app.models import Conversation, Message, User
+from app.services.context_window import ContextWindowBuilder, estimate_tokens
+
+
+@pytest.fixture
+def app():
+    os.environ["LLM_PROVIDER"] = "stub"
+    app = create_app({'TESTING': True, 'SQLALCHEMY_DATABASE_URI': 'sqlite:///:memory:'})
+    with app.app_context():
+        db.create_all()
+        db.session.add(User(username="alice"))
+        db.session.add(Conversation(id="c1", user_id=1, title="long chat"))
+        for i in range(40):
+            role = "user" if i % 2 == 0 else "assistant"
+            db.session.add(Message(conversation_id="c1", role=role, content=f"Message {i}. " + "filler " * 40))
+        db.session.commit()
+        yield app
+
+
+def test_estimate_tokens():
+    assert estimate_tokens("") == 0
+    assert estimate_tokens("abcd" * 10) == 10
+
+
+def test_window_keeps_newest_messages_within_budget(app):
+    builder = ContextWindowBuilder(token_budget=400, summary_budget=100, page_size=5)
+    window = builder.build(Conversation.query.get("c1"), "new question")
+
+    assert window.history[-1] == {"role": "user", "content": "new question"}
+    assert window.history[-2]["content"].startswith("Message 39.")
+    assert sum(estimate_tokens(m["content"]) for m in window.history) <= 400 + 100
+    assert window.history[0]["role"] == "system"
+    assert window.summary_changed
+    # ids start at 1, the newest folded message is the one that didn't fit
+    assert window.summary.splitlines()[-1].startswith(f"{'user' if window.summary_upto_id % 2 else 'assistant'}: Message {window.summary_upto_id - 1}.")
+
+
+def test_summary_is_reused_and_only_new_messages_are_folded(app):
+    builder = ContextWindowBuilder(token_budget=600, summary_budget=150, page_size=5)
+    conversation = Conversation.query.get("c1")
+    first = builder.build(conversation, "q1")
+    conversation.summary, conversation.summary_upto_id = first.summary, first.summary_upto_id
+    db.session.commit()
+
+    # nothing new left the window, so the cached summary is used as is
+    again = builder.build(conversation, "q1")
+    assert not again.summary_changed
+    assert again.summary == first.summary
+    assert again.summary_upto_id == first.summary_upto_id
+    assert first.summary.splitlines()[-1].endswith(f"Message {first.summary_upto_id - 1}.")
+
+
+def test_long_conversation_turn_stays_bounded(app, monkeypatch):
+    from app.routes import conversations
+    monkeypatch.setattr(conversations.get_conversation_service(), "context_builder",
+                        ContextWindowBuilder(token_budget=300, summary_budget=100))
+    seen = {}
+
+    def fake_response(history, mode="open_chat", context=None):
+        seen["history"] = history
+        return "ok", 1
+    monkeypatch.setattr(conversations.get_conversation_service().llm_service, "get_response", fake_response)
+
+    resp = app.test_client().post("/api/conversations/c1/messages", json={"message": "and now?"})
+    assert resp.status_code == 200
+    assert len(seen["history"]) < 10
+    assert Conversation.query.get("c1").summary_upto_id > 0
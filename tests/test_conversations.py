@@ -1,13 +1,13 @@
 import pytest
 import os
+import json
 from app import create_app, db
 from app.models import User
 
 @pytest.fixture
 def client():
     os.environ["LLM_PROVIDER"] = "stub"
-    app = create_app()
-    app.config.update(TESTING=True, SQLALCHEMY_DATABASE_URI='sqlite:///:memory:')
+    app = create_app({'TESTING': True, 'SQLALCHEMY_DATABASE_URI': 'sqlite:///:memory:'})
     with app.app_context():
         db.create_all()
         user = User(username="alice")
@@ -22,3 +22,94 @@ def test_create_conversation(client):
     data = resp.get_json()
     assert data["id"]
     assert data["messages"][0]["content"] == "Hello"
+
+def _parse_sse(body):
+    events = []
+    for frame in body.strip().split("\n\n"):
+        lines = dict(line.split(": ", 1) for line in frame.splitlines())
+        events.append((lines["event"], json.loads(lines["data"])))
+    return events
+
+def test_add_message_streams_sse(client):
+    conv = client.post("/api/conversations", json={"user_id": 1, "message": "Hello"}).get_json()
+    resp = client.post(f"/api/conversations/{conv['id']}/messages?stream=1", json={"message": "Next"})
+    assert resp.status_code == 200
+    assert resp.mimetype == "text/event-stream"
+    events = _parse_sse(resp.get_data(as_text=True))
+    deltas = "".join(data["content"] for name, data in events if name == "delta")
+    assert deltas == "stub response"
+    name, done = events[-1]
+    assert name == "done"
+    assert done["message"]["content"] == "stub response"
+
+    # the streamed reply is persisted like a regular turn
+    full = client.get(f"/api/conversations/{conv['id']}").get_json()
+    assert [m["role"] for m in full["messages"]] == ["user", "assistant", "user", "assistant"]
+    assert full["messages"][-1]["id"] == done["message"]["id"]
+
+def test_add_message_stream_via_accept_header(client):
+    conv = client.post("/api/conversations", json={"user_id": 1, "message": "Hello"}).get_json()
+    resp = client.post(f"/api/conversations/{conv['id']}/messages", json={"message": "Next"},
+                       headers={"Accept": "text/event-stream"})
+    assert resp.mimetype == "text/event-stream"
+    assert _parse_sse(resp.get_data(as_text=True))[-1][0] == "done"
+
+def test_add_message_stream_unknown_conversation(client):
+    resp = client.post("/api/conversations/missing/messages?stream=1", json={"message": "Next"})
+    assert resp.status_code == 404
+
+def test_add_message_delta_view(client):
+    conv = client.post("/api/conversations", json={"user_id": 1, "message": "Hello"}).get_json()
+    resp = client.post(f"/api/conversations/{conv['id']}/messages?view=delta", json={"message": "Next"})
+    assert resp.status_code == 200
+    data = resp.get_json()
+    assert data["id"] == conv["id"]
+    assert [(m["role"], m["content"]) for m in data["messages"]] == [("user", "Next"), ("assistant", "stub response")]
+
+def test_list_messages_keyset_pages(client):
+    conv = client.post("/api/conversations", json={"user_id": 1, "message": "Hello"}).get_json()
+    for i in range(2):
+        client.post(f"/api/conversations/{conv['id']}/messages", json={"message": f"m{i}"})
+
+    seen, after = [], None
+    while True:
+        url = f"/api/conversations/{conv['id']}/messages?limit=4"
+        if after is not None:
+            url += f"&after={after}"
+        page = client.get(url).get_json()
+        seen.extend(m["id"] for m in page["messages"])
+        after = page["next_cursor"]
+        if after is None:
+            break
+    full = client.get(f"/api/conversations/{conv['id']}").get_json()
+    assert seen == [m["id"] for m in full["messages"]]
+    assert len(seen) == 6
+
+def test_list_messages_errors(client):
+    assert client.get("/api/conversations/missing/messages").status_code == 404
+    conv = client.post("/api/conversations", json={"user_id": 1, "message": "Hello"}).get_json()
+    assert client.get(f"/api/conversations/{conv['id']}/messages?limit=x").status_code == 400
+    assert client.get(f"/api/conversations/{conv['id']}/messages?after=999").status_code == 404
+
+def test_user_conversations_cursor_pages(client):
+    ids = {client.post("/api/conversations", json={"user_id": 1, "message": f"c{i}"}).get_json()["id"]
+           for i in range(5)}
+    # unpaged requests keep returning the plain list
+    assert len(client.get("/api/users/1/conversations").get_json()) == 5
+
+    seen, cursor = [], None
+    while True:
+        url = "/api/users/1/conversations?limit=2&fields=id,updated_at"
+        if cursor:
+            url += f"&cursor={cursor}"
+        page = client.get(url).get_json()
+        assert all(set(item) == {"id", "updated_at"} for item in page["items"])
+        seen.extend(item["id"] for item in page["items"])
+        cursor = page["next_cursor"]
+        if cursor is None:
+            break
+    assert len(seen) == 5 and set(seen) == ids
+
+def test_user_conversations_bad_params(client):
+    assert client.get("/api/users/1/conversations?cursor=garbage").status_code == 400
+    assert client.get("/api/users/1/conversations?fields=id,nope").status_code == 400
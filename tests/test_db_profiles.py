@@ -0,0 +1,55 @@
+import os
+
+import pytest
+
+from app import create_app, db
+from app.models import Conversation, User
+from app.services.conversation_service import ConversationService
+from app.utils.db_profiles import engine_options, pool_checked_out, pool_checkouts_total, profile_for
+
+
+def test_profile_for_backends():
+    assert profile_for('sqlite:///app.db') == 'sqlite'
+    assert profile_for('sqlite:///:memory:') == 'sqlite_memory'
+    assert profile_for('sqlite://') == 'sqlite_memory'
+    assert profile_for('postgresql+psycopg2://u@h/db') == 'postgresql'
+    options = engine_options('postgresql://u@h/db')
+    assert options['pool_pre_ping'] is True
+    assert 'statement_timeout' in options['connect_args']['options']
+
+
+def test_sqlite_file_runs_in_wal_with_pool_metrics(tmp_path):
+    app = create_app({'TESTING': True, 'SQLALCHEMY_DATABASE_URI': f'sqlite:///{tmp_path / "wal.db"}'})
+    checkouts = pool_checkouts_total.value(engine='primary')
+    with app.app_context():
+        with db.engine.connect() as conn:
+            assert conn.exec_driver_sql("PRAGMA journal_mode").scalar() == 'wal'
+            assert conn.exec_driver_sql("PRAGMA synchronous").scalar() == 1  # NORMAL
+            assert conn.exec_driver_sql("PRAGMA busy_timeout").scalar() == 5000
+            assert pool_checked_out.value(engine='primary') >= 1
+    assert pool_checkouts_total.value(engine='primary') > checkouts
+
+
+def test_conversation_reads_use_replica(tmp_path):
+    os.environ["LLM_PROVIDER"] = "stub"
+    replica_uri = f'sqlite:///{tmp_path / "replica.db"}'
+    # the "replica" only holds what we put there, so reads prove which database served them
+    replica = create_app({'TESTING': True, 'SQLALCHEMY_DATABASE_URI': replica_uri})
+    with replica.app_context():
+        db.create_all()
+        db.session.add(User(username="alice"))
+        db.session.add(Conversation(id="on-replica", user_id=1, title="from replica"))
+        db.session.commit()
+
+    app = create_app({'TESTING': True, 'SQLALCHEMY_DATABASE_URI': f'sqlite:///{tmp_path / "primary.db"}',
+                      'DATABASE_REPLICA_URL': replica_uri})
+    with app.app_context():
+        db.create_all()
+        db.session.add(User(username="alice"))
+        db.session.commit()
+        service = ConversationService()
+        assert [c['id'] for c in service.get_user_conversations(1)] == ["on-replica"]
+        assert service.get_conversation_by_id("on-replica")['title'] == "from replica"
+        assert service.page_user_conversations(1, limit=10)['items'][0]['id'] == "on-replica"
+        with pytest.raises(ValueError):
+            service.get_conversation_by_id("missing")
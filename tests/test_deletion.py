@@ -0,0 +1,118 @@
+import os
+
+import numpy as np
+import pytest
+
+from app import create_app, db
+from app.models import Conversation, DeletionJob, Document, Message, User
+from app.routes import conversations, users
+from app.services import bulk_service, conversation_service, deletion_service
+from app.services.deletion_service import DeletionService
+from app.services.prompt_state import get_prompt_states
+from app.services.retrieval_service import RetrievalService, VectorStore
+
+
+@pytest.fixture
+def app(tmp_path, monkeypatch):
+    os.environ["LLM_PROVIDER"] = "stub"
+    # a file database, the purge runs on its own thread and connection
+    app = create_app({'TESTING': True, 'SQLALCHEMY_DATABASE_URI': f"sqlite:///{tmp_path / 'app.db'}"})
+    service = DeletionService(RetrievalService(store=VectorStore(root=str(tmp_path / "vectors"))),
+                              batch_size=2, pause=0)
+    for module in (deletion_service, conversation_service, bulk_service, conversations, users):
+        monkeypatch.setattr(module, "get_deletion_service", lambda: service)
+    with app.app_context():
+        db.create_all()
+        db.session.add(User(username="alice"))
+        db.session.commit()
+    return app
+
+
+def _conversation(client, turns):
+    conversation_id = client.post("/api/conversations", json={"user_id": 1, "message": "hi"}).get_json()["id"]
+    for i in range(turns - 1):
+        assert client.post(f"/api/conversations/{conversation_id}/messages", json={"message": f"q{i}"}).status_code == 200
+    return conversation_id
+
+
+def test_delete_conversation_hides_it_and_purges_in_batches(app):
+    client = app.test_client()
+    conversation_id = _conversation(client, 3)
+    kept = _conversation(client, 1)
+
+    resp = client.delete(f"/api/conversations/{conversation_id}")
+    assert resp.status_code == 200
+    job = resp.get_json()["job"]
+    assert job["kind"] == "conversations"
+    assert job["messages"]["total"] == 6
+    assert client.get(f"/api/conversations/{conversation_id}").status_code == 404
+    assert [c["id"] for c in client.get("/api/users/1/conversations").get_json()] == [kept]
+    assert client.delete(f"/api/conversations/{conversation_id}").status_code == 404
+
+    deletion_service.get_deletion_service().wait(job["id"], timeout=10)
+    job = client.get(f"/api/deletions/{job['id']}").get_json()
+    assert job["status"] == "done"
+    assert job["progress"] == 1.0
+    assert job["messages"] == {"total": 6, "deleted": 6}
+    assert job["conversations"] == {"total": 1, "deleted": 1}
+    with app.app_context():
+        assert db.session.get(Conversation, conversation_id) is None
+        assert Message.query.count() == 2
+
+
+def test_delete_user_cascades_to_documents_and_index_files(app, tmp_path):
+    client = app.test_client()
+    _conversation(client, 2)
+    source = tmp_path / "notes.txt"
+    source.write_text("vacuum reclaims space held by dead rows " * 20)
+    with app.app_context():
+        db.session.add(Document(id="doc-1", user_id=1, title="notes", uri=str(source)))
+        db.session.commit()
+    service = deletion_service.get_deletion_service()
+    service.retrieval_service.index_text("doc-1", source.read_text())
+    assert os.listdir(tmp_path / "vectors")
+
+    resp = client.delete("/api/users/1")
+    assert resp.status_code == 202
+    job = resp.get_json()["job"]
+    assert (job["conversations"]["total"], job["messages"]["total"], job["documents"]["total"]) == (1, 4, 1)
+    assert client.get("/api/users/1").status_code == 404
+    assert client.get("/api/users/1/export").status_code == 404
+    assert client.delete("/api/users/1").status_code == 404
+
+    service.wait(job["id"], timeout=10)
+    assert client.get(f"/api/deletions/{job['id']}").get_json()["status"] == "done"
+    assert not os.listdir(tmp_path / "vectors")
+    with app.app_context():
+        assert (User.query.count(), Conversation.query.count(), Message.query.count(), Document.query.count()) == (0, 0, 0, 0)
+    assert client.get("/api/deletions/missing").status_code == 404
+
+
+def test_deletes_drop_prompt_state(app):
+    client = app.test_client()
+    deleted, owned = _conversation(client, 1), _conversation(client, 1)
+    states = get_prompt_states()
+    for conversation_id in (deleted, owned):
+        states.remember(conversation_id, ("doc",), np.ones(2), "context")
+
+    assert client.delete(f"/api/conversations/{deleted}").status_code == 200
+    assert states.reuse(deleted, ("doc",), np.ones(2)) is None
+    job = client.delete("/api/users/1").get_json()["job"]
+    deletion_service.get_deletion_service().wait(job["id"], timeout=10)
+    assert states.reuse(owned, ("doc",), np.ones(2)) is None
+
+
+def test_purge_command_finishes_interrupted_jobs(app):
+    client = app.test_client()
+    conversation_id = _conversation(client, 2)
+    with app.app_context():
+        # soft deleted, but the process stopped before the purge ran
+        job = deletion_service.get_deletion_service().delete_conversation(conversation_id)
+
+    result = app.test_cli_runner().invoke(args=["purge"])
+    assert result.exit_code == 0
+    assert f"{job['id']} done" in result.output
+    with app.app_context():
+        assert db.session.get(DeletionJob, job["id"]).messages_deleted == 4
+        assert Message.query.count() == 0
+    assert "no unfinished deletion jobs" in app.test_cli_runner().invoke(args=["purge"]).output
@@ -0,0 +1,82 @@
+import os
+
+import pytest
+from sqlalchemy import update
+
+from app import create_app, db
+from app.models import User
+from app.services.entity_cache import EntityCache, get_entity_cache
+from app.utils.shared_store import LocalSharedStore
+
+
+@pytest.fixture
+def app():
+    os.environ["LLM_PROVIDER"] = "stub"
+    app = create_app({'TESTING': True, 'SQLALCHEMY_DATABASE_URI': 'sqlite:///:memory:', 'ENTITY_CACHE_ENABLED': True})
+    with app.app_context():
+        db.create_all()
+        db.session.add_all([User(username="alice"), User(username="bob")])
+        db.session.commit()
+    return app
+
+
+def test_conversation_reads_hit_cache_and_see_new_messages(app):
+    client = app.test_client()
+    conv = client.post("/api/conversations", json={"user_id": 1, "message": "Hello"}).get_json()
+    first = client.get(f"/api/conversations/{conv['id']}").get_json()
+    assert client.get(f"/api/conversations/{conv['id']}").get_json() == first
+    with app.app_context():
+        stats = get_entity_cache().stats()['conversation']
+    assert stats['hits'] >= 1
+
+    client.post(f"/api/conversations/{conv['id']}/messages", json={"message": "Next"})
+    after = client.get(f"/api/conversations/{conv['id']}").get_json()
+    assert [m["content"] for m in after["messages"]] == ["Hello", "stub response", "Next", "stub response"]
+
+
+def test_user_lookups_invalidated_by_orm_and_bulk_writes(app):
+    client = app.test_client()
+    assert client.get("/api/users/1").get_json()["email"] is None
+    assert client.get("/api/users/2").get_json()["username"] == "bob"
+
+    with app.app_context():
+        db.session.get(User, 1).email = "alice@example.com"
+        db.session.commit()
+    assert client.get("/api/users/1").get_json()["email"] == "alice@example.com"
+
+    with app.app_context():
+        db.session.execute(update(User).where(User.id == 2).values(email="bob@example.com"))
+        db.session.commit()
+        # a statement without a pinned id invalidates every cached user
+        db.session.execute(update(User).where(User.username == "alice").values(email="a@example.com"))
+        db.session.commit()
+    assert client.get("/api/users/2").get_json()["email"] == "bob@example.com"
+    assert client.get("/api/users/1").get_json()["email"] == "a@example.com"
+
+    with app.app_context():
+        db.session.get(User, 1).email = "rolled@back"
+        db.session.rollback()
+        hits = get_entity_cache().stats()['user']['hits']
+    assert client.get("/api/users/1").get_json()["email"] == "a@example.com"
+    with app.app_context():
+        assert get_entity_cache().stats()['user']['hits'] == hits + 1
+
+
+def test_shared_tier_across_processes():
+    store = LocalSharedStore()
+    worker_a = EntityCache(store=store, shared=True)
+    worker_b = EntityCache(store=store, shared=True)
+    loads = []
+
+    def load():
+        loads.append(1)
+        return {'id': 'd1', 'status': 'ready'}
+
+    worker_a.get_or_load('document', 'd1', load)
+    assert worker_b.get_or_load('document', 'd1', load) == {'id': 'd1', 'status': 'ready'}
+    assert len(loads) == 1
+
+    worker_a.invalidate('document', 'd1')
+    worker_b.get_or_load('document', 'd1', load)
+    assert len(loads) == 2
+    assert worker_b.stats()['document'] == {'hits': 1, 'misses': 1, 'hit_ratio': 0.5}
@@ -0,0 +1,56 @@
+import gzip
+import json
+import os
+
+import pytest
+
+from app import create_app, db
+from app.models import User
+
+
+@pytest.fixture
+def client():
+    os.environ["LLM_PROVIDER"] = "stub"
+    app = create_app({'TESTING': True, 'SQLALCHEMY_DATABASE_URI': 'sqlite:///:memory:'})
+    with app.app_context():
+        db.create_all()
+        db.session.add_all([User(username="alice"), User(username="bob")])
+        db.session.commit()
+    with app.test_client() as client:
+        conversations = [
+            {"user_id": 1, "messages": [{"role": "user", "content": f"q{i}"}, {"role": "assistant", "content": f"a{i}"}]}
+            for i in range(3)
+        ] + [{"user_id": 1, "title": "empty"}, {"user_id": 2, "messages": [{"role": "user", "content": "other"}]}]
+        client.post("/api/conversations/import", json={"conversations": conversations})
+        yield client
+
+
+def _lines(body):
+    return [json.loads(line) for line in body.splitlines()]
+
+
+def test_export_streams_users_history(client):
+    resp = client.get("/api/users/1/export")
+    assert resp.mimetype == "application/x-ndjson"
+    lines = _lines(resp.get_data(as_text=True))
+    assert lines[0]["type"] == "user" and lines[0]["data"]["username"] == "alice"
+    assert [line["type"] for line in lines[1:-1]].count("conversation") == 4
+    assert [line["data"]["content"] for line in lines if line["type"] == "message"] == ["q0", "a0", "q1", "a1", "q2", "a2"]
+    assert lines[-1] == {"type": "end", "conversations": 4, "messages": 6}
+    assert client.get("/api/users/9/export").status_code == 404
+    assert client.get("/api/users/1/export?cursor=nope").status_code == 400
+
+
+def test_export_resumes_from_any_cursor(client):
+    full = _lines(client.get("/api/users/1/export").get_data(as_text=True))
+    body = [line for line in full if "cursor" in line]
+    for i, line in enumerate(body):
+        resumed = _lines(client.get(f"/api/users/1/export?cursor={line['cursor']}").get_data(as_text=True))
+        assert [l["data"] for l in resumed[:-1]] == [l["data"] for l in body[i + 1:]]
+
+
+def test_export_gzip(client):
+    resp = client.get("/api/users/1/export", headers={"Accept-Encoding": "gzip"})
+    assert resp.headers["Content-Encoding"] == "gzip"
+    lines = _lines(gzip.decompress(resp.get_data()).decode())
+    assert lines[-1]["type"] == "end"
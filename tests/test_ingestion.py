@@ -0,0 +1,164 @@
+import os
+
+import pytest
+
+from app import create_app, db
+from app.models import Document, User
+from app.routes import documents
+from app.services.ingestion_service import IngestionService, iter_file_words
+from app.services.retrieval_service import RetrievalService, VectorStore
+
+
+@pytest.fixture
+def app(tmp_path, monkeypatch):
+    os.environ["LLM_PROVIDER"] = "stub"
+    # a file, not :memory:, so the ingestion threads don't share the request's connection
+    app = create_app({'TESTING': True, 'SQLALCHEMY_DATABASE_URI': f"sqlite:///{tmp_path / 'app.db'}"})
+    retrieval = RetrievalService(store=VectorStore(root=str(tmp_path / "vectors")))
+    service = IngestionService(retrieval, processes=0)
+    monkeypatch.setattr(documents, "get_ingestion_service", lambda: service)
+    with app.app_context():
+        db.create_all()
+        db.session.add(User(username="alice"))
+        db.session.commit()
+    return app
+
+
+def _create(client, uri):
+    resp = client.post("/api/documents", json={"user_id": 1, "title": "notes", "uri": uri})
+    assert resp.status_code == 201
+    assert resp.get_json()["status"] == "pending"
+    doc_id = resp.get_json()["id"]
+    documents.get_ingestion_service().wait(doc_id, timeout=10)
+    return client.get(f"/api/documents/{doc_id}").get_json()
+
+
+def test_iter_file_words_handles_block_boundaries(tmp_path):
+    path = tmp_path / "words.txt"
+    path.write_text("héllo wörld  naïve\ncafé", encoding="utf-8")
+    assert list(iter_file_words(str(path), 3)) == ["héllo", "wörld", "naïve", "café"]
+
+
+def test_document_is_ingested_in_background(app, tmp_path):
+    path = tmp_path / "doc.txt"
+    path.write_text(" ".join(f"word{i}" for i in range(1000)))
+    doc = _create(app.test_client(), path.as_uri())
+    assert doc["status"] == "ready"
+    assert doc["progress"] == 1.0
+    assert doc["chunk_count"] > 1
+
+    hits = documents.get_ingestion_service().retrieval_service.retrieve("word500 word501 word502 word503 word504", [doc["id"]], top_k=1)
+    assert "word500" in hits[0]["text"].split()
+
+
+def test_reingest_unchanged_file_is_noop(app, tmp_path):
+    path = tmp_path / "doc.txt"
+    path.write_text("stable content " * 50)
+    client = app.test_client()
+    doc = _create(client, str(path))
+
+    client.post(f"/api/documents/{doc['id']}/ingest")
+    documents.get_ingestion_service().wait(doc["id"], timeout=10)
+    assert client.get(f"/api/documents/{doc['id']}").get_json()["indexed_at"] == doc["indexed_at"]
+
+    path.write_text("changed content " * 50)
+    client.post(f"/api/documents/{doc['id']}/ingest")
+    documents.get_ingestion_service().wait(doc["id"], timeout=10)
+    assert client.get(f"/api/documents/{doc['id']}").get_json()["indexed_at"] != doc["indexed_at"]
+
+
+def test_reingest_while_ingesting_runs_once_more(app, tmp_path, monkeypatch):
+    import threading
+    path = tmp_path / "doc.txt"
+    path.write_text("first version " * 50)
+    service = documents.get_ingestion_service()
+    started, release = threading.Event(), threading.Event()
+    index_file = service._index_file
+
+    def slow_index(doc, file_path):
+        indexed = index_file(doc, file_path)
+        started.set()
+        release.wait(10)
+        return indexed
+
+    monkeypatch.setattr(service, "_index_file", slow_index)
+    client = app.test_client()
+    doc_id = client.post("/api/documents", json={"user_id": 1, "title": "notes", "uri": str(path)}).get_json()["id"]
+    assert started.wait(10)
+    # changed after the first run read the file: the re-ingest must not be dropped
+    path.write_text("second version " * 50)
+    client.post(f"/api/documents/{doc_id}/ingest")
+    release.set()
+    service.wait(doc_id, timeout=10)
+    with app.app_context():
+        from app.services.ingestion_service import file_sha256
+        assert db.session.get(Document, doc_id).content_hash == file_sha256(str(path), 1024)
+
+
+def test_unreadable_uri_fails(app):
+    doc = _create(app.test_client(), "s3://bucket/stub.pdf")
+    assert doc["status"] == "failed"
+    assert "s3://bucket/stub.pdf" in doc["error"]
+
+
+def test_embedding_on_process_pool(app, tmp_path):
+    retrieval = RetrievalService(store=VectorStore(root=str(tmp_path / "pool-vectors")))
+    service = IngestionService(retrieval, processes=1)
+    path = tmp_path / "doc.txt"
+    path.write_text("process pool embedding " * 400)
+    with app.app_context():
+        db.session.add(Document(id="doc-pool", user_id=1, title="pool", uri=str(path)))
+        db.session.commit()
+    try:
+        assert service.submit(app, "doc-pool").result(timeout=60) == "ready"
+    finally:
+        service.shutdown()
+    assert retrieval.is_indexed("doc-pool")
+
+
+def test_upgrade_schema_adds_new_document_columns(tmp_path):
+    import sqlite3
+    db_path = tmp_path / "old.db"
+    conn = sqlite3.connect(db_path)
+    conn.execute("CREATE TABLE document (id VARCHAR(36) PRIMARY KEY, user_id INTEGER NOT NULL, "
+                 "title VARCHAR(255) NOT NULL, uri VARCHAR(512), created_at DATETIME)")
+    conn.execute("INSERT INTO document (id, user_id, title) VALUES ('old', 1, 'legacy')")
+    conn.commit()
+    conn.close()
+
+    app = create_app({'TESTING': True, 'SQLALCHEMY_DATABASE_URI': f'sqlite:///{db_path}'})
+    result = app.test_cli_runner().invoke(args=['migrate'])
+    assert "added document.status" in result.output
+    with app.app_context():
+        doc = db.session.get(Document, 'old')
+        assert doc.status == 'pending'
+        assert doc.chunk_count == 0
+
+
+def test_upgrade_schema_creates_missing_indexes(tmp_path):
+    import sqlite3
+    db_path = tmp_path / "old.db"
+    conn = sqlite3.connect(db_path)
+    conn.execute("CREATE TABLE message (id INTEGER PRIMARY KEY, conversation_id VARCHAR(36) NOT NULL, "
+                 "role VARCHAR(20) NOT NULL, content TEXT NOT NULL, created_at DATETIME, "
+                 "tokens_used INTEGER, meta TEXT)")
+    conn.commit()
+    conn.close()
+
+    app = create_app({'TESTING': True, 'SQLALCHEMY_DATABASE_URI': f'sqlite:///{db_path}'})
+    app.test_cli_runner().invoke(args=['migrate'])
+    conn = sqlite3.connect(db_path)
+    names = {row[1] for row in conn.execute("PRAGMA index_list(message)")}
+    conn.close()
+    assert "ix_message_conversation_created" in names
+
+
+def test_list_documents_paged(app):
+    client = app.test_client()
+    for i in range(3):
+        client.post("/api/documents", json={"user_id": 1, "title": f"d{i}"})
+    first = client.get("/api/users/1/documents?limit=2&fields=id,title").get_json()
+    assert [set(d) for d in first["items"]] == [{"id", "title"}] * 2
+    second = client.get(f"/api/users/1/documents?limit=2&cursor={first['next_cursor']}").get_json()
+    assert len(second["items"]) == 1 and second["next_cursor"] is None
+    assert sorted(d["title"] for d in first["items"] + second["items"]) == ["d0", "d1", "d2"]
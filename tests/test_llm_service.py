@@ -1,5 +1,6 @@
 from app.services.llm_service import LLMService
 import os
+import time
 
 def test_stub_response(monkeypatch):
     os.environ["LLM_PROVIDER"] = "stub"
@@ -8,3 +9,75 @@ def test_stub_response(monkeypatch):
     text, tokens = svc.get_response([{"role":"user","content":"hi"}])
     assert text == "stub response"
     assert tokens == 0
+
+def test_stub_stream_response():
+    svc = LLMService()
+    svc.provider = "stub"
+    chunks = list(svc.stream_response([{"role":"user","content":"hi"}]))
+    assert "".join(c["delta"] for c in chunks if "delta" in c) == "stub response"
+    assert chunks[-1] == {"tokens_used": 0}
+
+def test_stub_latency_and_tokens(monkeypatch):
+    svc = LLMService()
+    svc.provider = "stub"
+    monkeypatch.setattr(svc.config, "STUB_LATENCY_MS", 30)
+    monkeypatch.setattr(svc.config, "STUB_TOKENS", 5)
+    started = time.monotonic()
+    text, tokens = svc.get_response([{"role":"user","content":"hi"}])
+    assert time.monotonic() - started >= 0.03
+    assert text == "stub response token token token"
+    assert tokens == 5
+    chunks = list(svc.stream_response([{"role":"user","content":"hi"}]))
+    assert "".join(c["delta"] for c in chunks if "delta" in c) == text
+    assert chunks[-1] == {"tokens_used": 5}
+
+def test_huggingface_batch_parses_generations(monkeypatch):
+    svc = LLMService()
+    svc.provider = "huggingface"
+    monkeypatch.setattr(svc.config, "HUGGINGFACE_API_KEY", "test-key")
+    sent = {}
+
+    class FakeResponse:
+        def raise_for_status(self):
+            pass
+
+        def json(self):
+            return [[{"generated_text": " first "}], {"generated_text": "second"}]
+
+    class FakeTransport:
+        def post(self, url, headers=None, json=None):
+            sent.update(json)
+            return FakeResponse()
+
+    monkeypatch.setattr("app.services.llm_service.get_transport", lambda provider: FakeTransport())
+    items = [([{"role": "user", "content": "one"}], "open_chat", None),
+             ([{"role": "user", "content": "two"}], "open_chat", None)]
+    results = svc._get_huggingface_batch(items)
+    assert len(sent["inputs"]) == 2 and sent["inputs"][0].endswith("user: one\nassistant:")
+    assert [r[0] for r in results] == ["first", "second"]
+    assert all(r[1] > 0 for r in results)
+
+def test_gemini_request_and_reply(monkeypatch):
+    svc = LLMService()
+    svc.provider = "gemini"
+    monkeypatch.setattr(svc.config, "GEMINI_API_KEY", "test-key")
+    sent = {}
+
+    class FakeResponse:
+        def raise_for_status(self):
+            pass
+
+        def json(self):
+            return {"candidates": [{"content": {"parts": [{"text": "hello "}, {"text": "there"}]}}],
+                    "usageMetadata": {"totalTokenCount": 12}}
+
+    class FakeTransport:
+        def post(self, url, headers=None, json=None):
+            sent.update(json)
+            return FakeResponse()
+
+    monkeypatch.setattr("app.services.llm_service.get_transport", lambda provider: FakeTransport())
+    history = [{"role": "user", "content": "hi"}, {"role": "assistant", "content": "yo"}, {"role": "user", "content": "again"}]
+    assert svc.get_response(history) == ("hello there", 12)
+    assert [c["role"] for c in sent["contents"]] == ["user", "model", "user"]
+    assert "helpful" in sent["systemInstruction"]["parts"][0]["text"]
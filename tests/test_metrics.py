@@ -0,0 +1,69 @@
+import json
+import logging
+import os
+
+import pytest
+
+from app import create_app, db
+from app.config import Config
+from app.models import User
+
+
+def _app(**config):
+    os.environ["LLM_PROVIDER"] = "stub"
+    app = create_app({'TESTING': True, 'SQLALCHEMY_DATABASE_URI': 'sqlite:///:memory:', **config})
+    with app.app_context():
+        db.create_all()
+        db.session.add(User(username="alice"))
+        db.session.commit()
+    return app
+
+
+@pytest.fixture
+def client():
+    with _app(REQUEST_TIMING_LOG=True).test_client() as client:
+        yield client
+
+
+def test_metrics_endpoint_exposes_request_db_and_llm_metrics(client):
+    resp = client.post("/api/conversations", json={"user_id": 1, "message": "Hello"})
+    assert resp.status_code == 201
+    timing = resp.headers["Server-Timing"]
+    assert "db;dur=" in timing and "llm;dur=" in timing and "persist;dur=" in timing
+    assert resp.headers["X-Request-ID"]
+
+    body = client.get("/metrics").get_data(as_text=True)
+    assert "# TYPE http_request_seconds histogram" in body
+    assert 'http_request_seconds_count{method="POST",endpoint="conversations.create_conversation",status="201"}' in body
+    assert 'db_query_seconds_count{statement="INSERT"}' in body
+    assert 'llm_completion_seconds_count{provider="stub",model="stub",mode="open_chat"}' in body
+    assert 'request_phase_seconds_count{phase="load_conversation"}' in body
+
+
+def test_structured_timing_log(client, caplog):
+    with caplog.at_level(logging.INFO, logger="app.timing"):
+        client.get("/api/users/1", headers={"X-Request-ID": "req-42"})
+    line = json.loads(caplog.records[-1].getMessage())
+    assert line["request_id"] == "req-42"
+    assert line["endpoint"] == "users.get_user"
+    assert line["status"] == 200
+    assert line["db_queries"] >= 1
+
+
+def test_profiler_is_switchable_per_request(monkeypatch):
+    monkeypatch.setattr(Config, "STUB_LATENCY_MS", 60)
+    client = _app(PROFILER_ALLOWED=True, PROFILER_INTERVAL_MS=2, PROFILER_TOKEN="s3cret").test_client()
+    resp = client.post("/api/conversations", json={"user_id": 1, "message": "Hello"}, headers={"X-Profile": "1"})
+    profile_id = resp.headers["X-Profile-ID"]
+    stacks = client.get(f"/metrics/profiles/{profile_id}").get_data(as_text=True)
+    assert "_provider_response" in stacks
+
+    assert "X-Profile-ID" not in client.get("/api/users/1").headers
+    assert client.put("/metrics/profiler", json={"sample_rate": 1}).status_code == 403
+    assert client.put("/metrics/profiler", json={"sample_rate": 1},
+                      headers={"X-Profiler-Token": "wrong"}).status_code == 403
+    assert client.put("/metrics/profiler", json={"sample_rate": 1},
+                      headers={"X-Profiler-Token": "s3cret"}).get_json()["sample_rate"] == 1
+    assert "X-Profile-ID" in client.get("/api/users/1").headers
+
+    assert _app().test_client().put("/metrics/profiler", json={"sample_rate": 1}).status_code == 403
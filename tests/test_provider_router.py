@@ -0,0 +1,79 @@
+import pytest
+
+from app.services.llm_service import LLMService
+from app.services.provider_router import (ProviderRegistry, ProviderRouter, StubProvider, hedges_total,
+                                          routed_total)
+
+HISTORY = [{"role": "user", "content": "hi"}]
+
+
+def _router(providers, **kwargs):
+    registry = ProviderRegistry()
+    for name, stub in providers.items():
+        registry.register(name, stub)
+    return ProviderRouter(registry, list(providers), **kwargs)
+
+
+def test_prefers_fastest_once_measured():
+    router = _router({"slow": StubProvider("slow", latency_ms=30), "fast": StubProvider("fast", latency_ms=1)},
+                     hedge=False, min_samples=2)
+    for _ in range(4):
+        router.call(HISTORY)
+    assert router.ranked() == ["fast", "slow"]
+    assert router.call(HISTORY)[0] == "stub response from fast"
+
+
+def test_fails_over_and_demotes_unhealthy_provider():
+    router = _router({"broken": StubProvider("broken", error_rate=1.0), "ok": StubProvider("ok")},
+                     hedge=False, min_samples=2)
+    before = routed_total.value(provider="ok", outcome="failover")
+    for _ in range(3):
+        assert router.call(HISTORY)[0] == "stub response from ok"
+    assert routed_total.value(provider="ok", outcome="failover") - before >= 2
+    assert router.ranked()[0] == "ok"
+
+
+def test_all_failing_raises():
+    router = _router({"a": StubProvider("a", error_rate=1.0), "b": StubProvider("b", error_rate=1.0)})
+    with pytest.raises(Exception, match="All providers failed"):
+        router.call(HISTORY)
+
+
+def test_hedges_after_p95():
+    spiky = StubProvider("spiky", latency_ms=5)
+    router = _router({"spiky": spiky, "backup": StubProvider("backup", latency_ms=20)}, min_samples=3)
+    for _ in range(6):
+        router.call(HISTORY)
+    assert router.ranked() == ["spiky", "backup"]
+    # now the primary stalls far beyond its p95
+    spiky.latency_ms = 500
+    before = hedges_total.value(provider="backup")
+    assert router.call(HISTORY)[0] == "stub response from backup"
+    assert hedges_total.value(provider="backup") - before == 1
+
+
+def test_stats_are_kept_per_model():
+    models = {"a": "small"}
+    registry = ProviderRegistry()
+    registry.register("a", StubProvider("a", latency_ms=20), model=lambda: models["a"])
+    registry.register("b", StubProvider("b", latency_ms=5))
+    router = ProviderRouter(registry, ["a", "b"], hedge=False, min_samples=2)
+    for _ in range(4):
+        router.call(HISTORY)
+    assert router.ranked() == ["b", "a"]
+    assert len(router.stats[("a", "small")]) >= 2
+    # a new model on the same provider is unmeasured again and goes first
+    models["a"] = "large"
+    assert router.ranked() == ["a", "b"]
+    assert len(router.stats[("a", "large")]) == 0
+
+
+def test_llm_service_uses_router_when_configured(monkeypatch):
+    from app.config import Config
+    from app.services import provider_router
+    monkeypatch.setattr(Config, "LLM_ROUTER_PROVIDERS", "stub:one")
+    monkeypatch.setattr(Config, "STUB_PROVIDERS", '{"one": {"reply": "routed"}}')
+    monkeypatch.setattr(provider_router, "_router", None)
+    svc = LLMService()
+    assert svc.provider == "router"
+    assert svc.get_response(HISTORY) == ("routed", 0)
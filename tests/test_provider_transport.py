@@ -0,0 +1,126 @@
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+import requests
+
+from app.services.provider_transport import CircuitOpenError, ProviderTransport, parse_retry_after
+
+
+class FakeProvider(BaseHTTPRequestHandler):
+    """Replies with the scripted (status, headers, delay) entries in order, then 200s"""
+    protocol_version = "HTTP/1.1"
+    script = []
+    calls = 0
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length", 0))
+        self.rfile.read(length)
+        type(self).calls += 1
+        status, headers, delay = self.script.pop(0) if self.script else (200, {}, 0)
+        if delay:
+            time.sleep(delay)
+        body = json.dumps({"ok": status == 200}).encode()
+        self.send_response(status)
+        for key, value in headers.items():
+            self.send_header(key, value)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def fake_server():
+    FakeProvider.script = []
+    FakeProvider.calls = 0
+    server = ThreadingHTTPServer(("127.0.0.1", 0), FakeProvider)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{server.server_address[1]}/v1/chat"
+    server.shutdown()
+
+
+def _transport(name, **kwargs):
+    options = dict(max_retries=3, backoff_base=0.01, backoff_max=0.05, read_timeout=2)
+    options.update(kwargs)
+    return ProviderTransport(name, **options)
+
+
+def test_keep_alive_reuses_pooled_connection(fake_server):
+    transport = _transport("fake-pool")
+    for _ in range(3):
+        assert transport.post(fake_server, json={}).status_code == 200
+    stats = transport.stats()
+    assert stats["pool_new"] == 1
+    assert stats["pool_reused"] == 2
+
+
+def test_retries_5xx_and_honours_retry_after(fake_server):
+    FakeProvider.script = [(503, {}, 0), (429, {"Retry-After": "0.2"}, 0)]
+    transport = _transport("fake-retry")
+    start = time.monotonic()
+    response = transport.post(fake_server, json={})
+    assert response.status_code == 200
+    assert FakeProvider.calls == 3
+    assert time.monotonic() - start >= 0.2
+    assert transport.stats()["retries"] == 2
+
+
+def test_retry_after_beyond_limit_is_not_waited_for(fake_server):
+    FakeProvider.script = [(429, {"Retry-After": "120"}, 0)]
+    transport = _transport("fake-too-long", retry_after_max=5)
+    assert transport.post(fake_server, json={}).status_code == 429
+    assert FakeProvider.calls == 1
+
+
+def test_read_timeout_is_enforced(fake_server):
+    FakeProvider.script = [(200, {}, 0.5)]
+    transport = _transport("fake-timeout", read_timeout=0.1, max_retries=0)
+    with pytest.raises(requests.Timeout):
+        transport.post(fake_server, json={})
+
+
+def test_circuit_opens_after_failures_and_recovers(fake_server):
+    FakeProvider.script = [(500, {}, 0)] * 2
+    transport = _transport("fake-circuit", max_retries=0, failure_threshold=2, reset_timeout=0.2)
+    assert transport.post(fake_server, json={}).status_code == 500
+    assert transport.post(fake_server, json={}).status_code == 500
+    with pytest.raises(CircuitOpenError):
+        transport.post(fake_server, json={})
+    assert FakeProvider.calls == 2
+
+    # after the reset timeout a probe goes through and closes the circuit again
+    time.sleep(0.25)
+    assert transport.post(fake_server, json={}).status_code == 200
+    assert transport.breaker.state == "closed"
+
+
+def test_unexpected_error_in_probe_counts_and_releases_it(fake_server, monkeypatch):
+    FakeProvider.script = [(500, {}, 0)]
+    transport = _transport("fake-probe", max_retries=0, failure_threshold=1, reset_timeout=0.1)
+    assert transport.post(fake_server, json={}).status_code == 500
+    assert transport.breaker.state == "open"
+
+    time.sleep(0.15)
+    monkeypatch.setattr(transport.session, "post", lambda *a, **k: (_ for _ in ()).throw(ValueError("bad payload")))
+    with pytest.raises(ValueError):
+        transport.post(fake_server, json={})
+    # the failed probe reopened the circuit instead of leaving it half open for good
+    assert transport.breaker.state == "open"
+    monkeypatch.undo()
+
+    time.sleep(0.15)
+    assert transport.post(fake_server, json={}).status_code == 200
+    assert transport.breaker.state == "closed"
+
+
+def test_parse_retry_after():
+    assert parse_retry_after("3") == 3.0
+    assert parse_retry_after(None) is None
+    assert parse_retry_after("Wed, 21 Oct 2015 07:28:00 GMT") == 0.0
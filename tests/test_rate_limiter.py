@@ -0,0 +1,93 @@
+import os
+
+import pytest
+
+from app import create_app, db
+from app.models import User
+from app.routes import conversations
+from app.services.rate_limiter import (MemoryRateBackend, RateLimiter, RateLimitExceeded, RateLimits,
+                                       SharedRateBackend)
+from app.utils.shared_store import LocalSharedStore
+
+
+def test_user_request_bucket_refuses_burst_then_refills():
+    limiter = RateLimiter(MemoryRateBackend(), RateLimits(user_requests_rate=20, user_requests_burst=2))
+    limiter.admit(1).release()
+    limiter.admit(1).release()
+    with pytest.raises(RateLimitExceeded) as exc:
+        limiter.admit(1)
+    assert exc.value.scope == "user_requests"
+    assert 0 < exc.value.retry_after <= 0.05
+    limiter.admit(2).release()  # other users have their own bucket
+    with pytest.raises(RateLimitExceeded):
+        limiter.admit("1")  # the same user whatever type the id arrived as
+
+
+def test_token_debt_blocks_until_refilled():
+    limiter = RateLimiter(MemoryRateBackend(), RateLimits(user_tokens_rate=100, user_tokens_burst=100))
+    with limiter.admit(1) as permit:
+        permit.charge(300)
+    with pytest.raises(RateLimitExceeded) as exc:
+        limiter.admit(1)
+    assert exc.value.scope == "user_tokens"
+    assert exc.value.retry_after == pytest.approx(2.0, abs=0.1)
+
+
+def test_concurrency_slots_are_released():
+    limiter = RateLimiter(MemoryRateBackend(), RateLimits(user_max_concurrent=1))
+    permit = limiter.admit(1)
+    with pytest.raises(RateLimitExceeded):
+        limiter.admit(1)
+    permit.release()
+    permit.release()  # idempotent
+    limiter.admit(1).release()
+
+
+def test_shared_backend_window_and_concurrency():
+    backend = SharedRateBackend(LocalSharedStore())
+    limits = RateLimits(global_requests_rate=1, global_requests_burst=3, user_max_concurrent=1)
+    first, second = RateLimiter(backend, limits), RateLimiter(backend, limits)
+    held = first.admit(1)
+    with pytest.raises(RateLimitExceeded):
+        second.admit(1)
+    held.release()
+    admitted = 1
+    while admitted < 3:
+        second.admit(2).release()
+        admitted += 1
+    with pytest.raises(RateLimitExceeded) as exc:
+        first.admit(3)
+    assert exc.value.scope == "global_requests"
+
+
+@pytest.fixture
+def client(monkeypatch):
+    os.environ["LLM_PROVIDER"] = "stub"
+    app = create_app({'TESTING': True, 'SQLALCHEMY_DATABASE_URI': 'sqlite:///:memory:'})
+    monkeypatch.setattr(conversations.get_conversation_service(), "rate_limiter",
+                        RateLimiter(MemoryRateBackend(), RateLimits(user_requests_rate=0.01, user_requests_burst=1)))
+    with app.app_context():
+        db.create_all()
+        db.session.add(User(username="alice"))
+        db.session.commit()
+    with app.test_client() as client:
+        yield client
+
+
+def test_over_quota_turn_gets_429_with_retry_after(client):
+    conv = client.post("/api/conversations", json={"user_id": 1, "message": "Hello"})
+    assert conv.status_code == 201
+    resp = client.post(f"/api/conversations/{conv.get_json()['id']}/messages", json={"message": "again"})
+    assert resp.status_code == 429
+    assert int(resp.headers["Retry-After"]) >= 1
+    assert resp.get_json()["scope"] == "user_requests"
+    # nothing was persisted for the refused turn
+    assert len(client.get(f"/api/conversations/{conv.get_json()['id']}").get_json()["messages"]) == 2
+
+
+def test_refused_turn_skips_the_read_phase(client, monkeypatch):
+    conv = client.post("/api/conversations", json={"user_id": "1", "message": "Hello"}).get_json()
+    service = conversations.get_conversation_service()
+    monkeypatch.setattr(service, "prepare_turn", lambda *args: pytest.fail("read phase ran for a refused turn"))
+    resp = client.post(f"/api/conversations/{conv['id']}/messages", json={"message": "again"})
+    assert resp.status_code == 429
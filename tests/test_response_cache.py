@@ -0,0 +1,65 @@
+import time
+
+from app.services.llm_service import LLMService
+from app.services.response_cache import (MemoryCacheBackend, ResponseCache, SemanticIndex,
+                                         SharedCacheBackend, cache_key, lookups_total, saved_tokens_total)
+from app.utils.shared_store import LocalSharedStore
+
+
+class CountingLLM(LLMService):
+    def __init__(self, cache):
+        super().__init__(response_cache=cache)
+        self.provider = "stub"
+        self.calls = 0
+
+    def _provider_response(self, conversation_history, mode, context):
+        self.calls += 1
+        return f"reply {self.calls}", 10
+
+
+def test_cache_key_normalizes_whitespace():
+    a = cache_key("groq", "m", [{"role": "user", "content": "hello   world\n"}], 0.7)
+    b = cache_key("groq", "m", [{"role": "user", "content": " hello world"}], 0.7)
+    assert a == b
+    assert a != cache_key("groq", "m", [{"role": "user", "content": "hello world"}], 0.2)
+
+
+def test_memory_backend_lru_and_ttl():
+    backend = MemoryCacheBackend(max_entries=2, ttl=0.05)
+    cache = ResponseCache(backend)
+    for q in ("a", "b", "c"):
+        cache.put("stub", "stub", [{"role": "user", "content": q}], 0.7, q, 1)
+    assert len(backend) == 2
+    assert cache.get("open_chat", "stub", "stub", [{"role": "user", "content": "a"}], 0.7) is None
+    time.sleep(0.06)
+    assert cache.get("open_chat", "stub", "stub", [{"role": "user", "content": "c"}], 0.7) is None
+
+
+def test_llm_service_serves_repeat_prompts_from_cache():
+    llm = CountingLLM(ResponseCache(SharedCacheBackend(LocalSharedStore())))
+    before = saved_tokens_total.value(mode="rag")
+    history = [{"role": "user", "content": "what is python?"}]
+    assert llm.get_response(history, "rag", "ctx") == ("reply 1", 10)
+    assert llm.get_response(history, "rag", "ctx") == ("reply 1", 10)
+    assert llm.get_response(history, "rag", "other ctx") == ("reply 2", 10)
+    assert llm.calls == 2
+    assert saved_tokens_total.value(mode="rag") - before == 10
+
+
+def test_stream_miss_populates_cache():
+    cache = ResponseCache()
+    llm = LLMService(response_cache=cache)
+    llm.provider = "stub"
+    history = [{"role": "user", "content": "hi"}]
+    assert "".join(c.get("delta", "") for c in llm.stream_response(history)) == "stub response"
+    hits = lookups_total.value(mode="open_chat", result="hit")
+    assert list(llm.stream_response(history)) == [{"delta": "stub response"}, {"tokens_used": 0}]
+    assert lookups_total.value(mode="open_chat", result="hit") == hits + 1
+
+
+def test_semantic_tier_serves_near_duplicates_only_under_same_prompt():
+    llm = CountingLLM(ResponseCache(semantic=SemanticIndex(threshold=0.8)))
+    llm.get_response([{"role": "user", "content": "how do I read a file in python"}], "rag", "ctx")
+    assert llm.get_response([{"role": "user", "content": "how do I read a file in python?"}], "rag", "ctx")[0] == "reply 1"
+    assert llm.get_response([{"role": "user", "content": "how do I read a file in python"}], "rag", "new ctx")[0] == "reply 2"
+    assert llm.get_response([{"role": "user", "content": "tell me about databases"}], "rag", "ctx")[0] == "reply 3"
@@ -0,0 +1,137 @@
+import os
+
+import numpy as np
+import pytest
+
+from app import create_app, db
+from app.models import Document, User
+from app.routes import conversations
+from app.services.conversation_service import ConversationService
+from app.services.llm_service import system_prompt
+from app.services.prompt_state import PromptStates
+from app.services.retrieval_service import RetrievalService, VectorStore, chunk_words, get_embedder
+
+PYTHON_DOC = "Python is a programming language. Generators yield values lazily and list comprehensions build lists."
+DB_DOC = "PostgreSQL is a relational database. Indexes speed up queries and vacuum reclaims dead tuples."
+
+
+@pytest.fixture
+def retrieval(tmp_path):
+    return RetrievalService(store=VectorStore(root=str(tmp_path / "vectors")))
+
+
+def test_chunk_words_overlaps_and_keeps_tail():
+    words = [str(i) for i in range(10)]
+    assert list(chunk_words(words, 4, 1)) == ["0 1 2 3", "3 4 5 6", "6 7 8 9"]
+    assert list(chunk_words(words[:5], 4, 1)) == ["0 1 2 3", "3 4"]
+
+
+def test_embeddings_are_normalised_and_deterministic():
+    embedder = get_embedder("hashing", 64)
+    vectors = embedder.embed(["vector search", "vector search", ""])
+    assert vectors.shape == (3, 64)
+    assert np.allclose(vectors[0], vectors[1])
+    assert np.isclose(np.linalg.norm(vectors[0]), 1.0)
+    assert not vectors[2].any()
+
+
+def test_retrieve_is_restricted_to_document_ids(retrieval):
+    retrieval.index_text("py", PYTHON_DOC)
+    retrieval.index_text("db", DB_DOC)
+
+    hits = retrieval.retrieve("how do database indexes work", ["py", "db"], top_k=1)
+    assert hits[0]["document_id"] == "db"
+
+    hits = retrieval.retrieve("how do database indexes work", ["py"], top_k=3)
+    assert {hit["document_id"] for hit in hits} == {"py"}
+    assert retrieval.retrieve("anything", ["unknown"]) == []
+
+
+def test_batched_search_over_many_chunks(retrieval):
+    rng = np.random.default_rng(0)
+    matrix = rng.standard_normal((5000, retrieval.store.dim)).astype(np.float32)
+    retrieval.store.write("big", matrix, [f"chunk {i}" for i in range(5000)])
+    queries = matrix[[10, 4200]]
+    results = retrieval.store.search(queries, ["big"], top_k=3)
+    assert [r[0]["chunk_index"] for r in results] == [10, 4200]
+
+
+def test_reindex_publishes_vectors_and_texts_together(retrieval):
+    retrieval.index_text("doc", " ".join(f"w{i}" for i in range(1000)))
+    first = retrieval.store.index("doc")
+    retrieval.index_text("doc", "short replacement text")
+    current = retrieval.store.index("doc")
+    assert current.generation != first.generation
+    assert len(current.matrix) == len(current.texts) == 1
+    assert current.texts[0] == "short replacement text"
+    # readers holding the previous generation still see a consistent pair
+    assert len(first.matrix) == len(first.texts) > 1
+
+
+def test_reader_racing_a_reindex_opens_the_new_generation(retrieval, monkeypatch):
+    store = retrieval.store
+    retrieval.index_text("doc", "first version of the text")
+    stale = store.read_manifest("doc")
+    retrieval.index_text("doc", "second version of the text")
+    # the reader read the manifest just before the commit removed that generation
+    manifests = [stale]
+    read_manifest = store.read_manifest
+    monkeypatch.setattr(store, "read_manifest", lambda document_id: manifests.pop() if manifests else read_manifest(document_id))
+    index = store.index("doc")
+    assert index.generation != stale["generation"]
+    assert index.texts[0] == "second version of the text"
+
+
+def test_unindexed_documents_fall_back_without_indexing(retrieval):
+    assert retrieval.build_context("anything", ["not-ingested"]) is None
+    assert not retrieval.is_indexed("not-ingested")
+
+
+def test_rag_conversation_uses_document_content(tmp_path, monkeypatch):
+    os.environ["LLM_PROVIDER"] = "stub"
+    app = create_app({'TESTING': True, 'SQLALCHEMY_DATABASE_URI': 'sqlite:///:memory:'})
+    service = conversations.get_conversation_service()
+    monkeypatch.setattr(service, "retrieval_service", RetrievalService(store=VectorStore(root=str(tmp_path / "vectors"))))
+    seen = {}
+
+    def fake_response(history, mode="open_chat", context=None):
+        seen["context"] = context
+        return "ok", 1
+    monkeypatch.setattr(service.llm_service, "get_response", fake_response)
+
+    doc_path = tmp_path / "db.txt"
+    doc_path.write_text(DB_DOC)
+    service.retrieval_service.index_text("doc-1", DB_DOC)
+    with app.app_context():
+        db.create_all()
+        db.session.add(User(username="alice"))
+        db.session.add(Document(id="doc-1", user_id=1, title="DB notes", uri=doc_path.as_uri()))
+        db.session.commit()
+
+    client = app.test_client()
+    resp = client.post("/api/conversations", json={
+        "user_id": 1, "message": "what does vacuum do", "mode": "rag", "document_ids": ["doc-1"]})
+    assert resp.status_code == 201
+    assert "vacuum reclaims dead tuples" in seen["context"]
+
+
+def test_follow_up_questions_reuse_retrieved_context(retrieval):
+    service = ConversationService()
+    service.retrieval_service = retrieval
+    service.prompt_states = PromptStates()
+    retrieval.index_text("db", DB_DOC)
+    searches = []
+    search = retrieval.store.search
+    retrieval.store.search = lambda *args: searches.append(1) or search(*args)
+
+    first = service._rag_context("conv", "how do database indexes speed up queries", ["db"])
+    assert service._rag_context("conv", "why do database indexes speed up queries", ["db"]) is first
+    assert len(searches) == 1
+    # an unrelated question retrieves again, so does re-ingestion of a document
+    service._rag_context("conv", "what is vacuum", ["db"])
+    assert len(searches) == 2
+    retrieval.index_text("db", DB_DOC + " Vacuum also updates statistics.")
+    service._rag_context("conv", "what is vacuum", ["db"])
+    assert len(searches) == 3
+    # the system prompt for a reused context is built once
+    assert system_prompt("rag", first) is system_prompt("rag", first)
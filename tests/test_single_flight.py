@@ -0,0 +1,96 @@
+import asyncio
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from app.services.async_llm_service import AsyncLLMService
+from app.services.llm_service import LLMService
+from app.services.single_flight import SharedSingleFlight, SingleFlight, coalesced_total
+from app.utils.shared_store import LocalSharedStore
+
+
+class SlowLLM(LLMService):
+    def __init__(self, flight):
+        super().__init__(single_flight=flight)
+        self.provider = "stub"
+        self.calls = 0
+        self._lock = threading.Lock()
+
+    def _provider_response(self, conversation_history, mode, context):
+        with self._lock:
+            self.calls += 1
+        time.sleep(0.2)
+        return "shared reply", 7
+
+
+def test_concurrent_identical_prompts_share_one_call():
+    llm = SlowLLM(SingleFlight())
+    before = coalesced_total.value(mode="open_chat", scope="thread")
+    history = [{"role": "user", "content": "popular question"}]
+    with ThreadPoolExecutor(8) as pool:
+        results = list(pool.map(lambda _: llm.get_response(history), range(8)))
+    # one upstream call is charged once
+    assert sorted(results) == [("shared reply", 0)] * 7 + [("shared reply", 7)]
+    assert llm.calls == 1
+    assert coalesced_total.value(mode="open_chat", scope="thread") - before == 7
+
+
+def test_leader_error_reaches_followers():
+    flight = SingleFlight()
+    started = threading.Event()
+
+    def boom():
+        started.set()
+        time.sleep(0.1)
+        raise RuntimeError("upstream down")
+
+    with ThreadPoolExecutor(2) as pool:
+        leader = pool.submit(flight.do, "k", boom)
+        started.wait()
+        follower = pool.submit(flight.do, "k", lambda: "never called")
+        for future in (leader, follower):
+            with pytest.raises(RuntimeError):
+                future.result()
+
+
+def test_shared_flight_coalesces_across_instances():
+    # two SharedSingleFlight instances over one store stand in for two worker processes
+    store = LocalSharedStore()
+    first, second = SharedSingleFlight(store, poll_interval=0.01), SharedSingleFlight(store, poll_interval=0.01)
+    calls = []
+
+    def call():
+        calls.append(1)
+        time.sleep(0.1)
+        return ["reply", 3]
+
+    with ThreadPoolExecutor(2) as pool:
+        a = pool.submit(first.do, "k", call)
+        time.sleep(0.02)
+        b = pool.submit(second.do, "k", call)
+        assert a.result() == (["reply", 3], False)
+        assert b.result() == (["reply", 3], True)
+    assert len(calls) == 1
+    # read by its only waiter, the published result is gone
+    assert store.get("llm-flight:k:result") is None
+
+
+def test_async_identical_prompts_share_one_call():
+    llm = AsyncLLMService(single_flight=SingleFlight())
+    calls = []
+
+    async def slow(conversation_history, mode, context):
+        calls.append(1)
+        await asyncio.sleep(0.05)
+        return "async reply", 2
+
+    llm._provider_response_async = slow
+    history = [{"role": "user", "content": "same"}]
+
+    async def run():
+        return await asyncio.gather(*(llm.get_response_async(history) for _ in range(5)))
+
+    assert sorted(asyncio.run(run())) == [("async reply", 0)] * 4 + [("async reply", 2)]
+    assert len(calls) == 1
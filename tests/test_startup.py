@@ -0,0 +1,42 @@
+import os
+
+from sqlalchemy import inspect
+
+from app import create_app, db
+from app.utils.lazy import process_singleton
+
+
+def test_create_app_leaves_schema_to_migrate(tmp_path):
+    app = create_app({'TESTING': True, 'SQLALCHEMY_DATABASE_URI': f"sqlite:///{tmp_path / 'app.db'}"})
+    with app.app_context():
+        assert inspect(db.engine).get_table_names() == []
+
+    runner = app.test_cli_runner()
+    runner.invoke(args=['migrate'])
+    with app.app_context():
+        assert {'user', 'conversation', 'message', 'document'} <= set(inspect(db.engine).get_table_names())
+    assert "schema is up to date" in runner.invoke(args=['migrate']).output
+
+
+def test_process_singleton_is_built_lazily_once_per_process():
+    built = []
+
+    @process_singleton
+    def get_thing():
+        built.append(os.getpid())
+        return object()
+
+    assert built == []
+    assert get_thing() is get_thing()
+    parent_thing = get_thing()
+
+    read_fd, write_fd = os.pipe()
+    pid = os.fork()
+    if pid == 0:
+        os.write(write_fd, b"fresh" if get_thing() is not parent_thing and built[-1] == os.getpid() else b"inherited")
+        os._exit(0)
+    os.close(write_fd)
+    os.waitpid(pid, 0)
+    with os.fdopen(read_fd) as f:
+        assert f.read() == "fresh"
+    assert len(built) == 1
@@ -0,0 +1,74 @@
+import os
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+import pytest
+
+from app import create_app, db
+from app.config import Config
+from app.models import Conversation, Message, User
+from app.services.turn_writer import GroupCommitWriter, TurnWrite, group_fallbacks_total, group_size
+
+
+@pytest.fixture
+def app(tmp_path):
+    os.environ["LLM_PROVIDER"] = "stub"
+    app = create_app({'TESTING': True, 'SQLALCHEMY_DATABASE_URI': f'sqlite:///{tmp_path / "turns.db"}'})
+    with app.app_context():
+        db.create_all()
+        db.session.add(User(username="alice"))
+        db.session.add(Conversation(id="c1", user_id=1, title="t"))
+        db.session.commit()
+    return app
+
+
+def _write(conversation_id, text):
+    return TurnWrite(conversation_id=conversation_id, user_message=text, user_created_at=datetime.utcnow(),
+                     assistant_reply=f"re: {text}", tokens_used=1)
+
+
+def test_group_commit_batches_concurrent_turns(app):
+    writer = GroupCommitWriter(app, max_batch=16, max_delay=0.05)
+    commits_before = group_size.labels().count
+    futures = [writer.submit(_write("c1", f"m{i}")) for i in range(10)]
+    results = [f.result(5) for f in futures]
+    assert [r["user_message"]["content"] for r in results] == [f"m{i}" for i in range(10)]
+    assert group_size.labels().count - commits_before < 10
+    with app.app_context():
+        assert Message.query.filter_by(conversation_id="c1").count() == 20
+
+
+def test_group_commit_isolates_failing_turn(app):
+    writer = GroupCommitWriter(app, max_batch=16, max_delay=0.05)
+    before = group_fallbacks_total.value()
+    good, bad = writer.submit(_write("c1", "ok")), writer.submit(_write("missing", "lost"))
+    assert good.result(5)["assistant_message"]["content"] == "re: ok"
+    with pytest.raises(ValueError):
+        bad.result(5)
+    assert group_fallbacks_total.value() - before == 1
+    with app.app_context():
+        assert Message.query.filter_by(conversation_id="missing").count() == 0
+
+
+def test_writer_thread_survives_an_error_outside_the_commit(app, monkeypatch):
+    writer = GroupCommitWriter(app, max_batch=16, max_delay=0.01, timeout=5)
+    monkeypatch.setattr(group_size, "observe", lambda value: (_ for _ in ()).throw(RuntimeError("metrics down")))
+    with pytest.raises(RuntimeError):
+        writer.write(_write("c1", "lost"))
+    monkeypatch.undo()
+    assert writer.write(_write("c1", "kept"))["user_message"]["content"] == "kept"
+    assert writer._thread.is_alive()
+
+
+def test_group_durability_mode_end_to_end(app, monkeypatch):
+    monkeypatch.setattr(Config, "DB_DURABILITY", "group")
+    client = app.test_client()
+    conv = client.post("/api/conversations", json={"user_id": 1, "message": "Hello"}).get_json()
+
+    def turn(i):
+        return client.post(f"/api/conversations/{conv['id']}/messages?view=delta", json={"message": f"q{i}"}).status_code
+
+    with ThreadPoolExecutor(4) as pool:
+        assert set(pool.map(turn, range(8))) == {200}
+    full = client.get(f"/api/conversations/{conv['id']}").get_json()
+    assert len(full["messages"]) == 18